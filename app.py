@@ -1,20 +1,48 @@
 import os
 from pathlib import Path
 import json
+import asyncio
+import tempfile
 
 from dotenv import load_dotenv
-from fastapi import FastAPI, UploadFile, File, HTTPException, Request
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, BackgroundTasks, Depends
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
 from loguru import logger
 
-from services.tfidf_index import build_index as build_tfidf_index, search as tfidf_search
-from services.db import init_db, get_db
+from services.tfidf_index import (build_index as build_tfidf_index, search as tfidf_search,
+                                  search_many as tfidf_search_many, update_index as update_tfidf_index)
+from services.db import get_db, HISTORY_PROJECTION, CHAT_PROJECTION, USER_PROJECTION, FACTS_PROJECTION
 from services.parse_pdf import extract_text_from_pdf
-from services.clauses import split_into_clauses
-from services.severity import analyze_clauses, score_clause
-from services.llm_explainer import explain_with_llm
+from services.parse_docx import extract_text_from_docx
+from services.clauses import clauses_from_pages
+from services.facts import extract_facts, parse_filters as parse_fact_filters
+from services.severity import analyze_clauses, score_clause, RULES_VERSION
+from services.llm_explainer import (explain_with_llm_usage_async, stream_with_llm_async, close_llm_client,
+                                    run_breaker_probe, breaker as llm_breaker, NO_MATCH_ANSWER)
+from services.batch_explainer import (precompute_explanations, stored_explanation, select_risky,
+                                      ANALYZE_PRECOMPUTE_EXPLANATIONS)
+from services.metrics import timed, observe, start_request_timer, render_prometheus
+from services.profiling import begin_request, profiled, is_admin, list_profiles, profile_path, PROFILE_HEADER
+from services.write_behind import write_buffer
+from services.warmup import warmup
+from services.admission import admit, snapshot as admission_snapshot
+from services.singleflight import flights, normalize_query
+from services.bulk import (read_uploads, expand_uploads, summarize_document, aggregate, BulkInputError,
+                           BULK_CONCURRENCY)
+from services.lifecycle import lifecycle, record_artifacts, read_manifest, expires_at
+from services.storage import (job_dir as get_job_dir, job_lock, atomic_write_bytes, atomic_write_text,
+                              atomic_write_json)
+from services.canonical_qa import QUESTIONS as CANONICAL_QUESTIONS, TOP_K as CANONICAL_TOP_K, save_answers, stored_matches
+from services.revisions import (link_previous, record_owner, job_owner, previous_job, read_job_json, diff_clauses,
+                                changed_share, reuse_analysis, REVISION_INDEX_MAX_CHANGED)
+from services.templates import registry as template_registry, index_id as template_index_id
+from services.http_cache import cached_json_response, make_etag, file_hash
+from services.results import (load_results, parse_levels, parse_fields, project, StaleCursor,
+                              encode_cursor as encode_results_cursor, decode_cursor as decode_results_cursor)
+from services.pagination import fetch_page, iter_rows, decode_cursor
 
 from time import perf_counter
 from uuid import uuid4
@@ -35,7 +63,27 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 
 @app.on_event("startup")
 def startup_db_client():
-    init_db()
+    # Mongo ping/indexes and the TF-IDF libraries load in the background; see GET /ready
+    warmup.start()
+    write_buffer.start()
+    lifecycle.start()
+
+@app.on_event("shutdown")
+def shutdown_write_buffer():
+    # Flush queued chat/analytics docs (or spill them to disk) before exiting
+    write_buffer.stop()
+    lifecycle.stop()
+    warmup.stop()
+
+@app.on_event("startup")
+async def start_llm_breaker_probe():
+    # Background recovery probe for the Gemini circuit breaker
+    app.state.breaker_probe = asyncio.create_task(run_breaker_probe())
+
+@app.on_event("shutdown")
+async def shutdown_llm_client():
+    app.state.breaker_probe.cancel()
+    await close_llm_client()
 
 @app.get("/config/firebase")
 def get_firebase_config():
@@ -50,8 +98,16 @@ def get_firebase_config():
 @app.middleware("http")
 async def access_log(request: Request, call_next):
     start = perf_counter()
+    profile = begin_request(request.headers)
     resp = await call_next(request)
-    dur = int((perf_counter() - start) * 1000)
+    elapsed = perf_counter() - start
+    dur = int(elapsed * 1000)
+    # Label by route template, not the raw path, so job_ids don't explode cardinality
+    route = request.scope.get("route")
+    observe("clauseclear_http_request_seconds", elapsed,
+            method=request.method, route=getattr(route, "path", "unmatched"), status=resp.status_code)
+    if profile and profile["saved"]:
+        resp.headers["X-Profile-Id"] = profile["saved"]
     logger.info(f'req method={request.method} path={request.url.path} status={resp.status_code} ms={dur}')
     return resp
 
@@ -72,6 +128,8 @@ class UserProfile(BaseModel):
 class QueryRequestModel(BaseModel):
     query: str
     top_k: int = 3
+    # Optional latency budget for the LLM step; base_answer is returned when it runs out
+    budget_ms: int | None = None
 
 @app.post("/users/register")
 def register_user(user: UserProfile):
@@ -126,7 +184,7 @@ def get_user(uid: str):
             "dob": "2000-01-01"
         }
     
-    user = db["users"].find_one({"uid": uid}, {"_id": 0})
+    user = db["users"].find_one({"uid": uid}, USER_PROJECTION)
     if not user:
         # Return mock data for dev-user even if not in DB
         if uid == "dev-user":
@@ -150,53 +208,175 @@ async def favicon():
 def health():
     return {"status": "ok"}
 
+@app.get("/ready")
+def ready():
+    # Readiness (load balancer / orchestrator), unlike /health which is liveness only
+    snapshot = warmup.snapshot()
+    return JSONResponse(snapshot, status_code=200 if snapshot["ready"] else 503)
+
+@app.get("/health/llm")
+def health_llm():
+    # Gemini circuit breaker state for monitoring (also exported on /metrics)
+    return llm_breaker.snapshot()
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/admin/profiles", include_in_schema=False)
+def get_profiles(request: Request, limit: int = 50):
+    if not is_admin(request.headers.get(PROFILE_HEADER)):
+        raise HTTPException(status_code=403, detail="admin token required")
+    return list_profiles(max(1, min(limit, 500)))
+
+@app.get("/admin/profiles/{name}", include_in_schema=False)
+def download_profile(name: str, request: Request, kind: str = "prof"):
+    if not is_admin(request.headers.get(PROFILE_HEADER)):
+        raise HTTPException(status_code=403, detail="admin token required")
+    path = profile_path(name, kind)
+    if path is None:
+        raise HTTPException(status_code=404, detail="profile not found")
+    media = "text/plain" if kind == "txt" else "application/octet-stream"
+    return FileResponse(path, media_type=media, filename=path.name)
+
+@app.get("/admin/storage", include_in_schema=False)
+def storage_report(request: Request):
+    if not is_admin(request.headers.get(PROFILE_HEADER)):
+        raise HTTPException(status_code=403, detail="admin token required")
+    return lifecycle.last_report or {"detail": "no sweep has run in this worker yet"}
+
+@app.get("/admin/admission", include_in_schema=False)
+def admission_report(request: Request):
+    # Per-class limits, in-flight and queued requests in this worker
+    if not is_admin(request.headers.get(PROFILE_HEADER)):
+        raise HTTPException(status_code=403, detail="admin token required")
+    return admission_snapshot()
+
+@app.post("/admin/storage/sweep", include_in_schema=False)
+def storage_sweep(request: Request):
+    if not is_admin(request.headers.get(PROFILE_HEADER)):
+        raise HTTPException(status_code=403, detail="admin token required")
+    report = lifecycle.sweep()
+    if report is None:
+        raise HTTPException(status_code=409, detail="another worker is sweeping")
+    return report
+
+@app.get("/admin/templates", include_in_schema=False)
+def list_templates(request: Request):
+    if not is_admin(request.headers.get(PROFILE_HEADER)):
+        raise HTTPException(status_code=403, detail="admin token required")
+    return {"templates": template_registry.list_templates()}
+
+@app.post("/admin/templates", include_in_schema=False)
+async def register_template(request: Request, name: str, file: UploadFile = File(...)):
+    """Register a blank/reference copy of a standard agreement as a template (PDF)."""
+    if not is_admin(request.headers.get(PROFILE_HEADER)):
+        raise HTTPException(status_code=403, detail="admin token required")
+    fname = safe_filename(file.filename or "template.pdf")
+    if not fname.lower().endswith(".pdf"):
+        raise HTTPException(400, "Templates must be PDF files")
+    raw = await file.read()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / fname
+        path.write_bytes(raw)
+        pages = await run_in_threadpool(extract_text_from_pdf, path)
+    try:
+        return await run_in_threadpool(template_registry.register, name, pages, fname)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
 @app.get("/knowledge/kb")
-def get_legal_kb():
+def get_legal_kb(request: Request):
     kb_path = Path("knowledge") / "legal_kb.json"
     if not kb_path.exists():
         raise HTTPException(status_code=500, detail="Knowledge base file not found.")
-    data = json.loads(kb_path.read_text(encoding="utf-8"))
-    return data
+    # The file is only re-read when its content hash (memoised on mtime) changes
+    etag = make_etag("kb", file_hash(kb_path))
+
+    def render() -> bytes:
+        data = json.loads(kb_path.read_text(encoding="utf-8"))
+        return json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+    return cached_json_response(request, etag, render, route="/knowledge/kb",
+                                cache_control="public, max-age=300")
 
 ALLOWED = {"pdf", "docx"}
 MAX_MB = 10
 
-@app.post("/files/upload")
-async def upload(file: UploadFile = File(...)):
+@app.post("/files/upload", dependencies=[Depends(admit("upload"))])
+@profiled
+async def upload(file: UploadFile = File(...), uid: str = "dev-user", previous_job_id: str | None = None):
+    """
+    Store a document as a new job. previous_job_id links it to an earlier job of
+    the same user (a revised agreement): parse then reports which clauses changed,
+    and index/analyze reuse the earlier results for the unchanged ones.
+    """
     raw = await file.read()
+    return save_upload(file.filename, raw, uid, previous_job_id)
+
+def check_previous_job(previous_job_id: str, uid: str) -> None:
+    if not get_job_dir(previous_job_id).exists():
+        raise HTTPException(404, "previous_job_id not found")
+    owner = job_owner(previous_job_id)
+    db = get_db() if owner is None else None
+    if db is not None:
+        # Uploaded before owners were recorded in the job dir
+        try:
+            doc = db["uploads"].find_one({"job_id": previous_job_id}, {"_id": 0, "user_id": 1})
+            owner = doc.get("user_id") if doc else None
+        except Exception as e:
+            logger.error(f"previous_job_owner_lookup_failed job_id={previous_job_id} err={e}")
+    if owner != uid:
+        # Unknown owner included: never link to a job we can't attribute
+        raise HTTPException(403, "previous_job_id belongs to another user")
+
+def save_upload(filename: str, raw: bytes, uid: str = "dev-user", previous_job_id: str | None = None) -> dict:
+    """Validate and store one uploaded document as a new job."""
     if len(raw) > MAX_MB * 1024 * 1024:
         raise HTTPException(413, f"File too large (>{MAX_MB} MB)")
-    fname = safe_filename(file.filename)
+    fname = safe_filename(filename)
     ext = fname.split(".")[-1].lower()
     if ext not in ALLOWED:
         raise HTTPException(400, f"Only {sorted(ALLOWED)} allowed")
+    if previous_job_id:
+        check_previous_job(previous_job_id, uid)
 
     job_id = str(uuid4())
-    job_dir = Path("storage/uploads") / job_id
-    job_dir.mkdir(parents=True, exist_ok=True)
-    (job_dir / "created_at.txt").write_text(datetime.now(timezone.utc).isoformat())
-    (job_dir / fname).write_bytes(raw)
+    job_dir = get_job_dir(job_id)
+    with timed("upload_write"):
+        job_dir.mkdir(parents=True, exist_ok=True)
+        atomic_write_text(job_dir / "created_at.txt", datetime.now(timezone.utc).isoformat())
+        atomic_write_bytes(job_dir / fname, raw)
+        record_owner(job_id, uid)
+        if previous_job_id:
+            link_previous(job_id, previous_job_id, uid)
+        record_artifacts(job_id)
 
     return {
         "job_id": job_id,
         "filename": fname,
         "size_bytes": len(raw),
-        "path": (job_dir / fname).as_posix()
+        "path": (job_dir / fname).as_posix(),
+        "previous_job_id": previous_job_id
     }
 
 @app.get("/files/{job_id}/status")
 def status(job_id: str):
-    jd = Path("storage/uploads") / job_id
-    if not jd.exists():
+    # One manifest read instead of stat-ing every file; older jobs get a manifest on first check
+    manifest = read_manifest(job_id) or record_artifacts(job_id)
+    if manifest is None:
         return {"exists": False}
-    files = [p.name for p in jd.iterdir() if p.is_file()]
-    size = sum(p.stat().st_size for p in jd.iterdir() if p.is_file())
-    created = (jd / "created_at.txt").read_text() if (jd / "created_at.txt").exists() else None
-    return {"exists": True, "bytes": size, "files": files, "created_at_iso": created}
+    return {"exists": True, "bytes": manifest["bytes"], "files": list(manifest["artifacts"]),
+            "created_at_iso": manifest["created_at"], "updated_at_iso": manifest["updated_at"],
+            "index_bytes": manifest["index_bytes"]}
 
-@app.post("/process/{job_id}/parse")
+@app.post("/process/{job_id}/parse", dependencies=[Depends(admit("parse"))])
+@profiled
 def parse(job_id: str):
-    job_dir = Path("storage/uploads") / job_id
+    return parse_job(job_id)
+
+def parse_job(job_id: str) -> dict:
+    job_dir = get_job_dir(job_id)
     if not job_dir.exists():
         raise HTTPException(404, "job_id not found")
     pdf_path = None
@@ -214,54 +394,107 @@ def parse(job_id: str):
         logger.info(f"parse_job job_id={job_id} pdf_path={pdf_path}")
         pages = extract_text_from_pdf(pdf_path)
     elif docx_path:
-        # Placeholder for DOCX parsing - currently not implemented
-        raise HTTPException(status_code=400, detail="DOCX parsing is not yet implemented. Please upload a PDF file.")
+        logger.info(f"parse_job job_id={job_id} docx_path={docx_path}")
+        try:
+            pages = extract_text_from_docx(docx_path)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     else:
         raise HTTPException(status_code=400, detail="No PDF or DOCX file found for this job.")
 
     logger.info(f"parse_job job_id={job_id} extracted_pages={len(pages)}")
-    all_clauses = []
-    for page_num, text in enumerate(pages, start=1):
-        clauses = split_into_clauses(text)
-        for i, clause in enumerate(clauses, start=1):
-            clause_id = f"P{page_num:02d}_C{i:03d}"
-            all_clauses.append({
-                "id": clause_id,
-                "page": page_num,
-                "text": clause
-            })
-            # Debug: Log clauses with rent/deposit info
-            if any(term in clause.lower() for term in ['rent', 'deposit', 'advance']):
-                logger.info(f"Clause {clause_id}: {clause[:150]}...")
+    all_clauses = clauses_from_pages(pages)
+    for c in all_clauses:
+        # Debug: Log clauses with rent/deposit info
+        if any(term in c["text"].lower() for term in ['rent', 'deposit', 'advance']):
+            logger.info(f"Clause {c['id']}: {c['text'][:150]}...")
     logger.info(f"parse_job job_id={job_id} total_clauses={len(all_clauses)}")
+    with timed("fact_extract"):
+        extracted = extract_facts(all_clauses)
     out = {
         "job_id": job_id,
         "pages": len(pages),
         "clauses_count": len(all_clauses),
-        "clauses": all_clauses
+        "clauses": all_clauses,
+        "facts": extracted["facts"],
+        "fact_sources": extracted["sources"]
     }
-    (job_dir / "clauses.json").write_text(json.dumps(out, ensure_ascii=False, indent=2), encoding="utf-8")
-    return {"job_id": job_id, "pages": len(pages), "clauses_count": len(all_clauses)}
-
-@app.post("/rag/{job_id}/index")
+    revision = None
+    previous = previous_job(job_id)
+    previous_data = read_job_json(previous, "clauses.json") if previous else None
+    if previous_data is not None:
+        revision = diff_clauses(all_clauses, previous_data.get("clauses", []), previous)
+        out["revision"] = revision
+        logger.info(f"parse_revision job_id={job_id} previous_job_id={previous} unchanged={revision['unchanged']} "
+                    f"edited={len(revision['edited'])} added={len(revision['added'])} removed={len(revision['removed'])}")
+    template = None
+    if revision is None:
+        with timed("template_match"):
+            template = template_registry.match(all_clauses)
+        if template is not None:
+            out["template"] = template
+            logger.info(f"parse_template job_id={job_id} template_id={template['template_id']} "
+                        f"unchanged={template['unchanged']} filled={len(template['filled'])} "
+                        f"deviations={len(template['deviations'])} missing={len(template['missing'])}")
+    with job_lock(job_id):
+        atomic_write_json(job_dir / "clauses.json", out)
+        record_artifacts(job_id)
+    result = {"job_id": job_id, "pages": len(pages), "clauses_count": len(all_clauses),
+              "facts": extracted["facts"]}
+    if revision is not None:
+        result["revision"] = revision
+    if template is not None:
+        result["template"] = template
+    return result
+
+def reuse_base(data: dict) -> tuple[str, dict, list[dict]] | None:
+    """
+    The earlier results a job's clauses can reuse: the linked previous revision,
+    or else the matched template. Returns (index id, comparison, base clauses).
+    """
+    if data.get("revision"):
+        revision = data["revision"]
+        previous = read_job_json(revision["previous_job_id"], "clauses.json")
+        if previous is not None:
+            return revision["previous_job_id"], revision, previous.get("clauses", [])
+    elif data.get("template"):
+        template = data["template"]
+        base_clauses = template_registry.clauses(template["template_id"])
+        if base_clauses is not None:
+            return template_index_id(template["template_id"]), template, base_clauses
+    return None
+
+@app.post("/rag/{job_id}/index", dependencies=[Depends(admit("parse"))])
+@profiled
 def rag_index(job_id: str):
-    job_dir = Path("storage/uploads") / job_id
+    # Concurrent duplicates (double-clicks, several tabs) share one build
+    return flights.do((job_id, "rag_index"), _build_rag_index, job_id)
+
+def _build_rag_index(job_id: str) -> dict:
+    job_dir = get_job_dir(job_id)
     cj = job_dir / "clauses.json"
     if not cj.exists():
         raise HTTPException(404, "clauses.json not found. Run /process/{job_id}/parse first.")
     data = json.loads(cj.read_text(encoding="utf-8"))
     clauses = data.get("clauses", [])
-    info = build_tfidf_index(job_id, clauses)
+    info = None
+    base = reuse_base(data)
+    if base is not None and changed_share(base[1], len(clauses)) <= REVISION_INDEX_MAX_CHANGED:
+        info = update_tfidf_index(job_id, clauses, base[0], base[2])
+    if info is None:
+        info = build_tfidf_index(job_id, clauses)
+    record_artifacts(job_id)
     return {"job_id": job_id, "clauses": len(clauses), "shape": info}
 
-@app.post("/rag/{job_id}/search")
+@app.post("/rag/{job_id}/search", dependencies=[Depends(admit("query"))])
+@profiled
 def rag_search(job_id: str, payload: dict):
     query = (payload or {}).get("query", "").strip()
     top_k = int((payload or {}).get("top_k", 5))
     if not query:
         raise HTTPException(400, "query is required")
 
-    job_dir = Path("storage/uploads") / job_id
+    job_dir = get_job_dir(job_id)
     cj = job_dir / "clauses.json"
     if not cj.exists():
         raise HTTPException(404, "clauses.json not found. Run /process/{job_id}/parse first.")
@@ -274,41 +507,72 @@ def rag_search(job_id: str, payload: dict):
         raise HTTPException(404, "index not built. Call /rag/{job_id}/index first.")
     return {"job_id": job_id, "query": query, "matches": matches}
 
-@app.post("/analyze/{job_id}/clauses")
-def analyze_job_clauses(job_id: str, uid: str = "dev-user"):
+@app.post("/analyze/{job_id}/clauses", dependencies=[Depends(admit("analyze"))])
+@profiled
+def analyze_job_clauses(job_id: str, background_tasks: BackgroundTasks, uid: str = "dev-user",
+                        explain: bool | None = None):
     """
     Load clauses.json for this job_id, run the weighted rules-based severity engine,
     save analysis.json, and return basic stats + enriched clauses.
     Also saves the job summary to MongoDB for the user history.
+    With explain=true (default: ANALYZE_PRECOMPUTE_EXPLANATIONS), plain-language
+    explanations for the RED/YELLOW clauses are generated in the background.
+    Concurrent duplicate calls for the same job share the scoring and the
+    analysis.json write; each caller's history entry and explain request are
+    still handled.
     """
-    job_dir = Path("storage/uploads") / job_id
+    scored = flights.do((job_id, "analyze"), _score_job, job_id)
+    return _record_analysis(job_id, scored, uid, explain, background_tasks)
+
+def _analyze_job(job_id: str, uid: str, explain: bool | None, background_tasks: BackgroundTasks | None) -> dict:
+    return _record_analysis(job_id, _score_job(job_id), uid, explain, background_tasks)
+
+def _score_job(job_id: str) -> dict:
+    """Score the job's clauses and store analysis.json. JSON-serialisable, so singleflight can share it."""
+    job_dir = get_job_dir(job_id)
     cj = job_dir / "clauses.json"
     if not cj.exists():
         raise HTTPException(status_code=404, detail="clauses.json not found. Run /process/{job_id}/parse first.")
 
     data = json.loads(cj.read_text(encoding="utf-8"))
     clauses = data.get("clauses", [])
-
-    analyzed = analyze_clauses(clauses)
+    revision = data.get("revision")
+    template = data.get("template")
+    if "facts" not in data:
+        # Parsed before fact extraction existed
+        extracted = extract_facts(clauses)
+        data["facts"], data["fact_sources"] = extracted["facts"], extracted["sources"]
+
+    with timed("severity_score"):
+        analyzed, reused = reuse_base_analysis(data, clauses)
+        if analyzed is None:
+            analyzed = analyze_clauses(clauses)
+
+    analysis = {"job_id": job_id, "rules_version": RULES_VERSION, "clauses": analyzed}
+    if revision:
+        analysis["revision"] = {**revision, "reused_results": reused}
+    if template:
+        analysis["template"] = template_report(template, analyzed, reused)
 
     aj = job_dir / "analysis.json"
-    aj.write_text(json.dumps({"job_id": job_id, "clauses": analyzed}, ensure_ascii=False, indent=2), encoding="utf-8")
-
-    summary = {"GREEN": 0, "YELLOW": 0, "RED": 0}
-    clauses_by_risk = {"GREEN": [], "YELLOW": [], "RED": []}
-    
-    for c in analyzed:
-        lvl = c.get("risk_level", "GREEN")
-        if lvl in summary:
-            summary[lvl] += 1
-            # Group clauses by risk level with only necessary fields
-            clauses_by_risk[lvl].append({
-                "clause_id": c.get("id"),
-                "page": c.get("page"),
-                "text": c.get("text"),
-                "risk_level": lvl,
-                "reasons": c.get("reasons", [])
-            })
+    # analysis.json and the canonical answers derived from it are replaced together
+    with job_lock(job_id):
+        atomic_write_json(aj, analysis)
+        precompute_canonical_answers(job_id, clauses, analyzed)
+        manifest = record_artifacts(job_id)
+    return {"analysis": analysis, "facts": data["facts"], "fact_sources": data["fact_sources"],
+            "created_at": manifest["created_at"]}
+
+def _record_analysis(job_id: str, scored: dict, uid: str, explain: bool | None,
+                     background_tasks: BackgroundTasks | None) -> dict:
+    """The caller's part of an analyze: history entry, explanation precompute and the response body."""
+    job_dir = get_job_dir(job_id)
+    analysis = scored["analysis"]
+    analyzed = analysis["clauses"]
+    revision = analysis.get("revision")
+    template = analysis.get("template")
+    result = analysis_view(analysis)
+    summary = result["summary"]
 
     # Save to History (MongoDB)
     db = get_db()
@@ -328,23 +592,58 @@ def analyze_job_clauses(job_id: str, uid: str = "dev-user"):
             "filename": filename,
             "status": "processed",
             "created_at": datetime.now(timezone.utc).isoformat(),
-            # Optional: Add expires_at logic if needed (e.g. 3 months from now)
-            # "expires_at": (datetime.now(timezone.utc) + timedelta(days=90)).isoformat(),
+            # When the storage lifecycle sweeper will remove this job's files (STORAGE_TTL_DAYS)
+            "expires_at": expires_at(scored["created_at"]),
             "analysis_summary": summary,
-            "risky_clauses": clauses_by_risk["YELLOW"] + clauses_by_risk["RED"] # Flattening risky ones
+            "risky_clauses": result["clauses"]["yellow"] + result["clauses"]["red"], # Flattening risky ones
+            "previous_job_id": revision["previous_job_id"] if revision else None,
+            "template_id": template["template_id"] if template else None,
+            # Typed, indexed per fact (after user_id, created_at, _id) for /users/{uid}/facts
+            "facts": scored["facts"],
+            "fact_sources": scored["fact_sources"]
         }
         
         # Using "uploads" collection instead of "jobs"
-        db["uploads"].update_one(
-            {"job_id": job_id},
-            {"$set": upload_doc},
-            upsert=True
-        )
+        with timed("mongo_write"):
+            db["uploads"].update_one(
+                {"job_id": job_id},
+                {"$set": upload_doc},
+                upsert=True
+            )
     logger.info(f"analyze_ok job_id={job_id} total={len(analyzed)} summary={summary}")
 
-    return {
-        "job_id": job_id,
-        "total_clauses": len(analyzed),
+    if explain is None:
+        explain = ANALYZE_PRECOMPUTE_EXPLANATIONS
+    explaining = explain and bool(select_risky(analyzed))
+    if explaining:
+        # Runs after the response is sent; /query_llm picks explanations up as they land.
+        # Coalesced, so duplicate explain requests don't send the same batches twice
+        background_tasks.add_task(flights.do_async, (job_id, "explain"), precompute_explanations, job_id, analyzed)
+
+    result["explanations_scheduled"] = explaining
+    return result
+
+def analysis_view(analysis: dict) -> dict:
+    """Response body for a stored analysis: risk counts and clauses grouped by level."""
+    summary = {"GREEN": 0, "YELLOW": 0, "RED": 0}
+    clauses_by_risk = {"GREEN": [], "YELLOW": [], "RED": []}
+
+    for c in analysis["clauses"]:
+        lvl = c.get("risk_level", "GREEN")
+        if lvl in summary:
+            summary[lvl] += 1
+            # Group clauses by risk level with only necessary fields
+            clauses_by_risk[lvl].append({
+                "clause_id": c.get("id"),
+                "page": c.get("page"),
+                "text": c.get("text"),
+                "risk_level": lvl,
+                "reasons": c.get("reasons", [])
+            })
+
+    result = {
+        "job_id": analysis["job_id"],
+        "total_clauses": len(analysis["clauses"]),
         "summary": summary,
         "clauses": {
             "green": clauses_by_risk["GREEN"],
@@ -352,22 +651,276 @@ def analyze_job_clauses(job_id: str, uid: str = "dev-user"):
             "red": clauses_by_risk["RED"]
         }
     }
+    for key in ("revision", "template"):
+        if analysis.get(key):
+            result[key] = analysis[key]
+    return result
+
+@app.get("/analyze/{job_id}/clauses")
+def get_job_analysis(job_id: str, request: Request):
+    """
+    The stored analysis (same body as POST, without re-scoring). Carries a
+    strong ETag of analysis.json, answers If-None-Match with 304 and serves
+    gzip/brotli bodies cached per analysis version.
+    """
+    aj = get_job_dir(job_id) / "analysis.json"
+    try:
+        etag = make_etag("analysis", file_hash(aj))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="analysis.json not found. Run POST /analyze/{job_id}/clauses first.")
+
+    def render() -> bytes:
+        analysis = json.loads(aj.read_text(encoding="utf-8"))
+        return json.dumps(analysis_view(analysis), ensure_ascii=False).encode("utf-8")
+
+    return cached_json_response(request, etag, render, route="/analyze/{job_id}/clauses")
+
+def reuse_base_analysis(data: dict, clauses: list[dict]) -> tuple[list[dict] | None, int]:
+    """
+    Score only the clauses that are new or edited compared to the previous
+    revision or the matched template. Returns (None, 0) when there is nothing
+    to reuse (no base, or its analysis is missing or was made with other rules).
+    """
+    if data.get("revision"):
+        previous = read_job_json(data["revision"]["previous_job_id"], "analysis.json")
+        if previous is None or previous.get("rules_version") != RULES_VERSION:
+            return None, 0
+        base_analyzed = previous.get("clauses", [])
+    elif data.get("template"):
+        base_analyzed = template_registry.analysis(data["template"]["template_id"])
+        if base_analyzed is None:
+            return None, 0
+    else:
+        return None, 0
+    results, todo = reuse_analysis(clauses, base_analyzed)
+    for i, scored in zip(todo, analyze_clauses([clauses[i] for i in todo])):
+        results[i] = scored
+    return results, len(clauses) - len(todo)
+
+def template_report(template: dict, analyzed: list[dict], reused: int) -> dict:
+    """Template match for the analyze response, with the deviating clauses' risk."""
+    by_id = {c["id"]: c for c in analyzed}
+    deviations = []
+    for d in template["deviations"]:
+        c = by_id.get(d["id"], {})
+        deviations.append({"clause_id": d["id"], "page": d["page"], "text": d["text"],
+                           "risk_level": c.get("risk_level"), "reasons": c.get("reasons", [])})
+    return {
+        "template_id": template["template_id"],
+        "name": template["name"],
+        "unchanged": template["unchanged"],
+        "filled": len(template["filled"]),
+        "reused_results": reused,
+        "deviations": deviations,
+        "missing": template["missing"],
+    }
+
+@app.post("/files/bulk", dependencies=[Depends(admit("analyze"))])
+async def bulk_analyze(files: list[UploadFile] = File(...), uid: str = "dev-user"):
+    """
+    Portfolio upload: several PDF/DOCX files and/or zip archives of them.
+    Runs upload -> parse -> index -> analyze for every document, BULK_CONCURRENCY
+    at a time, and streams NDJSON: an "accepted" line, one "document" line per
+    document as it finishes (risk counts + top risky clauses, or an error), and
+    a final "portfolio" aggregate.
+    """
+    try:
+        uploads = await read_uploads(files)
+        docs, rejected = expand_uploads(uploads, ALLOWED)
+    except BulkInputError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # The zip archives are unpacked by now; don't keep them for the whole stream
+    del uploads
+    if not docs and not rejected:
+        raise HTTPException(status_code=400, detail=f"No {sorted(ALLOWED)} documents found")
+
+    slots = asyncio.Semaphore(max(1, BULK_CONCURRENCY))
+
+    async def one(filename: str, raw: bytes) -> dict:
+        async with slots:
+            return await run_in_threadpool(run_pipeline, filename, raw, uid)
+
+    async def lines():
+        started = perf_counter()
+        yield json.dumps({"type": "accepted", "documents": [name for name, _ in docs]}, ensure_ascii=False) + "\n"
+        tasks = [asyncio.ensure_future(one(name, raw)) for name, raw in docs]
+        results = list(rejected)
+        for result in rejected:
+            yield json.dumps({"type": "document", **result}, ensure_ascii=False) + "\n"
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                results.append(result)
+                yield json.dumps({"type": "document", **result}, ensure_ascii=False) + "\n"
+            portfolio = aggregate(results, perf_counter() - started)
+            logger.info(f"bulk_ok uid={uid} documents={portfolio['documents']} failed={portfolio['failed']} "
+                        f"elapsed_s={portfolio['elapsed_s']}")
+            yield json.dumps({"type": "portfolio", **portfolio}, ensure_ascii=False) + "\n"
+        finally:
+            # Client went away: don't start documents that are still queued
+            for t in tasks:
+                t.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+def run_pipeline(filename: str, raw: bytes, uid: str) -> dict:
+    """Full pipeline for one document; failures become an error result instead of raising."""
+    job_id = None
+    try:
+        job_id = save_upload(filename, raw, uid)["job_id"]
+        parse_job(job_id)
+        _build_rag_index(job_id)
+        analysis = _analyze_job(job_id, uid, False, None)
+        return summarize_document(filename, job_id, analysis)
+    except HTTPException as e:
+        return {"filename": filename, "job_id": job_id, "status": "error", "error": e.detail}
+    except Exception as e:
+        logger.error(f"bulk_document_failed filename={filename!r} job_id={job_id} err={e}")
+        return {"filename": filename, "job_id": job_id, "status": "error", "error": "processing failed"}
+
+HISTORY_PAGE_DEFAULT = 20
+HISTORY_PAGE_MAX = 100
+CHAT_PAGE_DEFAULT = 100
+CHAT_PAGE_MAX = 500
+RESULTS_PAGE_DEFAULT = 50
+RESULTS_PAGE_MAX = 500
+
+def _paged_response(rows, next_cursor: str | None, fmt: str):
+    """
+    JSON mode keeps the plain list body the frontend expects and puts the next
+    cursor in the X-Next-Cursor header. NDJSON mode streams one row per line,
+    each carrying the cursor to resume after it.
+    """
+    if fmt == "ndjson":
+        def gen():
+            for row, row_cursor in rows:
+                yield json.dumps({**row, "cursor": row_cursor}, ensure_ascii=False, default=str) + "\n"
+        return StreamingResponse(gen(), media_type="application/x-ndjson")
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    return JSONResponse([row for row, _ in rows], headers=headers)
+
+def _page_args(limit: int, default: int, maximum: int, fmt: str, cursor: str | None) -> int:
+    if fmt not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'ndjson'")
+    if cursor:
+        # Validate up front; NDJSON rows are produced after the response has started
+        try:
+            decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return max(1, min(limit or default, maximum))
 
 @app.get("/users/{uid}/history")
-def get_user_history(uid: str):
+def get_user_history(uid: str, cursor: str | None = None, limit: int = HISTORY_PAGE_DEFAULT, format: str = "json"):
+    limit = _page_args(limit, HISTORY_PAGE_DEFAULT, HISTORY_PAGE_MAX, format, cursor)
     db = get_db()
     if db is None:
         return []
-    
+
     # Query "uploads" collection instead of "jobs"
     # Note: user_id is the field name in new schema, but we pass uid to function
-    cursor = db["uploads"].find({"user_id": uid}).sort("created_at", -1).limit(20)
-    history = []
-    for doc in cursor:
+    # risky_clauses holds full clause text; the list view only needs the summary
+    def row(doc):
         doc.pop("_id", None)
-        # Map back to expected frontend format if necessary, or return as is
-        history.append(doc)
-    return history
+        return doc
+
+    if format == "ndjson":
+        rows = ((row(doc), c) for doc, c in iter_rows(db["uploads"], {"user_id": uid}, HISTORY_PROJECTION,
+                                                     cursor, limit, descending=True))
+        next_cursor = None
+    else:
+        docs, next_cursor = fetch_page(db["uploads"], {"user_id": uid}, HISTORY_PROJECTION,
+                                       cursor, limit, descending=True)
+        rows = [(row(doc), None) for doc in docs]
+    return _paged_response(rows, next_cursor, format)
+
+@app.get("/analyze/{job_id}/facts")
+def get_job_facts(job_id: str):
+    """Facts extracted at parse time, with the clause each one came from."""
+    data = read_job_json(job_id, "clauses.json")
+    if data is None:
+        raise HTTPException(status_code=404, detail="clauses.json not found. Run /process/{job_id}/parse first.")
+    if "facts" not in data:
+        extracted = extract_facts(data.get("clauses", []))
+        data["facts"], data["fact_sources"] = extracted["facts"], extracted["sources"]
+    return {"job_id": job_id, "facts": data["facts"], "sources": data["fact_sources"]}
+
+@app.get("/users/{uid}/facts")
+def get_user_facts(uid: str, request: Request, cursor: str | None = None, limit: int = HISTORY_PAGE_DEFAULT,
+                   format: str = "json"):
+    """
+    A user's analyzed documents with their facts, newest first, filtered by
+    fact ranges: ?deposit_months=gt:3, ?rent_amount=gte:10000&rent_amount=lte:20000.
+    Each filter is served by the (user_id, created_at, _id, facts.<name>) index,
+    which gives the sort order and checks the range on index keys.
+    """
+    limit = _page_args(limit, HISTORY_PAGE_DEFAULT, HISTORY_PAGE_MAX, format, cursor)
+    try:
+        filt = {"user_id": uid, **parse_fact_filters(request.query_params.multi_items())}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    db = get_db()
+    if db is None:
+        return []
+
+    def row(doc):
+        doc.pop("_id", None)
+        return doc
+
+    if format == "ndjson":
+        rows = ((row(doc), c) for doc, c in iter_rows(db["uploads"], filt, FACTS_PROJECTION,
+                                                     cursor, limit, descending=True))
+        next_cursor = None
+    else:
+        docs, next_cursor = fetch_page(db["uploads"], filt, FACTS_PROJECTION, cursor, limit, descending=True)
+        rows = [(row(doc), None) for doc in docs]
+    return _paged_response(rows, next_cursor, format)
+
+@app.get("/analyze/{job_id}/results")
+def get_job_results(job_id: str, risk: str | None = None, fields: str | None = None, order: str = "risk",
+                    cursor: str | None = None, limit: int = RESULTS_PAGE_DEFAULT, format: str = "json"):
+    """
+    Read-only, paged view of the stored analysis. risk=RED,YELLOW filters by
+    level; fields=clause_id,risk_level,... picks the keys of each row; order=risk
+    (RED, then YELLOW, then GREEN, each in document order) or order=document.
+    The per-level counts of the whole analysis are in the X-Risk-Counts header.
+    """
+    limit = _page_args(limit, RESULTS_PAGE_DEFAULT, RESULTS_PAGE_MAX, format, None)
+    if order not in ("risk", "document"):
+        raise HTTPException(status_code=400, detail="order must be 'risk' or 'document'")
+    try:
+        levels = parse_levels(risk)
+        keys = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        results = load_results(job_id)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="analysis.json not found. Run POST /analyze/{job_id}/clauses first.")
+    after = None
+    if cursor:
+        try:
+            after = decode_results_cursor(cursor, results.version, order)
+        except StaleCursor as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    # One row past the page tells whether there is a next page
+    page = []
+    for rank, position, clause in results.rows(levels, order, after):
+        page.append((rank, position, clause))
+        if len(page) > limit:
+            break
+    has_more = len(page) > limit
+    page = page[:limit]
+    rows = [(project(clause, keys), encode_results_cursor(results.version, order, rank, position))
+            for rank, position, clause in page]
+    next_cursor = rows[-1][1] if has_more and rows else None
+
+    response = _paged_response(rows, next_cursor, format)
+    response.headers["X-Risk-Counts"] = json.dumps(results.counts(), separators=(",", ":"))
+    return response
 
 def build_answer_for_query(query: str, matches: list[dict]) -> str:
     if not matches:
@@ -405,20 +958,45 @@ def build_answer_for_query(query: str, matches: list[dict]) -> str:
         )
     return answer_string
 
-@app.post("/query/{job_id}")
-def query_job(job_id: str, payload: dict):
+def enrich_matches(results: list[dict], clauses: list[dict], analyzed: list[dict] | None = None) -> list[dict]:
     """
-    Unified endpoint for frontend:
-    - uses TF-IDF RAG to find top-k clauses
-    - attaches risk info for each match.
-    - saves chat history to MongoDB
+    Attach severity info to TF-IDF results. `analyzed` (analyze_clauses output)
+    supplies already-computed risk fields so clauses are not scored twice.
     """
-    query = (payload or {}).get("query", "").strip()
-    top_k = int((payload or {}).get("top_k", 5))
-    if not query:
-        raise HTTPException(status_code=400, detail="query is required")
+    by_id = {c.get("id"): c for c in clauses}
+    scored = {c.get("id"): c for c in analyzed} if analyzed else {}
+    # `results` should be a list of dicts with at least: id, page, text, score
+    enriched_matches = []
+    with timed("severity_score"):
+        for r in results:
+            # Find the original clause using its ID to ensure we have all original metadata
+            original_clause = by_id.get(r.get("id"))
+            if original_clause:
+                done = scored.get(original_clause.get("id"))
+                if done is not None:
+                    risk = {k: done[k] for k in ("risk_score", "risk_level", "triggered_rules", "reasons")}
+                else:
+                    risk = score_clause(original_clause) # Pass the whole clause dict
+                enriched_matches.append({
+                    "id": original_clause.get("id"),
+                    "page": original_clause.get("page"),
+                    "text": original_clause.get("text"),
+                    "score": r.get("score"),
+                    **risk,
+                })
+    return enriched_matches
+
+def retrieve_matches(job_id: str, query: str, top_k: int) -> list[dict]:
+    """
+    TF-IDF top-k search over the job's clauses, with severity info attached to each match.
+    Canonical questions answered at analyze time are served from storage instead.
+    """
+    stored = stored_matches(job_id, query, top_k)
+    if stored is not None:
+        logger.info(f"canonical_answer_hit job_id={job_id} q={query!r}")
+        return stored
 
-    job_dir = Path("storage/uploads") / job_id
+    job_dir = get_job_dir(job_id)
     clauses_path = job_dir / "clauses.json"
     if not clauses_path.exists():
         raise HTTPException(status_code=404, detail="clauses.json not found. Run /process/{job_id}/parse first.")
@@ -433,20 +1011,40 @@ def query_job(job_id: str, payload: dict):
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="RAG index not built. Call /rag/{job_id}/index first.")
 
-    # `results` should be a list of dicts with at least: id, page, text, score
-    enriched_matches = []
-    for r in results:
-        # Find the original clause using its ID to ensure we have all original metadata
-        original_clause = next((c for c in clauses if c.get("id") == r.get("id")), None)
-        if original_clause:
-            risk = score_clause(original_clause) # Pass the whole clause dict
-            enriched_matches.append({
-                "id": original_clause.get("id"),
-                "page": original_clause.get("page"),
-                "text": original_clause.get("text"),
-                "score": r.get("score"),
-                **risk,
-            })
+    return enrich_matches(results, clauses)
+
+def precompute_canonical_answers(job_id: str, clauses: list[dict], analyzed: list[dict]) -> int:
+    """Answer the canonical question set for this job in one index pass and store it."""
+    qids = list(CANONICAL_QUESTIONS)
+    queries = [CANONICAL_QUESTIONS[qid]["query"] for qid in qids]
+    try:
+        results = tfidf_search_many(job_id, queries, clauses, top_k=CANONICAL_TOP_K)
+    except FileNotFoundError:
+        logger.info(f"canonical_answers_skipped job_id={job_id} reason=index_not_built")
+        return 0
+    answers = {}
+    for qid, query, res in zip(qids, queries, results):
+        matches = enrich_matches(res, clauses, analyzed)
+        answers[qid] = {"answer": build_answer_for_query(query, matches), "matches": matches}
+    save_answers(job_id, answers)
+    return len(answers)
+
+@app.post("/query/{job_id}", dependencies=[Depends(admit("query"))])
+@profiled
+def query_job(job_id: str, payload: dict):
+    """
+    Unified endpoint for frontend:
+    - uses TF-IDF RAG to find top-k clauses
+    - attaches risk info for each match.
+    - saves chat history to MongoDB
+    """
+    timer = start_request_timer()
+    query = (payload or {}).get("query", "").strip()
+    top_k = int((payload or {}).get("top_k", 5))
+    if not query:
+        raise HTTPException(status_code=400, detail="query is required")
+
+    enriched_matches = retrieve_matches(job_id, query, top_k)
 
     answer = build_answer_for_query(query, enriched_matches)
 
@@ -472,17 +1070,18 @@ def query_job(job_id: str, payload: dict):
             "evidence": enriched_matches, # storing matches as evidence
             "created_at": datetime.now(timezone.utc).isoformat()
         }
-        db["qa_messages"].insert_one(qa_doc)
+        write_buffer.enqueue("qa_messages", qa_doc)
         
         # Also log analytics
         analytics_doc = {
             "job_id": job_id,
-            "latency_ms": 0, # Placeholder or need to measure
-            "tokens_used": 0, # Not applicable for rule-based, or estimate
+            "latency_ms": timer.elapsed_ms(),
+            "stages_ms": timer.breakdown(),
+            "tokens_used": 0, # Not applicable for rule-based
             "created_at": datetime.now(timezone.utc).isoformat(),
             "type": "query_rule_based"
         }
-        db["analytics"].insert_one(analytics_doc)
+        write_buffer.enqueue("analytics", analytics_doc)
 
     logger.info(f"query_ok job_id={job_id} q={query!r} top_k={top_k} returned={len(enriched_matches)}")
 
@@ -494,58 +1093,9 @@ def query_job(job_id: str, payload: dict):
         "matches": enriched_matches,
     }
 
-@app.post("/query_llm/{job_id}")
-async def query_llm(job_id: str, payload: QueryRequestModel):
-    """
-    LLM-powered query endpoint:
-    - Reuses TF-IDF + severity engine from /query/{job_id}
-    - Then calls Gemini (LLM) to rewrite the result in simple, tenant-friendly language
-    """
-    query = payload.query.strip()
-    top_k = payload.top_k
-    if not query:
-        raise HTTPException(status_code=400, detail="query is required")
-
-    job_dir = Path("storage/uploads") / job_id
-    clauses_path = job_dir / "clauses.json"
-    if not clauses_path.exists():
-        raise HTTPException(status_code=404, detail="clauses.json not found. Run /process/{job_id}/parse first.")
-
-    # load all clauses
-    data = json.loads(clauses_path.read_text(encoding="utf-8"))
-    clauses = data.get("clauses", [])
-
-    try:
-        # use existing TF-IDF search helper
-        results = tfidf_search(job_id, query, clauses, top_k=top_k)
-    except FileNotFoundError:
-        raise HTTPException(status_code=404, detail="RAG index not built. Call /rag/{job_id}/index first.")
-
-    # `results` should be a list of dicts with at least: id, page, text, score
-    enriched_matches = []
-    for r in results:
-        # Find the original clause using its ID to ensure we have all original metadata
-        original_clause = next((c for c in clauses if c.get("id") == r.get("id")), None)
-        if original_clause:
-            risk = score_clause(original_clause) # Pass the whole clause dict
-            enriched_matches.append({
-                "id": original_clause.get("id"),
-                "page": original_clause.get("page"),
-                "text": original_clause.get("text"),
-                "score": r.get("score"),
-                **risk,
-            })
-
-    # Build base_answer using existing function
-    base_answer = build_answer_for_query(query, enriched_matches)
-
-    # If matches is empty, base_answer should be the UNKNOWN message
-    if not enriched_matches:
-        answer_llm = "Your document does not clearly talk about this topic. I couldn't find a specific clause about it."
-    else:
-        # Call LLM to generate simple explanation
-        answer_llm = explain_with_llm(query, enriched_matches, base_answer)
-
+def record_llm_exchange(job_id: str, query: str, base_answer: str, answer_llm: str, matches: list[dict],
+                        timer, usage: dict, kind: str):
+    """Queue the qa_messages and analytics docs for an LLM answer."""
     # Save chat to QA Messages (MongoDB) - New Schema
     db = get_db()
     if db is not None:
@@ -564,21 +1114,63 @@ async def query_llm(job_id: str, payload: QueryRequestModel):
             "query": query,
             "answer": base_answer,
             "answer_llm": answer_llm,
-            "evidence": enriched_matches,
+            "evidence": matches,
             "created_at": datetime.now(timezone.utc).isoformat()
         }
-        db["qa_messages"].insert_one(qa_doc)
+        write_buffer.enqueue("qa_messages", qa_doc)
 
-        # Analytics for LLM call
-        # In a real scenario, we'd track actual token usage from Gemini response if available
+        # Analytics for LLM call; tokens come from Gemini's usageMetadata (0 on fallback)
         analytics_doc = {
             "job_id": job_id,
-            "latency_ms": 0, # Placeholder
-            "tokens_used": 100, # Placeholder/Estimate
+            "latency_ms": timer.elapsed_ms(),
+            "stages_ms": timer.breakdown(),
+            "tokens_used": usage.get("total_tokens", 0),
+            # Prompt size as budgeted vs as counted by Gemini (None when no call was made)
+            "prompt_tokens": usage.get("prompt_tokens"),
+            "prompt_tokens_estimated": usage.get("prompt_tokens_estimated"),
             "created_at": datetime.now(timezone.utc).isoformat(),
-            "type": "query_llm"
+            "type": kind
         }
-        db["analytics"].insert_one(analytics_doc)
+        write_buffer.enqueue("analytics", analytics_doc)
+
+@app.post("/query_llm/{job_id}", dependencies=[Depends(admit("query_llm"))])
+@profiled
+async def query_llm(job_id: str, payload: QueryRequestModel):
+    """
+    LLM-powered query endpoint:
+    - Reuses TF-IDF + severity engine from /query/{job_id}
+    - Then calls Gemini (LLM) to rewrite the result in simple, tenant-friendly language
+    Identical concurrent questions about the same job share one answer.
+    """
+    query = payload.query.strip()
+    if not query:
+        raise HTTPException(status_code=400, detail="query is required")
+    key = (job_id, "query_llm", normalize_query(query), payload.top_k)
+    return await flights.do_async(key, _answer_with_llm, job_id, query, payload.top_k, payload.budget_ms)
+
+async def _answer_with_llm(job_id: str, query: str, top_k: int, budget_ms: int | None) -> dict:
+    timer = start_request_timer()
+
+    # Index load + scoring is blocking file/CPU work; keep it off the event loop
+    enriched_matches = await run_in_threadpool(retrieve_matches, job_id, query, top_k)
+
+    # Build base_answer using existing function
+    base_answer = build_answer_for_query(query, enriched_matches)
+
+    # If matches is empty, base_answer should be the UNKNOWN message
+    usage = {"total_tokens": 0}
+    stored = await run_in_threadpool(stored_explanation, job_id, enriched_matches[0]) if enriched_matches else None
+    if not enriched_matches:
+        answer_llm = NO_MATCH_ANSWER
+    elif stored:
+        # Explained at analyze time; no Gemini round trip
+        answer_llm, usage = stored, {"total_tokens": 0, "precomputed": True}
+    else:
+        # Call LLM to generate simple explanation
+        answer_llm, usage = await explain_with_llm_usage_async(query, enriched_matches, base_answer,
+                                                               budget_ms=budget_ms, job_id=job_id)
+
+    record_llm_exchange(job_id, query, base_answer, answer_llm, enriched_matches, timer, usage, "query_llm")
 
     logger.info(f"query_llm_ok job_id={job_id} q={query!r} returned={len(enriched_matches)}")
 
@@ -591,22 +1183,83 @@ async def query_llm(job_id: str, payload: QueryRequestModel):
         "matches": enriched_matches,
     }
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.get("/query_llm/{job_id}/stream", dependencies=[Depends(admit("query_llm"))])
+async def query_llm_stream(job_id: str, query: str, top_k: int = 3, budget_ms: int | None = None):
+    """
+    Streaming variant of /query_llm as Server-Sent Events (works with EventSource):
+    - event "base": rule-based base_answer + matches, sent immediately
+    - event "token": incremental LLM text (capped at the same length as /query_llm)
+    - event "done": final answer_llm (sentence-trimmed; base_answer on LLM failure)
+    budget_ms bounds the wait for the first LLM token; base_answer is final if it runs out.
+    """
+    timer = start_request_timer()
+    query = query.strip()
+    if not query:
+        raise HTTPException(status_code=400, detail="query is required")
+    enriched_matches = await run_in_threadpool(retrieve_matches, job_id, query, top_k)
+    base_answer = build_answer_for_query(query, enriched_matches)
+
+    async def events():
+        yield _sse("base", {"job_id": job_id, "query": query, "base_answer": base_answer, "matches": enriched_matches})
+        answer_llm, usage = NO_MATCH_ANSWER, {"total_tokens": 0}
+        stored = await run_in_threadpool(stored_explanation, job_id, enriched_matches[0]) if enriched_matches else None
+        if stored:
+            answer_llm, usage = stored, {"total_tokens": 0, "precomputed": True}
+            yield _sse("token", {"text": stored})
+        elif enriched_matches:
+            stream = stream_with_llm_async(query, enriched_matches, base_answer, job_id=job_id)
+            first = True
+            while True:
+                try:
+                    if first and budget_ms:
+                        item = await asyncio.wait_for(stream.__anext__(), timeout=budget_ms / 1000)
+                    else:
+                        item = await stream.__anext__()
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    logger.info(f"LLM latency budget of {budget_ms} ms exceeded before first token")
+                    answer_llm = base_answer
+                    await stream.aclose()
+                    break
+                first = False
+                if item[0] == "token":
+                    yield _sse("token", {"text": item[1]})
+                else:
+                    _, answer_llm, usage = item
+        record_llm_exchange(job_id, query, base_answer, answer_llm, enriched_matches, timer, usage, "query_llm_stream")
+        logger.info(f"query_llm_stream_ok job_id={job_id} q={query!r} returned={len(enriched_matches)}")
+        yield _sse("done", {"answer_llm": answer_llm, "tokens_used": usage.get("total_tokens", 0)})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.get("/analyze/{job_id}/chat")
-def get_job_chat(job_id: str):
+def get_job_chat(job_id: str, cursor: str | None = None, limit: int = CHAT_PAGE_DEFAULT, format: str = "json"):
+    limit = _page_args(limit, CHAT_PAGE_DEFAULT, CHAT_PAGE_MAX, format, cursor)
     db = get_db()
     if db is None:
         return []
-    
+
     # Query "qa_messages" collection instead of "jobs"
-    cursor = db["qa_messages"].find({"job_id": job_id}).sort("created_at", 1)
-    history = []
-    for doc in cursor:
-        doc.pop("_id", None)
-        # Adapt to frontend expectation if needed, or return as full QA objects
-        # Frontend likely expects a list of objects with query/answer
-        history.append({
+    # Skip the evidence arrays (full clause text per message); only query/answer are shown
+    def row(doc):
+        # Frontend expects a list of objects with query/answer
+        return {
             "query": doc.get("query"),
             "answer": doc.get("answer_llm") or doc.get("answer"),
             "timestamp": doc.get("created_at")
-        })
-    return history
+        }
+
+    if format == "ndjson":
+        rows = ((row(doc), c) for doc, c in iter_rows(db["qa_messages"], {"job_id": job_id}, CHAT_PROJECTION,
+                                                     cursor, limit, descending=False))
+        next_cursor = None
+    else:
+        docs, next_cursor = fetch_page(db["qa_messages"], {"job_id": job_id}, CHAT_PROJECTION,
+                                       cursor, limit, descending=False)
+        rows = [(row(doc), None) for doc in docs]
+    return _paged_response(rows, next_cursor, format)
@@ -0,0 +1,205 @@
+"""
+Offline batch analyzer: run a directory of PDFs through the same extraction,
+clause splitting and severity scoring as the API, without going through HTTP.
+
+    python batch_analyze.py archive/pdfs --out storage/batch/run1 --workers 8
+
+Documents are processed by a process pool. Each result (one JSON object per
+document with its analyzed clauses, risk summary and stage timings) is appended
+to sharded JSONL files: results-00000.jsonl, results-00001.jsonl, ...
+
+Progress is checkpointed in <out>/done.txt (one relative path per finished
+document). Re-running with the same --out skips those documents and writes
+new shards, so an interrupted run can simply be restarted. Results are written
+before the checkpoint, so a crash can at worst repeat a document: dedupe on
+"path" if that matters.
+Failed documents are checkpointed too (the error is in their record); remove
+their lines from done.txt to retry them.
+
+A throughput report (docs/s, clauses/s, time per stage) is printed and saved
+as <out>/report.json.
+"""
+import os
+import sys
+import json
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from time import perf_counter
+from datetime import datetime, timezone
+
+STAGES = ("extract", "split", "score")
+
+
+def _init_worker() -> None:
+    # The parsers log every page at INFO; keep worker output to real problems
+    from loguru import logger
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+
+def analyze_file(task: tuple[str, str]) -> dict:
+    """Worker: extract -> split -> score one PDF or DOCX. Never raises; errors are returned in the record."""
+    from services.parse_pdf import extract_text_from_pdf
+    from services.parse_docx import extract_text_from_docx
+    from services.clauses import clauses_from_pages
+    from services.severity import analyze_clauses
+
+    path, rel = task
+    record = {"path": rel, "status": "ok"}
+    stages = dict.fromkeys(STAGES, 0.0)
+    try:
+        t = perf_counter()
+        extract = extract_text_from_docx if path.lower().endswith(".docx") else extract_text_from_pdf
+        pages = extract(Path(path))
+        stages["extract"] = perf_counter() - t
+
+        t = perf_counter()
+        clauses = clauses_from_pages(pages)
+        stages["split"] = perf_counter() - t
+
+        t = perf_counter()
+        analyzed = analyze_clauses(clauses)
+        stages["score"] = perf_counter() - t
+
+        summary = Counter(c["risk_level"] for c in analyzed)
+        record.update({
+            "pages": len(pages),
+            "clauses_count": len(analyzed),
+            "summary": {lvl: summary.get(lvl, 0) for lvl in ("GREEN", "YELLOW", "RED")},
+            "clauses": analyzed,
+        })
+    except Exception as e:
+        record.update({"status": "error", "error": f"{type(e).__name__}: {e}"})
+    record["stage_seconds"] = {k: round(v, 6) for k, v in stages.items()}
+    return record
+
+
+class ShardWriter:
+    """Appends JSON lines to results-NNNNN.jsonl, starting a new shard every `shard_size` records."""
+
+    def __init__(self, out_dir: Path, shard_size: int):
+        self.out_dir = out_dir
+        self.shard_size = max(1, shard_size)
+        existing = sorted(out_dir.glob("results-*.jsonl"))
+        # Never append to a shard from an earlier (possibly interrupted) run
+        self.index = int(existing[-1].stem.split("-")[1]) + 1 if existing else 0
+        self.count = 0
+        self._fh = None
+
+    def write(self, record: dict) -> str:
+        if self._fh is None or self.count >= self.shard_size:
+            self._rotate()
+        self._fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._fh.flush()
+        self.count += 1
+        return Path(self._fh.name).name
+
+    def _rotate(self) -> None:
+        self.close()
+        self._fh = open(self.out_dir / f"results-{self.index:05d}.jsonl", "w", encoding="utf-8")
+        self.index += 1
+        self.count = 0
+
+    def sync(self) -> None:
+        if self._fh is not None:
+            os.fsync(self._fh.fileno())
+
+    def close(self) -> None:
+        if self._fh is not None:
+            self.sync()
+            self._fh.close()
+            self._fh = None
+
+
+def load_checkpoint(path: Path) -> set[str]:
+    if not path.exists():
+        return set()
+    return {line.rstrip("\n") for line in path.read_text(encoding="utf-8").splitlines() if line.strip()}
+
+
+def run(input_dir: Path, out_dir: Path, workers: int, shard_size: int, pattern: str,
+        chunksize: int, sync_every: int, limit: int | None = None) -> dict:
+    out_dir.mkdir(parents=True, exist_ok=True)
+    checkpoint_path = out_dir / "done.txt"
+    done = load_checkpoint(checkpoint_path)
+
+    files = sorted(p for p in input_dir.glob(pattern) if p.is_file())
+    todo = [(str(p), p.relative_to(input_dir).as_posix()) for p in files]
+    todo = [t for t in todo if t[1] not in done]
+    if limit is not None:
+        todo = todo[:limit]
+    print(f"{len(files)} PDFs found, {len(done)} already done, {len(todo)} to process with {workers} workers")
+
+    totals = {"docs": 0, "ok": 0, "failed": 0, "pages": 0, "clauses": 0}
+    stage_totals = dict.fromkeys(STAGES, 0.0)
+    risk = Counter()
+    writer = ShardWriter(out_dir, shard_size)
+    started = perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool, \
+                open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+            for record in pool.map(analyze_file, todo, chunksize=chunksize):
+                writer.write(record)
+                checkpoint.write(record["path"] + "\n")
+                checkpoint.flush()
+                totals["docs"] += 1
+                if record["status"] == "ok":
+                    totals["ok"] += 1
+                    totals["pages"] += record["pages"]
+                    totals["clauses"] += record["clauses_count"]
+                    risk.update(record["summary"])
+                else:
+                    totals["failed"] += 1
+                    print(f"failed: {record['path']}: {record['error']}", file=sys.stderr)
+                for k, v in record["stage_seconds"].items():
+                    stage_totals[k] += v
+                if totals["docs"] % sync_every == 0:
+                    writer.sync()
+                    os.fsync(checkpoint.fileno())
+                    elapsed = perf_counter() - started
+                    print(f"  {totals['docs']}/{len(todo)} docs, {totals['docs'] / elapsed:.1f} docs/s")
+    finally:
+        writer.close()
+
+    wall = perf_counter() - started
+    report = {
+        "finished_at": datetime.now(timezone.utc).isoformat(),
+        "input_dir": str(input_dir),
+        "workers": workers,
+        **totals,
+        "risk_summary": {lvl: risk.get(lvl, 0) for lvl in ("GREEN", "YELLOW", "RED")},
+        "wall_seconds": round(wall, 3),
+        "docs_per_second": round(totals["docs"] / wall, 3) if wall else 0.0,
+        "clauses_per_second": round(totals["clauses"] / wall, 3) if wall else 0.0,
+        # Summed over workers (CPU-side time), and per document
+        "stage_seconds": {k: round(v, 3) for k, v in stage_totals.items()},
+        "stage_ms_per_doc": {k: round(v * 1000 / totals["docs"], 2) if totals["docs"] else 0.0
+                             for k, v in stage_totals.items()},
+    }
+    (out_dir / "report.json").write_text(json.dumps(report, indent=2), encoding="utf-8")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze a directory of PDFs offline")
+    parser.add_argument("input_dir", type=Path)
+    parser.add_argument("--out", type=Path, default=Path("storage/batch"), help="output directory (shards, checkpoint, report)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--shard-size", type=int, default=1000, help="documents per JSONL shard")
+    parser.add_argument("--glob", default="**/*.pdf", help="file pattern under input_dir (e.g. '**/*.docx')")
+    parser.add_argument("--chunksize", type=int, default=4, help="documents handed to a worker at a time")
+    parser.add_argument("--sync-every", type=int, default=50, help="fsync and print progress every N documents")
+    parser.add_argument("--limit", type=int, default=None, help="process at most N new documents")
+    args = parser.parse_args()
+
+    if not args.input_dir.is_dir():
+        parser.error(f"{args.input_dir} is not a directory")
+    report = run(args.input_dir, args.out, max(1, args.workers), args.shard_size, args.glob,
+                 max(1, args.chunksize), max(1, args.sync_every), args.limit)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
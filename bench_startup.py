@@ -0,0 +1,117 @@
+"""
+Cold-start benchmark: how long `import app` takes, and how long a fresh
+uvicorn process takes to answer /health (live) and /ready (warmed up).
+
+    python bench_startup.py --runs 5 --top 15
+
+Each import run is a new interpreter, so nothing is cached in memory between
+runs (the OS file cache still is: the first run is usually the slowest).
+`--top` lists the slowest top-level imports from `python -X importtime`.
+The server runs are skipped with --no-server. The report is printed as JSON.
+"""
+import sys
+import json
+import socket
+import argparse
+import subprocess
+import statistics
+import urllib.request
+import urllib.error
+from pathlib import Path
+from time import perf_counter, sleep
+
+ROOT = Path(__file__).resolve().parent
+_IMPORT_SNIPPET = "import time; t = time.perf_counter(); import app; print(time.perf_counter() - t)"
+
+
+def _summary(values: list[float]) -> dict:
+    return {"runs": len(values), "min": round(min(values), 3), "median": round(statistics.median(values), 3),
+            "max": round(max(values), 3)}
+
+
+def import_times(runs: int) -> dict:
+    values = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", _IMPORT_SNIPPET], cwd=ROOT, capture_output=True,
+                             text=True, check=True)
+        values.append(float(out.stdout.strip().splitlines()[-1]))
+    return _summary(values)
+
+
+def slowest_imports(top: int) -> list[dict]:
+    """Cumulative time of the app's direct imports, slowest first."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=ROOT,
+                         capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Two spaces of indentation = imported directly by app.py
+        if name.startswith("   ") and not name.startswith("     ") and cumulative.strip().isdigit():
+            rows.append({"module": name.strip(), "seconds": int(cumulative) / 1e6})
+    return sorted(rows, key=lambda r: r["seconds"], reverse=True)[:top]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _status(url: str) -> int | None:
+    try:
+        with urllib.request.urlopen(url, timeout=1) as resp:
+            return resp.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None
+
+
+def server_startup(timeout: float) -> dict:
+    """Seconds from spawning uvicorn until /health and /ready return 200."""
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    start = perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+                            cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    result = {"live_seconds": None, "ready_seconds": None}
+    try:
+        while perf_counter() - start < timeout and proc.poll() is None:
+            if result["live_seconds"] is None and _status(base + "/health") == 200:
+                result["live_seconds"] = round(perf_counter() - start, 3)
+            if result["live_seconds"] is not None and _status(base + "/ready") == 200:
+                result["ready_seconds"] = round(perf_counter() - start, 3)
+                break
+            sleep(0.02)
+        if result["live_seconds"] is not None:
+            with urllib.request.urlopen(base + "/ready", timeout=2) as resp:
+                result["ready"] = json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        # Still not ready at the timeout: report which step is missing
+        result["ready"] = json.loads(e.read() or b"{}")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure app import time and server startup/readiness time")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to time `import app` in")
+    parser.add_argument("--top", type=int, default=10, help="slowest direct imports to list (0 to skip)")
+    parser.add_argument("--no-server", action="store_true", help="skip the uvicorn startup measurement")
+    parser.add_argument("--timeout", type=float, default=60.0, help="give up waiting for /ready after this many seconds")
+    args = parser.parse_args()
+
+    report = {"python": sys.version.split()[0], "import_app_seconds": import_times(max(1, args.runs))}
+    if args.top > 0:
+        report["slowest_imports"] = slowest_imports(args.top)
+    if not args.no_server:
+        report["server"] = server_startup(args.timeout)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
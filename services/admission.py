@@ -0,0 +1,200 @@
+"""
+Admission control for the expensive endpoints.
+
+Each endpoint class (upload, parse, analyze, query, query_llm) has a global
+concurrency limit and a per-user one, per worker process. A request over either
+limit waits in a bounded FIFO queue for up to ADMISSION_MAX_WAIT_SECONDS. It is
+turned away at once with a 429 and a Retry-After (estimated from recent service
+times) when the queue is full, when the user already has as many requests
+waiting as they may run, or when the wait runs out. So one client hammering an
+endpoint mostly gets 429s rather than slowing everyone else down.
+
+The "user" is the client address, not the `uid` parameter or X-User-Id header:
+those are chosen by the client, so a script could send a fresh uid on every
+call and never hit its limit. Behind a reverse proxy run uvicorn with
+--proxy-headers (and --forwarded-allow-ips) so this is the real client
+address. Limits are ADMISSION_<CLASS>_CONCURRENCY / _PER_USER / _QUEUE;
+a concurrency of 0 (or ADMISSION_ENABLED=0) turns the limit off.
+
+Endpoints opt in with `dependencies=[Depends(admit("parse"))]`. The slot is held
+until the response has been sent, including streamed bodies.
+"""
+import os
+import math
+import asyncio
+from collections import deque
+from time import perf_counter
+from fastapi import HTTPException, Request
+from loguru import logger
+from dotenv import load_dotenv
+
+from services.metrics import inc, observe, set_gauge
+
+load_dotenv()
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") != "0"
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "10"))
+
+# class -> (global concurrency, per user, queue size)
+_DEFAULTS = {
+    "upload": (16, 4, 32),
+    "parse": (4, 2, 16),
+    "analyze": (4, 2, 16),
+    "query": (32, 8, 64),
+    "query_llm": (16, 2, 32),
+}
+
+
+def _limits(endpoint: str) -> tuple[int, int, int]:
+    concurrency, per_user, queue = _DEFAULTS[endpoint]
+    prefix = f"ADMISSION_{endpoint.upper()}_"
+    return (int(os.getenv(prefix + "CONCURRENCY", str(concurrency))),
+            int(os.getenv(prefix + "PER_USER", str(per_user))),
+            int(os.getenv(prefix + "QUEUE", str(queue))))
+
+
+class Rejected(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Gate:
+    """Concurrency limit with a bounded wait queue. Used from the event loop only, so no locking."""
+
+    def __init__(self, name: str, limit: int, per_user: int, queue_size: int,
+                 max_wait: float = ADMISSION_MAX_WAIT_SECONDS):
+        self.name = name
+        self.limit = max(1, limit)
+        self.per_user = max(1, min(per_user, self.limit))
+        self.queue_size = max(0, queue_size)
+        self.max_wait = max_wait
+        self.active = 0
+        self.active_by_user: dict[str, int] = {}
+        self.waiting: deque[tuple[str, asyncio.Future]] = deque()
+        self.waiting_by_user: dict[str, int] = {}
+        # Moving average of how long a slot is held, for Retry-After
+        self.avg_hold = 1.0
+
+    def _can_run(self, user: str) -> bool:
+        return self.active < self.limit and self.active_by_user.get(user, 0) < self.per_user
+
+    def _start(self, user: str) -> None:
+        self.active += 1
+        self.active_by_user[user] = self.active_by_user.get(user, 0) + 1
+
+    def _unqueue(self, entry: tuple[str, asyncio.Future]) -> None:
+        try:
+            self.waiting.remove(entry)
+        except ValueError:
+            return
+        user = entry[0]
+        self.waiting_by_user[user] -= 1
+        if not self.waiting_by_user[user]:
+            del self.waiting_by_user[user]
+
+    def retry_after(self, reason: str) -> int:
+        if reason == "user_limit":
+            # Frees up when one of the user's own requests finishes
+            return max(1, math.ceil(self.avg_hold))
+        return max(1, math.ceil(self.avg_hold * (len(self.waiting) + 1) / self.limit))
+
+    async def acquire(self, user: str) -> float:
+        """Take a slot, waiting if needed. Returns the seconds waited; raises Rejected."""
+        # Waiters that could run are admitted on every release, so anyone still
+        # queued is blocked by a limit that a runnable caller doesn't jump
+        if self._can_run(user):
+            self._start(user)
+            self._gauges()
+            return 0.0
+        if self.waiting_by_user.get(user, 0) >= self.per_user:
+            raise Rejected("user_limit", self.retry_after("user_limit"))
+        if len(self.waiting) >= self.queue_size:
+            raise Rejected("queue_full", self.retry_after("queue_full"))
+
+        entry = (user, asyncio.get_running_loop().create_future())
+        self.waiting.append(entry)
+        self.waiting_by_user[user] = self.waiting_by_user.get(user, 0) + 1
+        self._gauges()
+        start = perf_counter()
+        try:
+            await asyncio.wait_for(entry[1], self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if entry[1].done() and not entry[1].cancelled():
+                # Admitted just as the wait ended: hand the slot on
+                self.release(user)
+            else:
+                self._unqueue(entry)
+                self._gauges()
+            if isinstance(e, asyncio.TimeoutError):
+                raise Rejected("timeout", self.retry_after("timeout")) from None
+            raise
+        return perf_counter() - start
+
+    def release(self, user: str, held: float | None = None) -> None:
+        self.active -= 1
+        self.active_by_user[user] -= 1
+        if not self.active_by_user[user]:
+            del self.active_by_user[user]
+        if held is not None:
+            self.avg_hold = 0.8 * self.avg_hold + 0.2 * held
+        for entry in list(self.waiting):
+            if self.active >= self.limit:
+                break
+            waiter, future = entry
+            if not future.done() and self.active_by_user.get(waiter, 0) < self.per_user:
+                self._unqueue(entry)
+                self._start(waiter)
+                future.set_result(None)
+        self._gauges()
+
+    def _gauges(self) -> None:
+        set_gauge("clauseclear_admission_in_flight", self.active, endpoint=self.name)
+        set_gauge("clauseclear_admission_queued", len(self.waiting), endpoint=self.name)
+
+    def snapshot(self) -> dict:
+        return {"limit": self.limit, "per_user": self.per_user, "queue_size": self.queue_size,
+                "in_flight": self.active, "queued": len(self.waiting), "avg_hold_seconds": round(self.avg_hold, 3)}
+
+
+gates: dict[str, Gate] = {}
+for _name in _DEFAULTS:
+    _limit, _per_user, _queue = _limits(_name)
+    if ADMISSION_ENABLED and _limit > 0:
+        gates[_name] = Gate(_name, _limit, _per_user, _queue)
+
+
+def request_user(request: Request) -> str:
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+def admit(endpoint: str):
+    """FastAPI dependency holding a slot of `endpoint`'s class for the whole request."""
+    gate = gates.get(endpoint)
+
+    async def dependency(request: Request):
+        if gate is None:
+            yield
+            return
+        user = request_user(request)
+        try:
+            waited = await gate.acquire(user)
+        except Rejected as e:
+            inc("clauseclear_admission_total", endpoint=endpoint, result=e.reason)
+            logger.warning(f"admission_rejected endpoint={endpoint} user={user} reason={e.reason} "
+                           f"retry_after={e.retry_after}")
+            raise HTTPException(status_code=429, detail=f"too many concurrent {endpoint} requests ({e.reason})",
+                                headers={"Retry-After": str(e.retry_after)})
+        observe("clauseclear_admission_wait_seconds", waited, endpoint=endpoint)
+        inc("clauseclear_admission_total", endpoint=endpoint, result="queued" if waited else "admitted")
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            gate.release(user, perf_counter() - start)
+
+    return dependency
+
+
+def snapshot() -> dict:
+    return {name: gate.snapshot() for name, gate in gates.items()}
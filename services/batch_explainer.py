@@ -0,0 +1,230 @@
+"""
+Analyze-time explanations for risky clauses.
+
+After /analyze scores a job, the RED and YELLOW clauses are explained ahead of
+time: several clauses go into each Gemini prompt, which asks for a JSON object
+of clause id -> explanation. Batches run concurrently under a small concurrency
+cap and a requests-per-minute limit, through the same connection pool, global
+concurrency limit and circuit breaker as /query_llm.
+
+Results are stored next to the analysis as <job dir>/explanations.json.
+Each entry carries a hash of the clause text, risk level and reasons, so an
+explanation is only served for the exact clause it was written for.
+"""
+import os
+import re
+import json
+import asyncio
+import hashlib
+from pathlib import Path
+from time import monotonic
+from datetime import datetime, timezone
+from loguru import logger
+from dotenv import load_dotenv
+
+from services.db import get_db
+from services.metrics import start_request_timer
+from services.write_behind import write_buffer
+from services.storage import job_dir, atomic_write_json
+from services.prompt_builder import estimate_tokens
+from services.lifecycle import record_artifacts
+from services.llm_explainer import call_gemini_async, breaker, answer_from_response, truncate_answer
+
+load_dotenv()
+ANALYZE_PRECOMPUTE_EXPLANATIONS = os.getenv("ANALYZE_PRECOMPUTE_EXPLANATIONS", "0") == "1"
+EXPLAIN_BATCH_SIZE = int(os.getenv("EXPLAIN_BATCH_SIZE", "5"))
+EXPLAIN_BATCH_CONCURRENCY = int(os.getenv("EXPLAIN_BATCH_CONCURRENCY", "2"))
+EXPLAIN_RPM = int(os.getenv("EXPLAIN_RPM", "30"))
+# Upper bound on clauses explained per job (RED first, then YELLOW, by score)
+EXPLAIN_MAX_CLAUSES = int(os.getenv("EXPLAIN_MAX_CLAUSES", "30"))
+
+EXPLANATIONS_FILE = "explanations.json"
+RISKY_LEVELS = ("RED", "YELLOW")
+
+BATCH_INSTRUCTION = """You are explaining risky terms in a rental agreement to a tenant in simple, everyday language.
+
+For each clause below, write 2-3 short sentences that say what it means for the tenant in practice and why they should be careful. YELLOW means be careful, RED means risky.
+
+IMPORTANT RULES:
+- Use ONLY the clause text and the listed reasons. Don't add anything extra.
+- Use simple, everyday words. No legal jargon, no clause numbers, no emojis.
+- Don't copy the legal text word-for-word - explain what it MEANS.
+
+Reply with a single JSON object that maps each clause ID to its explanation, for example {"c3": "..."}. Include every ID exactly once."""
+
+BATCH_PROMPT_VERSION = f"batch1-{hashlib.sha256(BATCH_INSTRUCTION.encode('utf-8')).hexdigest()[:8]}"
+
+
+def clause_hash(clause: dict) -> str:
+    """Identity of a clause as far as its explanation is concerned."""
+    material = [clause.get("text", ""), clause.get("risk_level", "UNKNOWN"), list(clause.get("reasons", []))]
+    return hashlib.sha256(json.dumps(material, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+
+def build_batch_prompt(clauses: list[dict]) -> str:
+    blocks = []
+    for c in clauses:
+        reasons = "; ".join(c.get("reasons", [])) or "No specific issues identified"
+        blocks.append(
+            f"ID: {c.get('id')}\n"
+            f"Text: {c.get('text', '')}\n"
+            f"Risk Level: {c.get('risk_level', 'UNKNOWN')}\n"
+            f"Reasons: {reasons}"
+        )
+    return f"{BATCH_INSTRUCTION}\n\n---\n\n" + "\n\n".join(blocks)
+
+
+def _parse_batch(text: str) -> dict:
+    # Tolerate a ```json fence even though the response MIME type asks for bare JSON
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", text.strip())
+    data = json.loads(text)
+    if not isinstance(data, dict):
+        raise ValueError("batch response is not a JSON object")
+    return {str(k): v.strip() for k, v in data.items() if isinstance(v, str) and v.strip()}
+
+
+class RateLimiter:
+    """Spaces call starts so no more than `per_minute` begin in any minute."""
+
+    def __init__(self, per_minute: int):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def select_risky(analyzed: list[dict], limit: int = EXPLAIN_MAX_CLAUSES) -> list[dict]:
+    """RED before YELLOW, highest score first, capped at `limit`."""
+    risky = [c for c in analyzed if c.get("risk_level") in RISKY_LEVELS]
+    risky.sort(key=lambda c: (RISKY_LEVELS.index(c["risk_level"]), -float(c.get("risk_score", 0.0))))
+    return risky[:limit]
+
+
+def explanations_path(job_id: str) -> Path:
+    return job_dir(job_id) / EXPLANATIONS_FILE
+
+
+def load_explanations(job_id: str) -> dict:
+    """clause_id -> entry for the current prompt version; {} if none were precomputed."""
+    path = explanations_path(job_id)
+    if not path.exists():
+        return {}
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"explanations_unreadable job_id={job_id} err={e}")
+        return {}
+    if data.get("prompt_version") != BATCH_PROMPT_VERSION:
+        return {}
+    return data.get("explanations", {})
+
+
+def stored_explanation(job_id: str, match: dict) -> str | None:
+    """The precomputed explanation for this match, if it was written for exactly this clause."""
+    if match.get("risk_level") not in RISKY_LEVELS:
+        return None
+    entry = load_explanations(job_id).get(str(match.get("id")))
+    if entry and entry.get("text_hash") == clause_hash(match):
+        return entry.get("explanation")
+    return None
+
+
+def _save_explanations(job_id: str, stored: dict) -> None:
+    path = explanations_path(job_id)
+    if not path.parent.exists():
+        return  # job deleted meanwhile
+    atomic_write_json(path, {
+        "job_id": job_id,
+        "prompt_version": BATCH_PROMPT_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "explanations": stored,
+    })
+    record_artifacts(job_id)
+
+
+async def _explain_batch(api_key: str, batch: list[dict], limiter: RateLimiter,
+                         slots: asyncio.Semaphore) -> tuple[dict, int]:
+    async with slots:
+        await limiter.wait()
+        if not breaker.allow():
+            logger.info(f"explain_batch_skipped reason=circuit_open clauses={len(batch)}")
+            return {}, 0
+        prompt = build_batch_prompt(batch)
+        result = await call_gemini_async(api_key, prompt,
+                                         generation_config={"responseMimeType": "application/json"})
+    if result is None:
+        return {}, 0
+    text, usage = answer_from_response(result, estimate_tokens(prompt))
+    try:
+        answers = _parse_batch(text or "")
+    except (json.JSONDecodeError, ValueError) as e:
+        logger.warning(f"explain_batch_unparseable clauses={len(batch)} err={e}")
+        return {}, usage["total_tokens"]
+    wanted = {str(c.get("id")) for c in batch}
+    return {cid: truncate_answer(text) for cid, text in answers.items() if cid in wanted}, usage["total_tokens"]
+
+
+async def precompute_explanations(job_id: str, analyzed: list[dict]) -> dict:
+    """
+    Explain the job's risky clauses in batches and store them in explanations.json.
+    Clauses that already have an up-to-date explanation are not sent again.
+    Returns a small report; never raises on Gemini failures (clauses are just left out).
+    """
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        logger.warning("GEMINI_API_KEY not set, skipping explanation precompute")
+        return {"job_id": job_id, "explained": 0, "skipped": "no_api_key"}
+
+    timer = start_request_timer()
+    risky = select_risky(analyzed)
+    existing = await asyncio.to_thread(load_explanations, job_id)
+    stored = {}
+    todo = []
+    for c in risky:
+        entry = existing.get(str(c.get("id")))
+        if entry and entry.get("text_hash") == clause_hash(c):
+            stored[str(c.get("id"))] = entry
+        else:
+            todo.append(c)
+
+    limiter = RateLimiter(EXPLAIN_RPM)
+    slots = asyncio.Semaphore(max(1, EXPLAIN_BATCH_CONCURRENCY))
+    size = max(1, EXPLAIN_BATCH_SIZE)
+    batches = [todo[i:i + size] for i in range(0, len(todo), size)]
+    results = await asyncio.gather(*(_explain_batch(api_key, b, limiter, slots) for b in batches))
+
+    tokens = 0
+    by_id = {str(c.get("id")): c for c in todo}
+    for answers, used in results:
+        tokens += used
+        for cid, explanation in answers.items():
+            c = by_id[cid]
+            stored[cid] = {"explanation": explanation, "risk_level": c.get("risk_level"),
+                           "text_hash": clause_hash(c)}
+
+    await asyncio.to_thread(_save_explanations, job_id, stored)
+
+    explained = len(stored) - (len(risky) - len(todo))
+    logger.info(f"explain_precompute_ok job_id={job_id} risky={len(risky)} reused={len(risky) - len(todo)} "
+                f"explained={explained} missing={len(todo) - explained} batches={len(batches)} tokens={tokens}")
+
+    if get_db() is not None and batches:
+        write_buffer.enqueue("analytics", {
+            "job_id": job_id,
+            "latency_ms": timer.elapsed_ms(),
+            "stages_ms": timer.breakdown(),
+            "tokens_used": tokens,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "type": "explain_precompute",
+        })
+    return {"job_id": job_id, "explained": explained, "reused": len(risky) - len(todo),
+            "missing": len(todo) - explained, "tokens_used": tokens}
@@ -0,0 +1,154 @@
+"""
+Helpers for bulk (portfolio) analysis: unpacking uploads into documents,
+per-document summaries and the portfolio aggregate.
+"""
+import io
+import os
+import zlib
+import zipfile
+from collections import Counter
+from pathlib import PurePosixPath
+from dotenv import load_dotenv
+
+load_dotenv()
+BULK_MAX_FILES = int(os.getenv("BULK_MAX_FILES", "50"))
+BULK_MAX_TOTAL_MB = int(os.getenv("BULK_MAX_TOTAL_MB", "200"))
+BULK_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", "4"))
+TOP_RISKY_PER_DOC = 3
+_CHUNK = 1024 * 1024
+# Raised by zipfile for a damaged, encrypted or oddly compressed member
+_MEMBER_ERRORS = (zipfile.BadZipFile, zlib.error, EOFError, RuntimeError, NotImplementedError, OSError)
+
+
+class BulkInputError(ValueError):
+    """The bulk upload as a whole is unusable (too many files, too large, bad zip)."""
+
+
+def _too_large() -> BulkInputError:
+    return BulkInputError(f"bulk upload exceeds {BULK_MAX_TOTAL_MB} MB")
+
+
+async def read_uploads(files) -> list[tuple[str, bytes]]:
+    """
+    Read FastAPI UploadFiles into (filename, bytes) pairs, in chunks, failing
+    as soon as together they pass BULK_MAX_TOTAL_MB.
+    """
+    if len(files) > BULK_MAX_FILES:
+        raise BulkInputError(f"at most {BULK_MAX_FILES} documents per bulk upload")
+    budget = BULK_MAX_TOTAL_MB * 1024 * 1024
+    used = 0
+    uploads = []
+    for f in files:
+        data = bytearray()
+        while chunk := await f.read(_CHUNK):
+            used += len(chunk)
+            if used > budget:
+                raise _too_large()
+            data += chunk
+        uploads.append((f.filename or "document", bytes(data)))
+    return uploads
+
+
+def _read_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo, room: int) -> bytes:
+    """Inflate one zip member, counting the bytes actually produced against `room`."""
+    data = bytearray()
+    with archive.open(info) as member:
+        while chunk := member.read(_CHUNK):
+            if len(data) + len(chunk) > room:
+                raise _too_large()
+            data += chunk
+    return bytes(data)
+
+
+def expand_uploads(files: list[tuple[str, bytes]], allowed: set[str]) -> tuple[list[tuple[str, bytes]], list[dict]]:
+    """
+    Turn uploaded (filename, bytes) pairs into documents. Zip archives are
+    unpacked; only members with an allowed extension are kept. Enforces the
+    file-count and total-size limits, counting uncompressed zip sizes.
+    Returns (documents, errors): a zip member that can't be read (bad CRC,
+    corrupt data, encrypted) becomes an error result instead of failing the
+    whole upload.
+    """
+    docs: list[tuple[str, bytes]] = []
+    errors: list[dict] = []
+    budget = BULK_MAX_TOTAL_MB * 1024 * 1024
+    used = 0
+
+    def add(name: str, data: bytes):
+        nonlocal used
+        used += len(data)
+        if used > budget:
+            raise _too_large()
+        docs.append((name, data))
+        if len(docs) > BULK_MAX_FILES:
+            raise BulkInputError(f"at most {BULK_MAX_FILES} documents per bulk upload")
+
+    for filename, raw in files:
+        if filename.lower().endswith(".zip"):
+            try:
+                archive = zipfile.ZipFile(io.BytesIO(raw))
+            except zipfile.BadZipFile:
+                raise BulkInputError(f"{filename} is not a valid zip archive")
+            with archive:
+                for info in archive.infolist():
+                    name = PurePosixPath(info.filename)
+                    if info.is_dir() or name.parts[0] == "__MACOSX" or name.name.startswith("."):
+                        continue
+                    if name.suffix.lower().lstrip(".") not in allowed:
+                        continue
+                    # Check the declared size before inflating anything
+                    if used + info.file_size > budget:
+                        raise _too_large()
+                    try:
+                        data = _read_member(archive, info, budget - used)
+                    except _MEMBER_ERRORS as e:
+                        errors.append({"filename": name.name, "job_id": None, "status": "error",
+                                       "error": f"unreadable in {filename}: {e}"})
+                        continue
+                    add(name.name, data)
+        else:
+            add(filename, raw)
+    return docs, errors
+
+
+def summarize_document(filename: str, job_id: str, analysis: dict) -> dict:
+    """Per-document line: risk counts and the top risky clauses (RED first)."""
+    clauses = analysis["clauses"]
+    top = (clauses["red"] + clauses["yellow"])[:TOP_RISKY_PER_DOC]
+    return {
+        "filename": filename,
+        "job_id": job_id,
+        "status": "ok",
+        "total_clauses": analysis["total_clauses"],
+        "summary": analysis["summary"],
+        "top_risky_clauses": [
+            {"clause_id": c["clause_id"], "page": c["page"], "risk_level": c["risk_level"],
+             "text": c["text"], "reasons": c["reasons"]}
+            for c in top
+        ],
+    }
+
+
+def aggregate(results: list[dict], elapsed_s: float) -> dict:
+    """Portfolio-level totals over all per-document results."""
+    ok = [r for r in results if r["status"] == "ok"]
+    totals = Counter()
+    reasons = Counter()
+    for r in ok:
+        totals.update(r["summary"])
+        for c in r["top_risky_clauses"]:
+            reasons.update(c["reasons"])
+    riskiest = sorted(ok, key=lambda r: (r["summary"].get("RED", 0), r["summary"].get("YELLOW", 0)), reverse=True)
+    return {
+        "documents": len(results),
+        "succeeded": len(ok),
+        "failed": len(results) - len(ok),
+        "summary": {lvl: totals.get(lvl, 0) for lvl in ("GREEN", "YELLOW", "RED")},
+        "documents_with_red": sum(1 for r in ok if r["summary"].get("RED", 0)),
+        "riskiest_documents": [
+            {"filename": r["filename"], "job_id": r["job_id"], "summary": r["summary"]}
+            for r in riskiest[:5] if r["summary"].get("RED", 0) or r["summary"].get("YELLOW", 0)
+        ],
+        "common_reasons": [{"reason": reason, "count": n} for reason, n in reasons.most_common(5)],
+        "elapsed_s": round(elapsed_s, 3),
+    }
@@ -0,0 +1,102 @@
+"""
+Precomputed answers for the standard question set.
+
+knowledge/canonical_questions.json lists the questions the frontend asks most
+(deposit, rent, notice, lock-in, late fee, termination) with their aliases. They
+are answered once at analyze time and stored per job in canonical_answers.json.
+/query/{job_id} normalises the incoming query and looks it up in a dict built at
+import time; a hit serves the stored matches, anything else goes to live retrieval.
+
+Stored answers record the clauses.json mtime they were computed from and are
+ignored once the document has been re-parsed.
+"""
+import re
+import json
+import hashlib
+from pathlib import Path
+from datetime import datetime, timezone
+from loguru import logger
+
+from services.kb_loader import load_canonical_questions
+from services.storage import job_dir, atomic_write_json
+
+ANSWERS_FILE = "canonical_answers.json"
+
+_config = load_canonical_questions()
+QUESTIONS = {q["id"]: q for q in _config["questions"]}
+TOP_K = int(_config.get("top_k", 5))
+# Changes to the question set invalidate stored answers
+VERSION = f"{_config.get('version', '1')}-" \
+          f"{hashlib.sha256(json.dumps(_config, sort_keys=True).encode('utf-8')).hexdigest()[:8]}"
+_PREFIXES = sorted((p.lower() for p in _config.get("strip_prefixes", [])), key=len, reverse=True)
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, punctuation to spaces, collapse whitespace, drop a leading 'what is the' etc."""
+    norm = " ".join(re.sub(r"[^a-z0-9]+", " ", query.lower()).split())
+    for prefix in _PREFIXES:
+        if norm.startswith(prefix + " "):
+            return norm[len(prefix) + 1:]
+    return norm
+
+
+def _build_lookup() -> dict[str, str]:
+    lookup = {}
+    for qid, q in QUESTIONS.items():
+        for phrase in [q["query"], *q.get("aliases", [])]:
+            key = normalize_query(phrase)
+            if key in lookup and lookup[key] != qid:
+                logger.warning(f"canonical_alias_conflict phrase={phrase!r} ids={lookup[key]},{qid}")
+                continue
+            lookup[key] = qid
+    return lookup
+
+
+LOOKUP = _build_lookup()
+
+
+def match_question(query: str) -> str | None:
+    """Canonical question id for this query, or None."""
+    return LOOKUP.get(normalize_query(query))
+
+
+def answers_path(job_id: str) -> Path:
+    return job_dir(job_id) / ANSWERS_FILE
+
+
+def _clauses_mtime(job_id: str) -> int | None:
+    try:
+        return (job_dir(job_id) / "clauses.json").stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def save_answers(job_id: str, answers: dict[str, dict]) -> None:
+    """Store {answer, matches} (top-TOP_K matches) for each canonical question id."""
+    atomic_write_json(answers_path(job_id), {
+        "job_id": job_id,
+        "version": VERSION,
+        "top_k": TOP_K,
+        "clauses_mtime_ns": _clauses_mtime(job_id),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "answers": {qid: {"query": QUESTIONS[qid]["query"], **entry} for qid, entry in answers.items()},
+    })
+
+
+def stored_matches(job_id: str, query: str, top_k: int) -> list[dict] | None:
+    """Precomputed matches for a canonical query, or None if live retrieval is needed."""
+    qid = match_question(query)
+    if qid is None or top_k > TOP_K:
+        return None
+    path = answers_path(job_id)
+    if not path.exists():
+        return None
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"canonical_answers_unreadable job_id={job_id} err={e}")
+        return None
+    if data.get("version") != VERSION or data.get("clauses_mtime_ns") != _clauses_mtime(job_id):
+        return None
+    entry = data.get("answers", {}).get(qid)
+    return entry["matches"][:top_k] if entry else None
@@ -0,0 +1,140 @@
+"""
+Rolling-window circuit breaker.
+
+CLOSED: calls go through; outcomes (ok / error / timeout / slow) are recorded in a
+time window. When the failure rate over at least `min_calls` calls reaches
+`failure_rate`, the breaker OPENs and callers are answered immediately without
+touching the dependency. While OPEN a background probe (see `probe_loop`) checks
+the dependency every `probe_interval` seconds after `cooldown` and closes the
+breaker on success. If no probe loop is running, the first call after the
+cooldown is let through as a HALF_OPEN trial instead.
+"""
+import asyncio
+import threading
+from collections import deque
+from time import monotonic
+from loguru import logger
+
+from services.metrics import inc, set_gauge
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_rate: float = 0.5, min_calls: int = 10, window_seconds: float = 60.0,
+                 cooldown: float = 15.0, probe_interval: float = 5.0):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = max(1, min_calls)
+        self.window_seconds = window_seconds
+        self.cooldown = cooldown
+        self.probe_interval = probe_interval
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._outcomes: deque[tuple[float, bool]] = deque()
+        self._lock = threading.Lock()
+        self._trial_in_flight = False
+        self._probing = False
+        self.counts = {"ok": 0, "error": 0, "timeout": 0, "slow": 0, "rejected": 0, "opened": 0}
+        self._publish()
+
+    # --- call gating ---
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and not self._probing and monotonic() - self.opened_at >= self.cooldown \
+                    and not self._trial_in_flight:
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.counts["rejected"] += 1
+        inc("clauseclear_circuit_rejected_total", breaker=self.name)
+        return False
+
+    def cancel(self) -> None:
+        """An allowed call ended without reaching the dependency; free the half-open trial slot."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._trial_in_flight = False
+
+    def record(self, outcome: str) -> None:
+        """outcome: 'ok', 'error', 'timeout' or 'slow'."""
+        failed = outcome != "ok"
+        now = monotonic()
+        with self._lock:
+            self.counts[outcome] += 1
+            if self.state == HALF_OPEN:
+                self._trial_in_flight = False
+                self._outcomes.clear()
+                if failed:
+                    self._open(now)
+                else:
+                    self._set_state(CLOSED)
+                return
+            self._outcomes.append((now, failed))
+            while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+                self._outcomes.popleft()
+            total = len(self._outcomes)
+            failures = sum(1 for _, f in self._outcomes if f)
+            if self.state == CLOSED and total >= self.min_calls and failures / total >= self.failure_rate:
+                logger.warning(f"circuit_open breaker={self.name} failures={failures}/{total}")
+                self._open(now)
+
+    # --- background recovery ---
+
+    async def probe_loop(self, probe) -> None:
+        """Run forever: while OPEN and past the cooldown, await probe() -> bool and close on success."""
+        self._probing = True
+        try:
+            while True:
+                await asyncio.sleep(self.probe_interval)
+                with self._lock:
+                    due = self.state == OPEN and monotonic() - self.opened_at >= self.cooldown
+                if not due:
+                    continue
+                try:
+                    healthy = await probe()
+                except Exception as e:
+                    logger.warning(f"circuit_probe_error breaker={self.name} err={e}")
+                    healthy = False
+                with self._lock:
+                    if healthy:
+                        self._outcomes.clear()
+                        self._set_state(CLOSED)
+                        logger.info(f"circuit_closed breaker={self.name} via=probe")
+                    else:
+                        self.opened_at = monotonic()
+        finally:
+            self._probing = False
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            total = len(self._outcomes)
+            failures = sum(1 for _, f in self._outcomes if f)
+            return {
+                "name": self.name,
+                "state": self.state,
+                "window_calls": total,
+                "window_failure_rate": round(failures / total, 3) if total else 0.0,
+                "open_for_s": round(monotonic() - self.opened_at, 1) if self.state != CLOSED else 0.0,
+                "probing": self._probing,
+                "counts": dict(self.counts),
+            }
+
+    # --- internals (call with lock held) ---
+
+    def _open(self, now: float) -> None:
+        self.opened_at = now
+        self.counts["opened"] += 1
+        self._set_state(OPEN)
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        self._publish()
+
+    def _publish(self) -> None:
+        set_gauge("clauseclear_circuit_state", _STATE_VALUE[self.state], breaker=self.name)
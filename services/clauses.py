@@ -1,6 +1,9 @@
 import re
+import hashlib
 from loguru import logger
 
+from services.metrics import timed
+
 def split_into_clauses(text: str) -> list[str]:
     if not text.strip():
         return []
@@ -50,4 +53,31 @@ def split_into_clauses(text: str) -> list[str]:
             if any(term in cleaned.lower() for term in ['rent', 'deposit', 'advance', 'monthly']):
                 logger.debug(f"Clause created with key term: {cleaned[:100]}...")
     
-    return clauses
\ No newline at end of file
+    return clauses
+
+
+def content_hash(text: str) -> str:
+    """Hash of a clause's text, ignoring case and whitespace; used to spot unchanged clauses across revisions."""
+    norm = " ".join(text.lower().split())
+    return hashlib.sha256(norm.encode("utf-8")).hexdigest()[:16]
+
+
+def clause_content_hash(clause: dict) -> str:
+    # Jobs parsed before clause hashing have no "hash" field
+    return clause.get("hash") or content_hash(clause["text"])
+
+
+def clauses_from_pages(pages: list[str]) -> list[dict]:
+    """Split every page into clauses with stable ids (P<page>_C<n>) and content hashes, as stored in clauses.json."""
+    all_clauses = []
+    for page_num, text in enumerate(pages, start=1):
+        with timed("clause_split"):
+            clauses = split_into_clauses(text)
+        for i, clause in enumerate(clauses, start=1):
+            all_clauses.append({
+                "id": f"P{page_num:02d}_C{i:03d}",
+                "page": page_num,
+                "text": clause,
+                "hash": content_hash(clause),
+            })
+    return all_clauses
@@ -1,30 +1,241 @@
 import os
-import certifi
+import threading
 from dotenv import load_dotenv
-from pymongo import MongoClient
 from loguru import logger
 
+from services.facts import FACT_FIELDS
+
 load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
 DB_NAME = "clauseclear_db"
 
+# Connection pool settings (pymongo defaults are tuned for long-lived batch jobs,
+# not for a small API container talking to Atlas)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "20"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_ENSURE_INDEXES = os.getenv("MONGO_ENSURE_INDEXES", "1") != "0"
+
+# Same values as pymongo's; defined here so importing this module doesn't load the driver
+ASCENDING = 1
+DESCENDING = -1
+
+# Indexes backing the queries the app actually runs:
+#   uploads.find({"user_id"}).sort(created_at, _id desc)  -> /users/{uid}/history (keyset paged)
+#   uploads.update_one({"job_id"})                        -> /analyze/{job_id}/clauses
+#   qa_messages.find({"job_id"}).sort(created_at, _id)    -> /analyze/{job_id}/chat (keyset paged)
+#   users.find_one({"uid"}) / update_one({"uid"})         -> /users/*
+#   uploads.find({"user_id", "facts.<name>": range})
+#          .sort(created_at, _id desc)                    -> /users/{uid}/facts (keyset paged)
+# Compound keys follow equality, sort, range order, so the fact range is checked
+# on index keys while the index also delivers the sort order.
+INDEXES = {
+    "uploads": [
+        {"keys": [("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], "name": "user_id_created_at_id"},
+        {"keys": [("job_id", ASCENDING)], "name": "job_id_unique", "unique": True},
+        *({"keys": [("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING),
+                    (f"facts.{name}", ASCENDING)],
+           "name": f"user_id_created_at_id_facts_{name}"}
+          for name in FACT_FIELDS),
+    ],
+    "qa_messages": [
+        {"keys": [("job_id", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)], "name": "job_id_created_at_id"},
+    ],
+    "users": [
+        {"keys": [("uid", ASCENDING)], "name": "uid_unique", "unique": True},
+    ],
+    "analytics": [
+        {"keys": [("job_id", ASCENDING), ("created_at", ASCENDING)], "name": "job_id_created_at"},
+    ],
+}
+
+# Indexes an earlier version created under another name; dropped by ensure_indexes()
+LEGACY_INDEXES = {
+    "uploads": [
+        "user_id_created_at",  # now user_id_created_at_id
+        # (user_id, facts.<name>) couldn't serve the newest-first sort
+        *(f"user_id_facts_{name}" for name in FACT_FIELDS),
+    ],
+}
+
+# Projections for list views: keep heavy per-clause arrays out of responses
+HISTORY_PROJECTION = {"_id": 0, "risky_clauses": 0}
+CHAT_PROJECTION = {"_id": 0, "query": 1, "answer": 1, "answer_llm": 1, "created_at": 1}
+USER_PROJECTION = {"_id": 0}
+FACTS_PROJECTION = {"_id": 0, "job_id": 1, "filename": 1, "created_at": 1, "facts": 1, "fact_sources": 1}
+
+# (collection, filter, sort) for each hot query; used by check_query_plans()
+HOT_QUERIES = [
+    ("uploads", {"user_id": "__probe__"}, [("created_at", DESCENDING), ("_id", DESCENDING)]),
+    ("qa_messages", {"job_id": "__probe__"}, [("created_at", ASCENDING), ("_id", ASCENDING)]),
+    ("users", {"uid": "__probe__"}, None),
+    ("uploads", {"user_id": "__probe__", "facts.deposit_months": {"$gt": 0}},
+     [("created_at", DESCENDING), ("_id", DESCENDING)]),
+]
+
 client = None
 db = None
+_connect_lock = threading.Lock()
 
-def init_db():
+def connect():
+    """
+    Create the client on first use. Doesn't block: pymongo connects in the
+    background and the first operation waits for it. Returns None if the client
+    can't be created (e.g. a malformed MONGO_URI); endpoints using the DB will fail.
+    """
     global client, db
+    if db is not None:
+        return db
+    with _connect_lock:
+        if db is None:
+            try:
+                import certifi
+                from pymongo import MongoClient
+
+                client = MongoClient(
+                    MONGO_URI,
+                    tlsCAFile=certifi.where(),
+                    maxPoolSize=MONGO_MAX_POOL_SIZE,
+                    minPoolSize=MONGO_MIN_POOL_SIZE,
+                    maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+                    connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                )
+                db = client[DB_NAME]
+            except Exception as e:
+                logger.error(f"Failed to create MongoDB client: {e}")
+    return db
+
+def init_db() -> bool:
+    """
+    Check the connection and ensure indexes. Blocks for up to the server selection
+    timeout, so it runs in the startup warm-up thread, not on the startup path.
+    """
     try:
-        client = MongoClient(MONGO_URI, tlsCAFile=certifi.where())
-        db = client[DB_NAME]
-        # Check connection
-        client.admin.command('ping')
+        database = connect()
+        if database is None:
+            return False
+        database.client.admin.command('ping')
         print(">>> SUCCESS: Connected to MongoDB")
-        logger.info(f"Connected to MongoDB at {MONGO_URI}")
+        logger.info(f"Connected to MongoDB at {MONGO_URI} max_pool={MONGO_MAX_POOL_SIZE}")
+        if MONGO_ENSURE_INDEXES:
+            ensure_indexes(database)
+            check_query_plans(database)
+        return True
     except Exception as e:
         print(f">>> FAILURE: Failed to connect to MongoDB: {e}")
         logger.error(f"Failed to connect to MongoDB: {e}")
-        # We might want to raise here or just log depending on strictness
-        # For this MVP, we'll log but let the app continue (endpoints using DB will fail)
+        # Logged, not raised: the app keeps serving (endpoints using the DB will fail)
+        # and /ready reports the DB as unavailable
+        return False
 
 def get_db():
-    return db
\ No newline at end of file
+    return connect()
+
+def ensure_indexes(database) -> list[str]:
+    """Create the indexes in INDEXES if missing. Idempotent; returns index names created/confirmed."""
+    names = []
+    for coll_name, specs in INDEXES.items():
+        for spec in specs:
+            opts = {k: v for k, v in spec.items() if k != "keys"}
+            try:
+                names.append(database[coll_name].create_index(spec["keys"], **opts))
+            except Exception as e:
+                # e.g. duplicate uids from before the unique index existed; don't block startup
+                logger.error(f"ensure_index_failed collection={coll_name} index={spec['name']} err={e}")
+    for coll_name, legacy in LEGACY_INDEXES.items():
+        try:
+            existing = database[coll_name].index_information()
+            for name in legacy:
+                if name in existing:
+                    database[coll_name].drop_index(name)
+                    logger.info(f"legacy_index_dropped collection={coll_name} index={name}")
+        except Exception as e:
+            logger.error(f"drop_legacy_index_failed collection={coll_name} err={e}")
+    logger.info(f"ensure_indexes_ok indexes={names}")
+    return names
+
+# Plan stages that read through an index
+INDEX_STAGES = {"IXSCAN", "IDHACK", "EXPRESS_IXSCAN", "EXPRESS_IDHACK", "COUNT_SCAN", "DISTINCT_SCAN"}
+
+def _plan_nodes(plan: dict) -> list[dict]:
+    """Every node of an explain plan tree, root first."""
+    nodes, todo = [], [plan]
+    while todo:
+        node = todo.pop(0)
+        if not isinstance(node, dict):
+            continue
+        nodes.append(node)
+        todo += [node.get("inputStage")] + list(node.get("inputStages") or [])
+    return nodes
+
+def _winning_plan(explain: dict) -> dict:
+    plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+    # MongoDB 7+ (SBE) nests the classic-style tree under queryPlan
+    return plan.get("queryPlan", plan)
+
+def _index_covers(index_info: dict, filt: dict, sort: list | None) -> str | None:
+    """
+    Fallback for servers without explain (mongomock): is there an index whose
+    key prefix is the equality fields, then the sort fields, then the range fields?
+    """
+    equality = {k for k, v in filt.items() if not isinstance(v, dict)}
+    ranges = {k for k, v in filt.items() if isinstance(v, dict)}
+    sort_keys = [k for k, _ in (sort or [])]
+    for name, info in index_info.items():
+        keys = [k for k, _ in info.get("key", [])]
+        eq_end = len(equality)
+        sort_end = eq_end + len(sort_keys)
+        if (set(keys[:eq_end]) == equality and keys[eq_end:sort_end] == sort_keys
+                and set(keys[sort_end:sort_end + len(ranges)]) == ranges):
+            return name
+    return None
+
+def explain_query(database, coll_name: str, filt: dict, sort: list | None = None) -> dict:
+    """
+    Report whether a query is served by an index.
+    Uses the server's explain plan when available, otherwise checks index key prefixes.
+    """
+    coll = database[coll_name]
+    cursor = coll.find(filt)
+    if sort:
+        cursor = cursor.sort(sort)
+    if hasattr(cursor, "explain"):
+        nodes = _plan_nodes(_winning_plan(cursor.explain()))
+        stages = [node.get("stage") for node in nodes]
+        index_name = next((node["indexName"] for node in nodes if node.get("indexName")), None)
+        return {
+            "collection": coll_name,
+            "method": "explain",
+            "stages": stages,
+            "index": index_name,
+            # A plan we can't read (no stages, unnamed stages) counts as unindexed
+            "uses_index": bool(stages) and None not in stages and "COLLSCAN" not in stages
+                          and any(stage in INDEX_STAGES for stage in stages),
+            "in_memory_sort": "SORT" in stages,
+        }
+    index_name = _index_covers(coll.index_information(), filt, sort)
+    return {
+        "collection": coll_name,
+        "method": "index_prefix",
+        "stages": [],
+        "index": index_name,
+        "uses_index": index_name is not None,
+        "in_memory_sort": index_name is None and bool(sort),
+    }
+
+def check_query_plans(database) -> list[dict]:
+    """Explain every hot query and warn about collection scans or in-memory sorts."""
+    reports = []
+    for coll_name, filt, sort in HOT_QUERIES:
+        try:
+            report = explain_query(database, coll_name, filt, sort)
+        except Exception as e:
+            logger.error(f"explain_failed collection={coll_name} err={e}")
+            continue
+        if not report["uses_index"] or report["in_memory_sort"]:
+            logger.warning(f"query_plan_unindexed {report}")
+        reports.append(report)
+    return reports
@@ -0,0 +1,181 @@
+"""
+Structured facts from an agreement's clauses: monthly rent, security deposit
+(in months of rent), lock-in (months), notice period (days) and late-fee
+percent.
+
+Facts are extracted once, right after clause splitting, and stored with the
+job (clauses.json) and in its Mongo `uploads` document under `facts.<name>`.
+Each fact has an index on (user_id, created_at, _id, facts.<name>), so
+questions like "which of my agreements ask for more than 3 months' deposit"
+are a range filter over one user's index keys, already newest first, instead
+of a text search over every document.
+
+Extraction is regex based and conservative: a fact is None unless a clause
+states it with a number (template blanks such as "Rs.(Amount)" give None).
+The first clause in document order that states a fact wins; its id is kept
+in `sources`.
+"""
+import re
+
+# name -> type of the stored value
+FACT_FIELDS = {
+    "rent_amount": float,
+    "deposit_months": float,
+    "lock_in_months": int,
+    "notice_days": int,
+    "late_fee_percent": float,
+}
+OPERATORS = {"gt": "$gt", "gte": "$gte", "lt": "$lt", "lte": "$lte", "eq": "$eq"}
+
+_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9,
+          "ten": 10, "eleven": 11, "twelve": 12, "fifteen": 15, "thirty": 30, "sixty": 60, "ninety": 90}
+_NUM = r"(\d+(?:\.\d+)?|" + "|".join(_WORDS) + r")"
+_AMOUNT = r"(?:rs\.?|inr|₹)\s*(\d{1,3}(?:,\d{2,3})+|\d+)(?:\.\d+)?"
+_UNIT_DAYS = {"day": 1, "week": 7, "month": 30, "year": 365}
+
+_RENT = [
+    re.compile(r"(?:monthly\s+rent|rent\s+(?:of|is|amount|payable|shall\s+be)|rent\s*:)[^.;]{0,40}?" + _AMOUNT),
+    re.compile(_AMOUNT + r"\s*(?:/-\s*)?(?:per\s+month|/\s*month|p\.\s*m\.|monthly)"),
+]
+_DEPOSIT_MONTHS = [
+    re.compile(_NUM + r"\s*months?(?:['’]s?)?\s+(?:of\s+)?(?:the\s+)?(?:monthly\s+)?(?:rent|deposit|advance)"),
+    re.compile(r"(?:deposit|advance)[^.;]{0,60}?" + _NUM + r"\s*months?"),
+]
+_DEPOSIT_AMOUNT = re.compile(r"(?:deposit|advance)[^.;]{0,60}?" + _AMOUNT)
+_LOCK_IN = [
+    re.compile(r"lock[\s-]*in(?:\s+period)?[^.;]{0,40}?" + _NUM + r"[\s-]*(month|year)s?"),
+    re.compile(_NUM + r"[\s-]*(month|year)s?['’]?\s+lock[\s-]*in"),
+]
+_NOTICE = [
+    re.compile(_NUM + r"[\s-]*(day|week|month)s?['’]?s?\s+(?:(?:prior|advance|written|clear)\s+)*(?:notice|intimation)"),
+    re.compile(r"notice(?:\s+period)?\s+of\s+(?:at\s+least\s+)?" + _NUM + r"[\s-]*(day|week|month)s?"),
+]
+_LATE = re.compile(r"\blate\b|delay|overdue|arrear|penalt")
+# "interest" alone is often about something else (interest on the deposit)
+_INTEREST = re.compile(r"interest")
+_PERCENT = re.compile(r"(\d+(?:\.\d+)?)\s*(?:%|per\s*cent)")
+# A late-fee percentage sits in the same sentence, within this many characters of the wording
+_LATE_WINDOW = 40
+_SENTENCE = re.compile(r";|(?<!rs)\.(?:\s|$)")
+
+
+def _number(token: str) -> float:
+    return float(_WORDS[token]) if token in _WORDS else float(token)
+
+
+def _amount(token: str) -> float:
+    return float(token.replace(",", ""))
+
+
+def _rent(text: str) -> float | None:
+    if "rent" not in text:
+        return None
+    m = _RENT[0].search(text)
+    if m is None and "deposit" not in text and "advance" not in text:
+        # A bare "Rs. N per month" only counts outside deposit clauses
+        m = _RENT[1].search(text)
+    return _amount(m.group(1)) if m else None
+
+
+def _deposit(text: str) -> tuple[float | None, float | None]:
+    """(months, amount) stated by a deposit clause."""
+    if "deposit" not in text and "advance" not in text:
+        return None, None
+    for pattern in _DEPOSIT_MONTHS:
+        m = pattern.search(text)
+        if m:
+            return _number(m.group(1)), None
+    m = _DEPOSIT_AMOUNT.search(text)
+    return None, (_amount(m.group(1)) if m else None)
+
+
+def _lock_in(text: str) -> int | None:
+    if not re.search(r"lock[\s-]*in", text):
+        return None
+    for pattern in _LOCK_IN:
+        m = pattern.search(text)
+        if m:
+            return round(_number(m.group(1)) * (12 if m.group(2) == "year" else 1))
+    return None
+
+
+def _notice(text: str) -> int | None:
+    if "notice" not in text and "intimation" not in text:
+        return None
+    for pattern in _NOTICE:
+        m = pattern.search(text)
+        if m:
+            return round(_number(m.group(1)) * _UNIT_DAYS[m.group(2)])
+    return None
+
+
+def _gap(a: re.Match, b: re.Match) -> int:
+    return max(0, a.start() - b.end(), b.start() - a.end())
+
+
+def _late_fee(text: str) -> float | None:
+    if not _LATE.search(text):
+        return None
+    for sentence in _SENTENCE.split(text):
+        anchors = list(_LATE.finditer(sentence))
+        if not anchors:
+            continue
+        anchors += _INTEREST.finditer(sentence)
+        for m in _PERCENT.finditer(sentence):
+            if any(_gap(m, a) <= _LATE_WINDOW for a in anchors):
+                return float(m.group(1))
+    return None
+
+
+def extract_facts(clauses: list[dict]) -> dict:
+    """
+    One pass over the clauses. Returns {"facts": {name: value or None},
+    "sources": {name: clause id}}. A deposit given only as an amount is
+    converted to months when the rent is known.
+    """
+    facts = {name: None for name in FACT_FIELDS}
+    sources: dict[str, str] = {}
+    deposit_amount, deposit_source = None, None
+
+    def found(name: str, value, clause: dict) -> None:
+        if value is not None and facts[name] is None:
+            facts[name] = FACT_FIELDS[name](value)
+            sources[name] = clause["id"]
+
+    for c in clauses:
+        text = " ".join(c.get("text", "").lower().split())
+        found("rent_amount", _rent(text), c)
+        months, amount = _deposit(text)
+        found("deposit_months", months, c)
+        if amount is not None and deposit_amount is None:
+            deposit_amount, deposit_source = amount, c["id"]
+        found("lock_in_months", _lock_in(text), c)
+        found("notice_days", _notice(text), c)
+        found("late_fee_percent", _late_fee(text), c)
+
+    if facts["deposit_months"] is None and deposit_amount and facts["rent_amount"]:
+        facts["deposit_months"] = round(deposit_amount / facts["rent_amount"], 2)
+        sources["deposit_months"] = deposit_source
+    return {"facts": facts, "sources": sources}
+
+
+def parse_filters(params: list[tuple[str, str]]) -> dict:
+    """
+    Mongo filter on `facts.*` from query parameters such as
+    deposit_months=gt:3 or rent_amount=gte:10000&rent_amount=lte:20000.
+    Unknown fact names are ignored (they may be other parameters);
+    malformed conditions raise ValueError.
+    """
+    filt: dict[str, dict] = {}
+    for name, value in params:
+        if name not in FACT_FIELDS:
+            continue
+        op, _, operand = value.partition(":")
+        if op not in OPERATORS or not operand:
+            raise ValueError(f"{name} must look like <op>:<number> with op one of {sorted(OPERATORS)}")
+        try:
+            number = float(operand)
+        except ValueError:
+            raise ValueError(f"{name}: {operand!r} is not a number") from None
+        filt.setdefault(f"facts.{name}", {})[OPERATORS[op]] = number
+    return filt
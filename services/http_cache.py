@@ -0,0 +1,165 @@
+"""
+Conditional GETs and compressed, cached JSON bodies for artifact-backed responses.
+
+Responses are identified by a strong ETag derived from the content hash of the
+files they are built from (analysis.json, legal_kb.json). A request whose
+If-None-Match carries that ETag gets an empty 304. Otherwise the body is
+serialised once per artifact version and, above HTTP_COMPRESS_MIN_BYTES,
+compressed once per encoding (brotli when the `brotli` package is installed
+and the client accepts it, else gzip). The bytes are kept in a small in-memory
+LRU, so repeat loads neither re-read the artifact nor re-compress it.
+"""
+import os
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from fastapi import Request
+from fastapi.responses import Response
+from dotenv import load_dotenv
+
+from services.metrics import inc
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+load_dotenv()
+HTTP_CACHE_MAX_BYTES = int(os.getenv("HTTP_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+HTTP_COMPRESS_MIN_BYTES = int(os.getenv("HTTP_COMPRESS_MIN_BYTES", "1024"))
+
+_lock = threading.Lock()
+# (path, mtime_ns, size) -> content hash, so unchanged files are not re-hashed
+_file_hashes: dict[tuple, str] = {}
+# (etag, encoding) -> body bytes, least recently used first
+_bodies: OrderedDict[tuple[str, str], bytes] = OrderedDict()
+_body_bytes = 0
+
+
+def file_hash(path: Path) -> str:
+    """Content hash of a file, memoised on its mtime and size."""
+    st = path.stat()
+    key = (str(path), st.st_mtime_ns, st.st_size)
+    digest = _file_hashes.get(key)
+    if digest is None:
+        digest = hashlib.sha256(path.read_bytes()).hexdigest()[:32]
+        with _lock:
+            # Drop entries for older versions of the same file
+            for old in [k for k in _file_hashes if k[0] == key[0]]:
+                del _file_hashes[old]
+            _file_hashes[key] = digest
+    return digest
+
+
+def make_etag(*parts: str) -> str:
+    """Strong ETag (quoted) for a representation built from these content hashes."""
+    return '"' + hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def _encoded_etag(etag: str, encoding: str) -> str:
+    # A strong ETag must differ between content codings of the same resource
+    return etag if encoding == "identity" else f'{etag[:-1]}-{encoding}"'
+
+
+def _matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    base = etag.strip('"')
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        tag = tag.strip('"')
+        # Any content coding of the same version is a match
+        if tag == base or tag.startswith(base + "-"):
+            return True
+    return False
+
+
+def choose_encoding(accept_encoding: str | None) -> str:
+    accepted = {}
+    for item in (accept_encoding or "").split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return "identity"
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+
+def _get(key: tuple[str, str]) -> bytes | None:
+    with _lock:
+        body = _bodies.get(key)
+        if body is not None:
+            _bodies.move_to_end(key)
+        return body
+
+
+def _put(key: tuple[str, str], body: bytes) -> None:
+    global _body_bytes
+    if len(body) > HTTP_CACHE_MAX_BYTES:
+        return
+    with _lock:
+        if key in _bodies:
+            return
+        _bodies[key] = body
+        _body_bytes += len(body)
+        while _body_bytes > HTTP_CACHE_MAX_BYTES:
+            _, old = _bodies.popitem(last=False)
+            _body_bytes -= len(old)
+
+
+def cached_json_response(request: Request, etag: str, render, route: str,
+                         cache_control: str = "private, no-cache") -> Response:
+    """
+    Serve the JSON representation identified by `etag`. `render()` returns the
+    serialised body and is only called when this version is not cached yet
+    (also for a 304, whose ETag depends on whether the body is big enough to
+    compress).
+    """
+    headers = {"Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    identity = _get((etag, "identity"))
+    result = "hit"
+    if identity is None:
+        result = "miss"
+        identity = render()
+        _put((etag, "identity"), identity)
+
+    encoding = choose_encoding(request.headers.get("accept-encoding"))
+    if len(identity) < HTTP_COMPRESS_MIN_BYTES:
+        encoding = "identity"
+    # A 304 must carry the same validator the 200 for this request would have
+    headers["ETag"] = _encoded_etag(etag, encoding)
+    if _matches(request.headers.get("if-none-match"), etag):
+        inc("clauseclear_http_cache_total", route=route, result="not_modified")
+        return Response(status_code=304, headers=headers)
+
+    body = _get((etag, encoding)) if encoding != "identity" else identity
+    if body is None:
+        body = _compress(identity, encoding)
+        _put((etag, encoding), body)
+    inc("clauseclear_http_cache_total", route=route, result=result)
+
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
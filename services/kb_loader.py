@@ -6,4 +6,11 @@ def load_kb():
     kb_path = current_file_dir.parent / "knowledge" / "legal_kb.json" # Go up one level (from services to PDD), then into knowledge
     if not kb_path.exists():
         raise FileNotFoundError("legal_kb.json not found")
-    return json.loads(kb_path.read_text(encoding="utf-8"))
\ No newline at end of file
+    return json.loads(kb_path.read_text(encoding="utf-8"))
+
+def load_canonical_questions():
+    current_file_dir = Path(__file__).parent
+    path = current_file_dir.parent / "knowledge" / "canonical_questions.json"
+    if not path.exists():
+        raise FileNotFoundError("canonical_questions.json not found")
+    return json.loads(path.read_text(encoding="utf-8"))
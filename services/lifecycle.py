@@ -0,0 +1,214 @@
+"""
+Storage lifecycle: per-job manifests and a background sweeper that keeps
+uploads + TF-IDF indexes within an age limit and a disk budget.
+
+Every artifact write calls `record_artifacts(job_id)`, which rescans the job's
+files once and stores manifest.json (created_at, updated_at, sizes, artifact
+list). Status checks and the sweeper read only that file.
+
+The sweeper runs in a background thread. Jobs older than STORAGE_TTL_DAYS are
+evicted first, then the least recently written jobs until the total is under
+STORAGE_MAX_BYTES. Eviction deletes the job (or, with STORAGE_EVICT_MODE=archive,
+moves the upload directory to STORAGE_ARCHIVE_DIR and drops the rebuildable
+index) and marks the Mongo `uploads` document. With several workers, only
+the one holding the sweep lock sweeps at a time.
+"""
+import os
+import json
+import shutil
+import threading
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from loguru import logger
+from dotenv import load_dotenv
+
+from services.db import get_db
+from services.metrics import inc, set_gauge
+from services.storage import UPLOAD_ROOT, EMB_ROOT, LOCK_ROOT, job_dir, job_lock, atomic_write_json, storage_path
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX
+    fcntl = None
+
+load_dotenv()
+STORAGE_TTL_DAYS = float(os.getenv("STORAGE_TTL_DAYS", "90"))
+STORAGE_MAX_BYTES = int(os.getenv("STORAGE_MAX_BYTES", str(5 * 1024 ** 3)))
+STORAGE_SWEEP_SECONDS = float(os.getenv("STORAGE_SWEEP_SECONDS", "600"))
+STORAGE_EVICT_MODE = os.getenv("STORAGE_EVICT_MODE", "delete")
+STORAGE_ARCHIVE_DIR = Path(os.getenv("STORAGE_ARCHIVE_DIR", str(storage_path("archive"))))
+
+MANIFEST_FILE = "manifest.json"
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def expires_at(created_at_iso: str) -> str | None:
+    """When the sweeper will evict a job created at `created_at_iso` (None if there is no TTL)."""
+    if STORAGE_TTL_DAYS <= 0:
+        return None
+    return (_parse_ts(created_at_iso) + timedelta(days=STORAGE_TTL_DAYS)).isoformat()
+
+
+def _index_files(job_id: str) -> list[Path]:
+    return [p for p in EMB_ROOT.glob(f"{job_id}.*") if p.is_file() and not p.name.endswith(".tmp")]
+
+
+def read_manifest(job_id: str) -> dict | None:
+    path = job_dir(job_id) / MANIFEST_FILE
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"manifest_unreadable job_id={job_id} err={e}")
+        return None
+
+
+def record_artifacts(job_id: str) -> dict | None:
+    """Rescan the job's files and rewrite its manifest. Call after writing artifacts."""
+    jd = job_dir(job_id)
+    if not jd.exists():
+        return None
+    with job_lock(job_id):
+        previous = read_manifest(job_id) or {}
+        artifacts = {p.name: p.stat().st_size for p in jd.iterdir()
+                     if p.is_file() and p.name != MANIFEST_FILE and not p.name.startswith(".")}
+        index = {p.name: p.stat().st_size for p in _index_files(job_id)}
+        created = previous.get("created_at")
+        if created is None:
+            marker = jd / "created_at.txt"
+            created = marker.read_text().strip() if marker.exists() else _now().isoformat()
+        manifest = {
+            "job_id": job_id,
+            "created_at": created,
+            "updated_at": _now().isoformat(),
+            "bytes": sum(artifacts.values()),
+            "index_bytes": sum(index.values()),
+            "artifacts": artifacts,
+            "index_artifacts": index,
+        }
+        atomic_write_json(jd / MANIFEST_FILE, manifest)
+    return manifest
+
+
+class LifecycleManager:
+    def __init__(self, ttl_days: float = STORAGE_TTL_DAYS, max_bytes: int = STORAGE_MAX_BYTES,
+                 interval: float = STORAGE_SWEEP_SECONDS, mode: str = STORAGE_EVICT_MODE,
+                 archive_dir: Path = STORAGE_ARCHIVE_DIR):
+        self.ttl_days = ttl_days
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.mode = mode if mode in ("delete", "archive") else "delete"
+        self.archive_dir = Path(archive_dir)
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.last_report: dict | None = None
+
+    def start(self) -> None:
+        if self.interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="storage-lifecycle", daemon=True)
+        self._thread.start()
+        logger.info(f"lifecycle_started ttl_days={self.ttl_days} max_bytes={self.max_bytes} mode={self.mode}")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"lifecycle_sweep_failed err={e}")
+
+    def sweep(self) -> dict | None:
+        """One pass; returns a report, or None if another worker is sweeping."""
+        LOCK_ROOT.mkdir(parents=True, exist_ok=True)
+        with open(LOCK_ROOT / "lifecycle.lock", "a+") as fh:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return None
+            report = self._sweep()
+        self.last_report = report
+        return report
+
+    def _sweep(self) -> dict:
+        jobs = []
+        if UPLOAD_ROOT.exists():
+            for jd in UPLOAD_ROOT.iterdir():
+                if not jd.is_dir():
+                    continue
+                manifest = read_manifest(jd.name) or record_artifacts(jd.name)
+                if manifest:
+                    jobs.append(manifest)
+        total = sum(m["bytes"] + m["index_bytes"] for m in jobs)
+        now = _now()
+        cutoff = now - timedelta(days=self.ttl_days) if self.ttl_days > 0 else None
+        evicted = {"ttl": [], "budget": []}
+
+        # Least recently written first
+        jobs.sort(key=lambda m: m.get("updated_at") or m["created_at"])
+        keep = []
+        for m in jobs:
+            if cutoff is not None and _parse_ts(m["created_at"]) < cutoff:
+                total -= self._evict(m, "ttl")
+                evicted["ttl"].append(m["job_id"])
+            else:
+                keep.append(m)
+        for m in keep:
+            if self.max_bytes <= 0 or total <= self.max_bytes:
+                break
+            total -= self._evict(m, "budget")
+            evicted["budget"].append(m["job_id"])
+
+        set_gauge("clauseclear_storage_bytes", total)
+        report = {"at": now.isoformat(), "jobs": len(jobs) - len(evicted["ttl"]) - len(evicted["budget"]),
+                  "bytes": total, "max_bytes": self.max_bytes, "evicted": evicted, "mode": self.mode}
+        if evicted["ttl"] or evicted["budget"]:
+            logger.info(f"lifecycle_sweep jobs={report['jobs']} bytes={total} "
+                        f"evicted_ttl={len(evicted['ttl'])} evicted_budget={len(evicted['budget'])}")
+        return report
+
+    def _evict(self, manifest: dict, reason: str) -> int:
+        job_id = manifest["job_id"]
+        freed = manifest["bytes"] + manifest["index_bytes"]
+        with job_lock(job_id):
+            for p in _index_files(job_id):
+                p.unlink(missing_ok=True)
+            jd = job_dir(job_id)
+            if self.mode == "archive":
+                self.archive_dir.mkdir(parents=True, exist_ok=True)
+                shutil.move(str(jd), str(self.archive_dir / job_id))
+            else:
+                shutil.rmtree(jd, ignore_errors=True)
+        shutil.rmtree(LOCK_ROOT / job_id, ignore_errors=True)
+        status = "archived" if self.mode == "archive" else "evicted"
+        inc("clauseclear_storage_evictions_total", reason=reason)
+        logger.info(f"job_{status} job_id={job_id} reason={reason} freed={freed}")
+
+        db = get_db()
+        if db is not None:
+            try:
+                db["uploads"].update_one({"job_id": job_id},
+                                         {"$set": {"status": status, "evicted_at": _now().isoformat(),
+                                                   "eviction_reason": reason}})
+            except Exception as e:
+                logger.error(f"lifecycle_status_update_failed job_id={job_id} err={e}")
+        return freed
+
+
+def _parse_ts(value: str) -> datetime:
+    ts = datetime.fromisoformat(value)
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+lifecycle = LifecycleManager()
@@ -0,0 +1,145 @@
+"""
+Two-tier cache for LLM explanations: an in-memory LRU in front of a local SQLite
+store that survives restarts. Entries carry the prompt version they were
+generated with; entries from another version are never served and are purged
+when the store is opened, so changing the prompt template invalidates the cache.
+"""
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from time import time
+from loguru import logger
+from dotenv import load_dotenv
+
+from services.metrics import inc, set_gauge
+from services.storage import storage_path
+
+load_dotenv()
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") != "0"
+LLM_CACHE_PATH = Path(os.getenv("LLM_CACHE_PATH", str(storage_path("cache", "llm_cache.sqlite"))))
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "20000"))
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "512"))
+
+
+def make_key(version: str, model: str, system_instruction: str, query: str, matches: list[dict]) -> str:
+    """Hash of everything that determines the explanation. Queries are case/whitespace-normalised."""
+    material = {
+        "v": version,
+        "model": model,
+        "system": hashlib.sha256(system_instruction.encode("utf-8")).hexdigest(),
+        "query": " ".join(query.lower().split()),
+        "clauses": [
+            [m.get("text", ""), m.get("risk_level", "UNKNOWN"), round(float(m.get("risk_score", 0.0)), 2),
+             list(m.get("reasons", []))]
+            for m in matches
+        ],
+    }
+    return hashlib.sha256(json.dumps(material, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, version: str, path: Path = LLM_CACHE_PATH, ttl_seconds: int = LLM_CACHE_TTL_SECONDS,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES, memory_entries: int = LLM_CACHE_MEMORY_ENTRIES):
+        self.version = version
+        self.path = Path(path)
+        self.ttl = ttl_seconds
+        self.max_entries = max(1, max_entries)
+        self.memory_entries = max(1, memory_entries)
+        self._mem: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._writes = 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0}
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY, version TEXT NOT NULL, answer TEXT NOT NULL,"
+                " created_at REAL NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_access ON llm_cache(last_access)")
+            purged = self._conn.execute("DELETE FROM llm_cache WHERE version != ? OR expires_at < ?",
+                                        (self.version, time())).rowcount
+            if purged:
+                logger.info(f"llm_cache_purged rows={purged} version={self.version}")
+        return self._conn
+
+    def get(self, key: str) -> str | None:
+        now = time()
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit is not None and hit[1] > now:
+                self._mem.move_to_end(key)
+                self._count("memory_hits")
+                return hit[0]
+            if hit is not None:
+                del self._mem[key]
+            try:
+                row = self._db().execute(
+                    "SELECT answer, expires_at FROM llm_cache WHERE key = ? AND version = ? AND expires_at > ?",
+                    (key, self.version, now)).fetchone()
+                if row is not None:
+                    self._db().execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            except sqlite3.Error as e:
+                logger.error(f"llm_cache_read_failed err={e}")
+                row = None
+            if row is None:
+                self._count("misses")
+                return None
+            self._remember(key, row[0], row[1])
+            self._count("disk_hits")
+            return row[0]
+
+    def put(self, key: str, answer: str) -> None:
+        now = time()
+        expires = now + self.ttl
+        with self._lock:
+            self._remember(key, answer, expires)
+            try:
+                self._db().execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, version, answer, created_at, expires_at, last_access)"
+                    " VALUES (?, ?, ?, ?, ?, ?)", (key, self.version, answer, now, expires, now))
+                self._writes += 1
+                # Enforce the size cap every so often rather than on every write
+                if self._writes % 100 == 0:
+                    self._evict()
+            except sqlite3.Error as e:
+                logger.error(f"llm_cache_write_failed err={e}")
+            self.stats["stores"] += 1
+
+    def hit_ratio(self) -> float:
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+    def report(self) -> dict:
+        return {**self.stats, "hit_ratio": round(self.hit_ratio(), 4), "memory_size": len(self._mem),
+                "version": self.version}
+
+    def _remember(self, key: str, answer: str, expires_at: float) -> None:
+        self._mem[key] = (answer, expires_at)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.memory_entries:
+            self._mem.popitem(last=False)
+
+    def _evict(self) -> None:
+        db = self._db()
+        db.execute("DELETE FROM llm_cache WHERE expires_at < ?", (time(),))
+        (count,) = db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+        if count > self.max_entries:
+            db.execute("DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY last_access LIMIT ?)",
+                       (count - self.max_entries,))
+
+    def _count(self, what: str) -> None:
+        self.stats[what] += 1
+        inc("clauseclear_llm_cache_total", result=what)
+        set_gauge("clauseclear_llm_cache_hit_ratio", self.hit_ratio())
@@ -1,164 +1,585 @@
 """
 LLM explainer service using Google Gemini via API key (Google AI Studio style).
 Rewrites rule-based explanations into simple, tenant-friendly language.
+
+The API uses the async path (explain_with_llm_async), which shares one keep-alive
+httpx connection pool per process and caps concurrent Gemini calls, so a slow
+Gemini response never blocks the event loop. The sync explain_with_llm is kept
+for scripts and uses a persistent requests.Session; `requests` is only imported
+when that path is first used, and the httpx client is created on the first call.
 """
 import os
 import json
-from typing import Optional
+import asyncio
+import hashlib
+from time import perf_counter
 from loguru import logger
-import requests
+import httpx
 from dotenv import load_dotenv
 
+from services.metrics import timed, inc
+from services.llm_cache import LLMCache, make_key, LLM_CACHE_ENABLED
+from services.circuit_breaker import CircuitBreaker
+from services.prompt_builder import compact_matches, estimate_tokens, PROMPT_TOKEN_BUDGET
+from services.tfidf_index import load_vectorizer
+
 # Load environment variables
 load_dotenv()
 
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta")
+GEMINI_CONNECT_TIMEOUT = float(os.getenv("GEMINI_CONNECT_TIMEOUT", "5"))
+GEMINI_READ_TIMEOUT = float(os.getenv("GEMINI_READ_TIMEOUT", "30"))
+GEMINI_MAX_CONNECTIONS = int(os.getenv("GEMINI_MAX_CONNECTIONS", "20"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+# How long a request may wait for a free concurrency slot before falling back
+GEMINI_QUEUE_TIMEOUT = float(os.getenv("GEMINI_QUEUE_TIMEOUT", "10"))
+MAX_ANSWER_CHARS = 800
+# Circuit breaker: trip when >= GEMINI_BREAKER_FAILURE_RATE of the calls in the
+# window failed, timed out or took longer than GEMINI_SLOW_CALL_MS
+GEMINI_BREAKER_FAILURE_RATE = float(os.getenv("GEMINI_BREAKER_FAILURE_RATE", "0.5"))
+GEMINI_BREAKER_MIN_CALLS = int(os.getenv("GEMINI_BREAKER_MIN_CALLS", "10"))
+GEMINI_BREAKER_WINDOW_SECONDS = float(os.getenv("GEMINI_BREAKER_WINDOW_SECONDS", "60"))
+GEMINI_BREAKER_COOLDOWN_SECONDS = float(os.getenv("GEMINI_BREAKER_COOLDOWN_SECONDS", "15"))
+GEMINI_BREAKER_PROBE_INTERVAL = float(os.getenv("GEMINI_BREAKER_PROBE_INTERVAL", "5"))
+GEMINI_SLOW_CALL_MS = float(os.getenv("GEMINI_SLOW_CALL_MS", "10000"))
+
+NO_MATCH_ANSWER = "Your document does not clearly talk about this topic. I couldn't find a specific clause about it."
+
 # NOTE: This function rewrites /query results into simple 8th-grade language.
 # It must NOT invent new clauses. If in doubt, it should say the document
 # does not clearly talk about the topic.
+SYSTEM_INSTRUCTION = """You explain rental agreement terms in simple, everyday language, like helping a friend understand their contract.
 
-def explain_with_llm(query: str, matches: list[dict], base_answer: str) -> str:
+You get the user's question, text from their agreement and a risk level: GREEN (safe/okay), YELLOW (be careful), RED (risky/problem).
+
+Rules:
+- Answer ONLY from the agreement text given; add nothing else. "..." marks text that was left out.
+- Say what it means in practice (what they must do or pay) and whether it is safe or they should be careful.
+- Simple words, no legal jargon, no clause numbers, don't copy the legal text word-for-word.
+- If the text doesn't answer the question, say: "Your document doesn't clearly talk about this. I couldn't find a specific answer in your agreement."
+- Don't say you're a lawyer. 2-4 sentences, one small paragraph, friendly but professional, no emojis or slang."""
+
+# Bump when build_prompt's user message template changes; together with the
+# system instruction hash this versions the explanation cache.
+PROMPT_TEMPLATE_VERSION = "2"
+PROMPT_VERSION = (f"{PROMPT_TEMPLATE_VERSION}-{hashlib.sha256(SYSTEM_INSTRUCTION.encode('utf-8')).hexdigest()[:8]}"
+                  f"-b{PROMPT_TOKEN_BUDGET}")
+
+_cache: LLMCache | None = None
+breaker = CircuitBreaker(
+    "gemini",
+    failure_rate=GEMINI_BREAKER_FAILURE_RATE,
+    min_calls=GEMINI_BREAKER_MIN_CALLS,
+    window_seconds=GEMINI_BREAKER_WINDOW_SECONDS,
+    cooldown=GEMINI_BREAKER_COOLDOWN_SECONDS,
+    probe_interval=GEMINI_BREAKER_PROBE_INTERVAL,
+)
+_session = None  # requests.Session, created by the first sync call
+_async_client: httpx.AsyncClient | None = None
+_semaphore: asyncio.Semaphore | None = None
+# Calls cut off by a latency budget; the loop only holds weak references to tasks
+_background: set[asyncio.Task] = set()
+
+
+def _empty_usage() -> dict:
+    return {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+
+def _usage_from_response(result: dict) -> dict:
+    meta = result.get("usageMetadata") or {}
+    return {
+        "prompt_tokens": int(meta.get("promptTokenCount", 0)),
+        "completion_tokens": int(meta.get("candidatesTokenCount", 0)),
+        "total_tokens": int(meta.get("totalTokenCount", 0)),
+    }
+
+def _record_usage(usage: dict, estimated_tokens: int | None = None) -> None:
+    inc("clauseclear_llm_tokens_total", usage["prompt_tokens"], kind="prompt")
+    inc("clauseclear_llm_tokens_total", usage["completion_tokens"], kind="completion")
+    if estimated_tokens is not None:
+        # Budgeting estimate next to Gemini's count, to watch the estimator's drift
+        usage["prompt_tokens_estimated"] = estimated_tokens
+        inc("clauseclear_llm_tokens_total", estimated_tokens, kind="prompt_estimated")
+        logger.info(f"llm_prompt_tokens estimated={estimated_tokens} actual={usage['prompt_tokens']}")
+
+def build_prompt(query: str, matches: list[dict], vectorizer=None) -> str:
+    """Build the full Gemini prompt (system instruction + user message) for the top 3 matches."""
+    return compose_prompt(query, matches, vectorizer)[0]
+
+def compose_prompt(query: str, matches: list[dict], vectorizer=None) -> tuple[str, int]:
     """
-    Use Gemini API to rewrite the base_answer into simple, tenant-friendly language.
-    
-    Args:
-        query: User's question
-        matches: List of matched clauses with risk info (up to top 3)
-        base_answer: Original rule-based answer string
-    
-    Returns:
-        Plain string explanation in simple language (8th-grade level)
+    build_prompt within PROMPT_TOKEN_BUDGET: long clauses are cut to the
+    sentences most relevant to the query (scored with `vectorizer`, the job's
+    TF-IDF, when given) and repeated reasons are dropped. Returns the prompt
+    and its estimated token count.
     """
-    # If no matches, return a simple message without calling LLM
-    if not matches:
-        return "Your document does not clearly talk about this topic. I couldn't find a specific clause about it."
-    
-    # Check for API key
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        logger.warning("GEMINI_API_KEY not set. LLM features disabled, returning base_answer")
-        return base_answer
-    
-    model_name = os.getenv("GEMINI_MODEL_NAME", "gemini-2.0-flash")
-    
-    # Build the system instruction prompt
-    system_instruction = """You are explaining rental agreement terms to someone in simple, everyday language. Write like you're helping a friend understand their contract.
-
-You will receive:
-- The user's question.
-- Some text from their rental agreement.
-- A risk level: GREEN (safe/okay), YELLOW (be careful), RED (risky/problem).
-
-Your job:
-- Answer their question using ONLY the information from the agreement text provided.
-- Explain what it means in simple words - what they need to do, what they need to pay, etc.
-- Tell them if it's safe or if they should be careful.
-
-IMPORTANT RULES:
-- Use simple, everyday words. No legal jargon or complicated terms.
-- Write in a friendly, helpful tone - like explaining to a friend.
-- Don't say "Clause 1" or reference clause numbers - just explain naturally.
-- Don't copy the exact legal text word-for-word - explain what it MEANS in plain language.
-- ONLY use information that's actually in the agreement text provided. Don't add anything extra.
-- If the document doesn't clearly answer their question, say: "Your document doesn't clearly talk about this. I couldn't find a specific answer in your agreement."
-- Don't say you're a lawyer. Just be helpful and clear.
-- Keep it short: 2-4 sentences. One small paragraph.
-- No emojis or casual slang. Keep it friendly but professional."""
-
-    # Build context from matches (up to top 3)
-    matches_data = []
-    for match in matches[:3]:
-        matches_data.append({
-            "clause_text": match.get("text", ""),
-            "risk_level": match.get("risk_level", "UNKNOWN"),
-            "risk_score": match.get("risk_score", 0.0),
-            "reasons": match.get("reasons", [])
-        })
-    
-    # Build the user message
+    top = matches[:3]
+    fixed = estimate_tokens(_render_prompt(query, [{**m, "text": ""} for m in top]))
+    compacted, dropped = compact_matches(query, top, fixed, vectorizer)
+    prompt = _render_prompt(query, compacted)
+    estimated = estimate_tokens(prompt)
+    if dropped:
+        logger.info(f"prompt_compacted dropped_sentences={dropped} estimated_tokens={estimated} "
+                    f"budget={PROMPT_TOKEN_BUDGET}")
+    return prompt, estimated
+
+def _render_prompt(query: str, matches: list[dict]) -> str:
     matches_text = []
-    for i, match_data in enumerate(matches_data, 1):
-        reasons_str = "; ".join(match_data["reasons"]) if match_data["reasons"] else "No specific issues identified"
+    for i, match in enumerate(matches, 1):
+        if match.get("reasons"):
+            reasons_str = "; ".join(match["reasons"])
+        elif match.get("reasons_repeated"):
+            reasons_str = "Same as above"
+        else:
+            reasons_str = "No specific issues identified"
         matches_text.append(
             f"Clause {i}:\n"
-            f"Text: {match_data['clause_text']}\n"
-            f"Risk Level: {match_data['risk_level']}\n"
-            f"Risk Score: {match_data['risk_score']:.2f}\n"
+            f"Text: {match.get('text', '')}\n"
+            f"Risk Level: {match.get('risk_level', 'UNKNOWN')}\n"
+            f"Risk Score: {float(match.get('risk_score', 0.0)):.2f}\n"
             f"Reasons: {reasons_str}"
         )
-    
+
     context = "\n\n".join(matches_text)
-    
+
     user_message = f"""User asked: {query}
 
 Here's what the agreement says:
 {context}
 
-The risk level is: {matches_data[0]['risk_level'] if matches_data else 'UNKNOWN'}
+The risk level is: {matches[0].get('risk_level', 'UNKNOWN') if matches else 'UNKNOWN'}
 
 Now explain this to them like you're talking to a 13-year-old friend. Use simple words. Don't copy the legal text - explain what it MEANS in everyday life. Keep it short and friendly."""
 
-    # Prepare the API request
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent"
+    return f"{SYSTEM_INSTRUCTION}\n\n---\n\n{user_message}"
+
+def _request_parts(api_key: str, prompt: str, method: str = "generateContent",
+                   generation_config: dict | None = None) -> tuple[str, dict, dict]:
+    model_name = os.getenv("GEMINI_MODEL_NAME", "gemini-2.0-flash")
+    url = f"{GEMINI_BASE_URL}/models/{model_name}:{method}"
     headers = {
         "x-goog-api-key": api_key,
         "Content-Type": "application/json"
     }
-    
-    # Build the request payload
     payload = {
         "contents": [
             {
                 "parts": [
                     {
-                        "text": f"{system_instruction}\n\n---\n\n{user_message}"
+                        "text": prompt
                     }
                 ]
             }
         ]
     }
+    if generation_config:
+        payload["generationConfig"] = generation_config
+    return url, headers, payload
+
+def _extract_text_raw(result: dict) -> str | None:
+    candidates = result.get("candidates") or []
+    if candidates:
+        parts = (candidates[0].get("content") or {}).get("parts") or []
+        if parts:
+            return parts[0].get("text", "")
+    return None
+
+def _extract_text(result: dict) -> str | None:
+    """Pull the generated text out of a Gemini response, or None if the shape is unexpected."""
+    text = _extract_text_raw(result)
+    return text.strip() if text is not None else None
+
+def truncate_answer(answer_llm: str) -> str:
+    # Ensure plain text (no JSON or bullet lists if it looks like structured data)
+    # Truncate if very long
+    if len(answer_llm) > MAX_ANSWER_CHARS:
+        answer_llm = answer_llm[:MAX_ANSWER_CHARS].rsplit(".", 1)[0] + "."
+    return answer_llm
+
+def answer_from_response(result: dict, estimated_tokens: int | None = None) -> tuple[str | None, dict]:
+    """
+    (text, usage) of a Gemini response; the token usage is also recorded in the
+    metrics. text is None if the response doesn't have the expected shape.
+    """
+    usage = _usage_from_response(result)
+    _record_usage(usage, estimated_tokens)
+    return _extract_text(result), usage
+
+def _finish(result: dict, base_answer: str, cache_key: str | None = None,
+            estimated_tokens: int | None = None) -> tuple[str, dict]:
+    answer_llm, usage = answer_from_response(result, estimated_tokens)
+    if answer_llm is None:
+        # If we couldn't extract text, log and fallback
+        logger.warning("Unexpected response format from Gemini API, falling back to base_answer")
+        return base_answer, usage
+    answer_llm = truncate_answer(answer_llm)
+    logger.info(f"LLM explanation generated successfully (length: {len(answer_llm)})")
+    cache = get_cache()
+    if cache is not None and cache_key and answer_llm:
+        # Only real model answers are cached, never the base_answer fallback
+        cache.put(cache_key, answer_llm)
+    return answer_llm, usage
+
+def get_cache() -> LLMCache | None:
+    global _cache
+    if _cache is None and LLM_CACHE_ENABLED:
+        _cache = LLMCache(PROMPT_VERSION)
+    return _cache
+
+def _cache_lookup(query: str, matches: list[dict]) -> tuple[str | None, str | None]:
+    """Return (cache_key, cached answer or None). Both None when caching is disabled."""
+    cache = get_cache()
+    if cache is None:
+        return None, None
+    model_name = os.getenv("GEMINI_MODEL_NAME", "gemini-2.0-flash")
+    key = make_key(PROMPT_VERSION, model_name, SYSTEM_INSTRUCTION, query, matches[:3])
+    return key, cache.get(key)
+
+def _preflight(matches: list[dict], base_answer: str) -> tuple[str | None, str | None]:
+    """Return (api_key, None) if a Gemini call should be made, else (None, answer to return)."""
+    # If no matches, return a simple message without calling LLM
+    if not matches:
+        return None, NO_MATCH_ANSWER
+    # Check for API key
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        logger.warning("GEMINI_API_KEY not set. LLM features disabled, returning base_answer")
+        return None, base_answer
+    return api_key, None
+
+
+# --- sync path (scripts) ---
+
+def _job_vectorizer(job_id: str):
+    """The job's vectorizer for prompt trimming, or None if it can't be loaded."""
+    try:
+        return load_vectorizer(job_id)
+    except Exception as e:
+        # A corrupt index or a lock timeout only costs the relevance-based trimming
+        logger.warning(f"Vectorizer for job {job_id} unavailable, prompt built without it: {e}")
+        return None
+
+def _get_session():
+    global _session
+    if _session is None:
+        import requests
+        _session = requests.Session()
+    return _session
+
+def explain_with_llm(query: str, matches: list[dict], base_answer: str) -> str:
+    """
+    Use Gemini API to rewrite the base_answer into simple, tenant-friendly language.
     
+    Args:
+        query: User's question
+        matches: List of matched clauses with risk info (up to top 3)
+        base_answer: Original rule-based answer string
+    
+    Returns:
+        Plain string explanation in simple language (8th-grade level)
+    """
+    answer, _ = explain_with_llm_usage(query, matches, base_answer)
+    return answer
+
+def explain_with_llm_usage(query: str, matches: list[dict], base_answer: str,
+                           job_id: str | None = None) -> tuple[str, dict]:
+    """
+    Same as explain_with_llm, but also returns Gemini token usage
+    ({prompt_tokens, completion_tokens, total_tokens}; all 0 when no call was made).
+    With job_id, long clauses are trimmed using that job's TF-IDF weights.
+    """
+    import requests
+
+    api_key, early = _preflight(matches, base_answer)
+    if api_key is None:
+        return early, _empty_usage()
+    cache_key, cached = _cache_lookup(query, matches)
+    if cached is not None:
+        return cached, {**_empty_usage(), "cached": True}
+    # Compose before taking a breaker slot: a HALF_OPEN trial must always be recorded or cancelled
+    prompt, estimated = compose_prompt(query, matches, _job_vectorizer(job_id) if job_id else None)
+    if not breaker.allow():
+        return base_answer, _empty_usage()
+    url, headers, payload = _request_parts(api_key, prompt)
+    outcome = "error"
+    start = perf_counter()
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
+        with timed("llm_call"):
+            response = _get_session().post(url, headers=headers, json=payload,
+                                           timeout=(GEMINI_CONNECT_TIMEOUT, GEMINI_READ_TIMEOUT))
         response.raise_for_status()
-        
-        result = response.json()
-        
-        # Extract the generated text from the response
-        if "candidates" in result and len(result["candidates"]) > 0:
-            if "content" in result["candidates"][0] and "parts" in result["candidates"][0]["content"]:
-                if len(result["candidates"][0]["content"]["parts"]) > 0:
-                    answer_llm = result["candidates"][0]["content"]["parts"][0].get("text", "").strip()
-                    
-                    # Ensure plain text (no JSON or bullet lists if it looks like structured data)
-                    # Truncate if very long
-                    if len(answer_llm) > 800:
-                        answer_llm = answer_llm[:800].rsplit(".", 1)[0] + "."
-                    
-                    logger.info(f"LLM explanation generated successfully (length: {len(answer_llm)})")
-                    return answer_llm
-        
-        # If we couldn't extract text, log and fallback
-        logger.warning("Unexpected response format from Gemini API, falling back to base_answer")
-        return base_answer
-        
+        outcome = "ok"
+        return _finish(response.json(), base_answer, cache_key, estimated)
     except requests.exceptions.Timeout:
+        outcome = "timeout"
         logger.error("Timeout calling Gemini API, returning base_answer")
-        return base_answer
     except requests.exceptions.HTTPError as e:
-        error_detail = ""
-        if e.response is not None:
-            try:
-                error_json = e.response.json()
-                error_detail = f"Status {e.response.status_code}: {error_json.get('error', {}).get('message', 'Unknown error')}"
-            except:
-                error_detail = f"Status {e.response.status_code}: {e.response.text[:200]}"
-        else:
-            error_detail = "Unknown HTTP error"
-        logger.error(f"HTTP error calling Gemini API: {error_detail}, returning base_answer")
-        return base_answer
+        logger.error(f"HTTP error calling Gemini API: {_http_error_detail(e.response)}, returning base_answer")
     except (requests.exceptions.RequestException, json.JSONDecodeError, KeyError, ValueError) as e:
         logger.error(f"Error calling Gemini API: {e}, returning base_answer")
-        return base_answer
     except Exception as e:
         logger.error(f"Unexpected error calling Gemini API: {e}, returning base_answer")
-        return base_answer
+    finally:
+        breaker.record(_classify(outcome, start))
+    return base_answer, _empty_usage()
+
+def _classify(outcome: str, start: float) -> str:
+    if outcome == "ok" and (perf_counter() - start) * 1000 > GEMINI_SLOW_CALL_MS:
+        return "slow"
+    return outcome
+
+def _http_error_detail(response) -> str:
+    if response is None:
+        return "Unknown HTTP error"
+    try:
+        error_json = response.json()
+        return f"Status {response.status_code}: {error_json.get('error', {}).get('message', 'Unknown error')}"
+    except Exception:
+        return f"Status {response.status_code}: {response.text[:200]}"
+
+
+# --- async path (API) ---
+
+def get_async_client() -> httpx.AsyncClient:
+    """Process-wide keep-alive connection pool for Gemini."""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(GEMINI_READ_TIMEOUT, connect=GEMINI_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=GEMINI_MAX_CONNECTIONS,
+                                max_keepalive_connections=GEMINI_MAX_CONNECTIONS),
+        )
+    return _async_client
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+    return _semaphore
+
+async def close_llm_client() -> None:
+    global _async_client, _semaphore
+    for task in list(_background):
+        task.cancel()
+    if _background:
+        await asyncio.gather(*_background, return_exceptions=True)
+    if _async_client is not None:
+        await _async_client.aclose()
+    _async_client = None
+    _semaphore = None
+
+async def explain_with_llm_async(query: str, matches: list[dict], base_answer: str,
+                                 budget_ms: int | None = None, job_id: str | None = None) -> str:
+    """Async explain_with_llm; never blocks the event loop."""
+    answer, _ = await explain_with_llm_usage_async(query, matches, base_answer, budget_ms, job_id)
+    return answer
+
+async def explain_with_llm_usage_async(query: str, matches: list[dict], base_answer: str,
+                                       budget_ms: int | None = None, job_id: str | None = None) -> tuple[str, dict]:
+    """
+    Async explain_with_llm_usage. Falls back to base_answer on any failure, when
+    the circuit breaker is open, or when budget_ms elapses first. A call cut off by
+    the budget keeps running in the background so its answer still lands in the cache.
+    """
+    api_key, early = _preflight(matches, base_answer)
+    if api_key is None:
+        return early, _empty_usage()
+    # A miss in the in-memory tier reads SQLite: keep it off the event loop
+    cache_key, cached = await asyncio.to_thread(_cache_lookup, query, matches)
+    if cached is not None:
+        # Cache hits skip the network (and the concurrency limit) entirely
+        return cached, {**_empty_usage(), "cached": True}
+    # Compose before taking a breaker slot: a HALF_OPEN trial must always be recorded or cancelled
+    prompt, estimated = await _compose_prompt_async(query, matches, job_id)
+    if not breaker.allow():
+        logger.info("Gemini circuit open, returning base_answer")
+        return base_answer, _empty_usage()
+    task = asyncio.ensure_future(_generate(api_key, prompt, base_answer, cache_key, estimated))
+    if not budget_ms:
+        return await task
+    # shield() lets the call outlive this request (budget timeout or disconnect): keep it referenced
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), timeout=budget_ms / 1000)
+    except asyncio.TimeoutError:
+        inc("clauseclear_llm_budget_exceeded_total")
+        logger.info(f"LLM latency budget of {budget_ms} ms exceeded, returning base_answer")
+        return base_answer, _empty_usage()
+
+async def _compose_prompt_async(query: str, matches: list[dict], job_id: str | None) -> tuple[str, int]:
+    # Loading the vectorizer is file I/O the first time; keep it off the event loop
+    vectorizer = await asyncio.to_thread(_job_vectorizer, job_id) if job_id else None
+    return compose_prompt(query, matches, vectorizer)
+
+async def _generate(api_key: str, prompt: str, base_answer: str, cache_key: str | None,
+                    estimated_tokens: int | None = None) -> tuple[str, dict]:
+    result = await call_gemini_async(api_key, prompt)
+    if result is None:
+        logger.info("Gemini call failed, returning base_answer")
+        return base_answer, _empty_usage()
+    # _finish writes the answer to the SQLite cache
+    return await asyncio.to_thread(_finish, result, base_answer, cache_key, estimated_tokens)
+
+async def call_gemini_async(api_key: str, prompt: str, generation_config: dict | None = None) -> dict | None:
+    """
+    One generateContent call through the shared pool and concurrency limit.
+    The caller must already hold breaker.allow(); the outcome is recorded here.
+    Returns the parsed response JSON, or None on any failure.
+    """
+    url, headers, payload = _request_parts(api_key, prompt, generation_config=generation_config)
+    sem = _get_semaphore()
+    try:
+        await asyncio.wait_for(sem.acquire(), timeout=GEMINI_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        breaker.cancel()
+        logger.warning(f"Gemini concurrency limit ({GEMINI_MAX_CONCURRENCY}) saturated")
+        return None
+    outcome = "error"
+    start = perf_counter()
+    try:
+        with timed("llm_call"):
+            response = await get_async_client().post(url, headers=headers, json=payload)
+        response.raise_for_status()
+        result = response.json()
+        outcome = "ok"
+        return result
+    except httpx.TimeoutException:
+        outcome = "timeout"
+        logger.error("Timeout calling Gemini API")
+    except httpx.HTTPStatusError as e:
+        logger.error(f"HTTP error calling Gemini API: {_http_error_detail(e.response)}")
+    except (httpx.RequestError, json.JSONDecodeError, KeyError, ValueError) as e:
+        logger.error(f"Error calling Gemini API: {e}")
+    except Exception as e:
+        logger.error(f"Unexpected error calling Gemini API: {e}")
+    except asyncio.CancelledError:
+        # Task cancelled (shutdown): not a Gemini failure
+        outcome = "cancelled"
+        raise
+    finally:
+        sem.release()
+        if outcome == "cancelled":
+            breaker.cancel()
+        else:
+            breaker.record(_classify(outcome, start))
+    return None
+
+async def probe_gemini() -> bool:
+    """Cheap health check used by the breaker: fetch the model's metadata."""
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        return False
+    model_name = os.getenv("GEMINI_MODEL_NAME", "gemini-2.0-flash")
+    response = await get_async_client().get(f"{GEMINI_BASE_URL}/models/{model_name}",
+                                            headers={"x-goog-api-key": api_key},
+                                            timeout=GEMINI_CONNECT_TIMEOUT)
+    return response.status_code == 200
+
+async def run_breaker_probe() -> None:
+    await breaker.probe_loop(probe_gemini)
+
+
+async def stream_with_llm_async(query: str, matches: list[dict], base_answer: str, job_id: str | None = None):
+    """
+    Stream an explanation from Gemini's streamGenerateContent endpoint.
+
+    Yields ("token", text) for each chunk, capped so no more than MAX_ANSWER_CHARS
+    are ever forwarded, then exactly one ("done", answer_llm, usage). answer_llm is
+    the final sentence-trimmed text (same contract as explain_with_llm), or
+    base_answer if the call failed part-way.
+    """
+    api_key, early = _preflight(matches, base_answer)
+    if api_key is None:
+        yield "done", early, _empty_usage()
+        return
+    cache_key, cached = await asyncio.to_thread(_cache_lookup, query, matches)
+    if cached is not None:
+        yield "token", cached
+        yield "done", cached, {**_empty_usage(), "cached": True}
+        return
+    prompt, estimated = await _compose_prompt_async(query, matches, job_id)
+    if not breaker.allow():
+        logger.info("Gemini circuit open, returning base_answer")
+        yield "done", base_answer, _empty_usage()
+        return
+
+    url, headers, payload = _request_parts(api_key, prompt, "streamGenerateContent")
+    sem = _get_semaphore()
+    try:
+        await asyncio.wait_for(sem.acquire(), timeout=GEMINI_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        breaker.cancel()
+        logger.warning(f"Gemini concurrency limit ({GEMINI_MAX_CONCURRENCY}) saturated, returning base_answer")
+        yield "done", base_answer, _empty_usage()
+        return
+
+    text = ""
+    usage = _empty_usage()
+    failed = False
+    capped = False
+    outcome = "error"
+    start = perf_counter()
+    try:
+        with timed("llm_call"):
+            async with get_async_client().stream("POST", url, headers=headers, json=payload,
+                                                 params={"alt": "sse"}) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    chunk = json.loads(line[5:].strip())
+                    if chunk.get("usageMetadata"):
+                        usage = _usage_from_response(chunk)
+                    piece = _extract_text_raw(chunk)
+                    if not piece:
+                        continue
+                    room = MAX_ANSWER_CHARS - len(text)
+                    piece = piece[:room]
+                    text += piece
+                    if piece:
+                        yield "token", piece
+                    if len(text) >= MAX_ANSWER_CHARS:
+                        # Length cap reached: stop reading, closing the upstream stream early
+                        capped = True
+                        break
+        outcome = "ok"
+    except httpx.TimeoutException:
+        outcome = "timeout"
+        logger.error("Timeout streaming from Gemini API, returning base_answer")
+        failed = True
+    except httpx.HTTPStatusError as e:
+        logger.error(f"HTTP error streaming from Gemini API: status {e.response.status_code}, returning base_answer")
+        failed = True
+    except (httpx.RequestError, json.JSONDecodeError, KeyError, ValueError) as e:
+        logger.error(f"Error streaming from Gemini API: {e}, returning base_answer")
+        failed = True
+    except Exception as e:
+        # Anything else must still end the stream with a done event
+        logger.error(f"Unexpected error streaming from Gemini API: {e}, returning base_answer")
+        failed = True
+    except (GeneratorExit, asyncio.CancelledError):
+        # Client went away / task cancelled: not a Gemini failure
+        outcome = "cancelled"
+        raise
+    finally:
+        sem.release()
+        if outcome == "cancelled":
+            breaker.cancel()
+        else:
+            breaker.record(_classify(outcome, start))
+
+    _record_usage(usage, estimated)
+    answer_llm = text.strip()
+    if capped:
+        # Same sentence-boundary trim as truncate_answer applies to full responses
+        answer_llm = answer_llm.rsplit(".", 1)[0] + "."
+    if failed or not answer_llm:
+        if not failed:
+            logger.warning("Empty streamed response from Gemini API, falling back to base_answer")
+        yield "done", base_answer, usage
+        return
+    logger.info(f"LLM explanation streamed successfully (length: {len(answer_llm)})")
+    cache = get_cache()
+    if cache is not None and cache_key:
+        await asyncio.to_thread(cache.put, cache_key, answer_llm)
+    yield "done", answer_llm, usage
@@ -0,0 +1,147 @@
+"""
+In-process stage timing and Prometheus text exposition.
+
+`timed(stage)` records a duration into a per-stage histogram and, when a request
+timer is active (see `start_request_timer`), into that request's stage breakdown
+so the handler can store real latencies in the analytics collection.
+"""
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_lock = threading.Lock()
+# (metric name, sorted label tuple) -> [bucket counts..., sum, count]
+_histograms: dict[tuple[str, tuple], list[float]] = {}
+_counters: dict[tuple[str, tuple], float] = {}
+_gauges: dict[tuple[str, tuple], float] = {}
+_help = {
+    "clauseclear_stage_seconds": "Time spent in each pipeline stage",
+    "clauseclear_http_request_seconds": "Total request latency by route",
+    "clauseclear_llm_tokens_total": "Gemini tokens consumed",
+    "clauseclear_llm_cache_total": "LLM explanation cache lookups by result",
+    "clauseclear_llm_cache_hit_ratio": "Share of LLM cache lookups served from cache",
+    "clauseclear_circuit_state": "Circuit breaker state (0 closed, 1 half-open, 2 open)",
+    "clauseclear_circuit_rejected_total": "Calls answered without the dependency because the breaker was open",
+    "clauseclear_llm_budget_exceeded_total": "LLM calls that ran past the caller's latency budget",
+    "clauseclear_storage_bytes": "Bytes used by uploads and TF-IDF indexes at the last lifecycle sweep",
+    "clauseclear_storage_evictions_total": "Jobs evicted or archived by the lifecycle sweeper, by reason",
+    "clauseclear_singleflight_total": "Coalesced operations by outcome (leader ran it, others shared its result)",
+    "clauseclear_http_cache_total": "Cached JSON responses by route and result (not_modified, hit, miss)",
+    "clauseclear_admission_total": "Admission decisions by endpoint class (admitted, queued, user_limit, queue_full, timeout)",
+    "clauseclear_admission_wait_seconds": "Time admitted requests waited in the admission queue",
+    "clauseclear_admission_in_flight": "Requests holding an admission slot, by endpoint class",
+    "clauseclear_admission_queued": "Requests waiting for an admission slot, by endpoint class",
+    "clauseclear_ready": "Startup warm-up steps that have completed (1) or not yet (0)",
+}
+
+_current: ContextVar["StageTimer | None"] = ContextVar("stage_timer", default=None)
+
+
+class StageTimer:
+    """Per-request accumulator of stage durations (ms)."""
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.stages_ms: dict[str, float] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages_ms[stage] = self.stages_ms.get(stage, 0.0) + seconds * 1000
+
+    def elapsed_ms(self) -> int:
+        return int((perf_counter() - self.started) * 1000)
+
+    def breakdown(self) -> dict[str, int]:
+        return {k: int(round(v)) for k, v in self.stages_ms.items()}
+
+
+def start_request_timer() -> StageTimer:
+    timer = StageTimer()
+    _current.set(timer)
+    return timer
+
+
+def observe(name: str, value: float, **labels) -> None:
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = [0.0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                h[i] += 1
+        h[-2] += value
+        h[-1] += 1
+
+
+def inc(name: str, amount: float = 1.0, **labels) -> None:
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + amount
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _gauges[key] = value
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    observe("clauseclear_stage_seconds", seconds, stage=stage)
+    timer = _current.get()
+    if timer is not None:
+        timer.add(stage, seconds)
+
+
+@contextmanager
+def timed(stage: str):
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, perf_counter() - start)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(labels: tuple, extra: tuple = ()) -> str:
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def render_prometheus() -> str:
+    with _lock:
+        hists = {k: list(v) for k, v in _histograms.items()}
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+    lines = []
+    seen = set()
+    for (name, labels), h in sorted(hists.items()):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# HELP {name} {_help.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+        for i, bound in enumerate(BUCKETS):
+            lines.append(f"{name}_bucket{_fmt_labels(labels, (('le', bound),))} {int(h[i])}")
+        lines.append(f"{name}_bucket{_fmt_labels(labels, (('le', '+Inf'),))} {int(h[-1])}")
+        lines.append(f"{name}_sum{_fmt_labels(labels)} {h[-2]:.6f}")
+        lines.append(f"{name}_count{_fmt_labels(labels)} {int(h[-1])}")
+    for (name, labels), v in sorted(counters.items()):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# HELP {name} {_help.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_fmt_labels(labels)} {v:g}")
+    for (name, labels), v in sorted(gauges.items()):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# HELP {name} {_help.get(name, name)}")
+            lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name}{_fmt_labels(labels)} {v:g}")
+    return "\n".join(lines) + "\n"
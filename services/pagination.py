@@ -0,0 +1,72 @@
+"""
+Keyset (cursor) pagination over (created_at, _id) for Mongo list endpoints.
+A cursor is an opaque base64 token holding the sort key of the last row served,
+so each page is a single index range scan no matter how deep the user pages.
+"""
+import base64
+import json
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from services.db import ASCENDING, DESCENDING
+
+def encode_cursor(doc: dict) -> str:
+    raw = json.dumps({"t": doc.get("created_at"), "id": str(doc.get("_id"))}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[str, ObjectId]:
+    """Raises ValueError for malformed cursors."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return data["t"], ObjectId(data["id"])
+    except (ValueError, KeyError, TypeError, InvalidId) as e:
+        raise ValueError(f"invalid cursor: {e}") from e
+
+def keyset_query(base_filter: dict, cursor: str | None, descending: bool) -> tuple[dict, list]:
+    """Return (filter, sort) for the page that follows `cursor`."""
+    direction = DESCENDING if descending else ASCENDING
+    sort = [("created_at", direction), ("_id", direction)]
+    if not cursor:
+        return dict(base_filter), sort
+    created_at, oid = decode_cursor(cursor)
+    op = "$lt" if descending else "$gt"
+    filt = {
+        **base_filter,
+        "$or": [
+            {"created_at": {op: created_at}},
+            {"created_at": created_at, "_id": {op: oid}},
+        ],
+    }
+    return filt, sort
+
+def fetch_page(collection, base_filter: dict, projection: dict, cursor: str | None,
+               limit: int, descending: bool) -> tuple[list[dict], str | None]:
+    """
+    Fetch one page. Returns (docs, next_cursor); next_cursor is None on the last page.
+    Docs keep their _id so callers can build per-row cursors; strip it before returning.
+    """
+    filt, sort = keyset_query(base_filter, cursor, descending)
+    # _id and created_at are needed to build the next cursor even if the view hides them
+    proj = {k: v for k, v in projection.items() if k != "_id"}
+    if proj and all(v for v in proj.values()):
+        proj["created_at"] = 1
+    docs = list(collection.find(filt, proj or None).sort(sort).limit(limit + 1))
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    next_cursor = encode_cursor(docs[-1]) if has_more and docs else None
+    return docs, next_cursor
+
+def iter_rows(collection, base_filter: dict, projection: dict, cursor: str | None,
+              limit: int, descending: bool, batch_size: int = 50):
+    """Yield (doc, cursor_after_doc) for up to `limit` rows, fetching in keyset batches."""
+    remaining = limit
+    while remaining > 0:
+        docs, next_cursor = fetch_page(collection, base_filter, projection, cursor,
+                                       min(batch_size, remaining), descending)
+        for doc in docs:
+            yield doc, encode_cursor(doc)
+        remaining -= len(docs)
+        if next_cursor is None:
+            return
+        cursor = next_cursor
@@ -0,0 +1,230 @@
+"""
+Streaming text extraction from .docx (OOXML) files.
+
+word/document.xml is read straight out of the zip with iterparse, so no DOM
+of the document is built: each paragraph, or table row (cells joined with
+" | "), is emitted as soon as its closing tag is seen, and the body's finished
+children are cleared. Memory stays flat on 100+ page documents.
+
+The blocks are grouped into page-like chunks for clauses_from_pages. Page
+boundaries come from explicit page breaks, "page break before" paragraphs,
+section breaks, and the page breaks Word records on save
+(lastRenderedPageBreak). Without those, a chunk is closed after about
+DOCX_PAGE_CHARS characters. Headers, footers, comments and tracked
+deletions are not extracted.
+"""
+import os
+import zlib
+import zipfile
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from loguru import logger
+from dotenv import load_dotenv
+
+from services.metrics import timed
+
+load_dotenv()
+# Roughly one printed page of agreement text
+DOCX_PAGE_CHARS = int(os.getenv("DOCX_PAGE_CHARS", "3000"))
+# Refuse document.xml parts that inflate beyond this (zip bombs); counted on
+# the bytes actually decompressed, not the size the zip declares
+DOCX_MAX_XML_MB = int(os.getenv("DOCX_MAX_XML_MB", "200"))
+
+DOCUMENT_XML = "word/document.xml"
+PAGE = ("page", None)
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+BODY, P, R, T, TAB, BR, CR = (_W + t for t in ("body", "p", "r", "t", "tab", "br", "cr"))
+TBL, TR, TC = _W + "tbl", _W + "tr", _W + "tc"
+PPR, SECT_PR, PAGE_BREAK_BEFORE = _W + "pPr", _W + "sectPr", _W + "pageBreakBefore"
+LAST_RENDERED = _W + "lastRenderedPageBreak"
+NO_BREAK_HYPHEN = _W + "noBreakHyphen"
+_TYPE, _VAL = _W + "type", _W + "val"
+# Text boxes and shapes repeat their text in a fallback rendering; read it once
+FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+
+
+def iter_blocks(stream):
+    """
+    Yield ("text", paragraph or table row) and PAGE markers in document order
+    from a document.xml stream.
+    """
+    body = None
+    depth = body_depth = 0
+    in_run = in_ppr = False
+    p_depth = skip = 0  # text box paragraphs nest inside a paragraph's runs
+    para: list[str] | None = None
+    break_before = pending_break = False
+    table_depth = 0
+    table = None  # outermost table element, emptied row by row
+    cell: list[str] = []
+    row: list[str] = []
+
+    def page_break():
+        nonlocal break_before, pending_break
+        # A break before any text of a top-level paragraph starts the new page with it
+        if para is not None and not table_depth and not "".join(para).strip():
+            break_before = True
+        else:
+            pending_break = True
+
+    for event, el in ET.iterparse(stream, events=("start", "end")):
+        tag = el.tag
+        if event == "start":
+            depth += 1
+            if skip or tag == FALLBACK:
+                skip += tag == FALLBACK
+                continue
+            if tag == BODY:
+                body, body_depth = el, depth
+            elif tag == P:
+                p_depth += 1
+                if p_depth == 1:
+                    para = []
+                elif para is not None:
+                    para.append("\n")
+            elif tag == R:
+                in_run = True
+            elif tag == PPR:
+                in_ppr = True
+            elif tag == TBL:
+                table_depth += 1
+                if table_depth == 1:
+                    table = el
+            continue
+
+        if skip:
+            skip -= tag == FALLBACK
+        elif tag == T and para is not None:
+            para.append(el.text or "")
+        elif tag == TAB and in_run and para is not None:
+            para.append(" ")
+        elif tag == NO_BREAK_HYPHEN and para is not None:
+            para.append("-")
+        elif tag in (BR, CR) and para is not None:
+            if el.get(_TYPE) == "page":
+                page_break()
+            else:
+                para.append("\n")
+        elif tag == LAST_RENDERED:
+            page_break()
+        elif tag == PAGE_BREAK_BEFORE and el.get(_VAL, "true") not in ("0", "false", "off"):
+            break_before = True
+        elif tag == SECT_PR and in_ppr:
+            # Section break: the section ends with this paragraph
+            pending_break = True
+        elif tag == R:
+            in_run = False
+        elif tag == PPR:
+            in_ppr = False
+        elif tag == P and p_depth > 1:
+            p_depth -= 1
+            if para is not None:
+                para.append("\n")
+        elif tag == P:
+            p_depth -= 1
+            text = "".join(para or ()).strip()
+            para = None
+            if table_depth:
+                if text:
+                    cell.append(text)
+            else:
+                if break_before:
+                    yield PAGE
+                if text:
+                    yield ("text", text)
+            break_before = False
+        elif tag == TC and table_depth == 1:
+            row.append(" ".join(cell))
+            cell = []
+        elif tag == TR and table_depth == 1:
+            text = " | ".join(c for c in row if c)
+            row = []
+            table.clear()
+            if text:
+                yield ("text", text)
+        elif tag == TBL:
+            table_depth -= 1
+
+        if pending_break and para is None and ((tag in (P, TBL) and not table_depth)
+                                               or (tag == TR and table_depth == 1)):
+            yield PAGE
+            pending_break = False
+        if body is not None and depth == body_depth + 1:
+            # A top-level paragraph or table is done: drop it from the tree
+            body.clear()
+        depth -= 1
+
+
+class _LimitedReader:
+    """File-like view of a zip member that fails once more than `limit` bytes came out of it."""
+
+    def __init__(self, stream, limit: int, name: str):
+        self.stream = stream
+        self.limit = limit
+        self.name = name
+        self.total = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.stream.read(size)
+        self.total += len(data)
+        if self.total > self.limit:
+            raise ValueError(f"{self.name}: document text exceeds {DOCX_MAX_XML_MB} MB")
+        return data
+
+
+def iter_pages(path: Path, page_chars: int = DOCX_PAGE_CHARS):
+    """Yield the document's text one page-like chunk at a time."""
+    try:
+        archive = zipfile.ZipFile(path)
+    except zipfile.BadZipFile:
+        raise ValueError(f"{path.name} is not a valid .docx file")
+    with archive:
+        try:
+            info = archive.getinfo(DOCUMENT_XML)
+        except KeyError:
+            raise ValueError(f"{path.name} has no {DOCUMENT_XML}; not a Word document")
+        limit = DOCX_MAX_XML_MB * 1024 * 1024
+        if info.file_size > limit:
+            raise ValueError(f"{path.name}: document text exceeds {DOCX_MAX_XML_MB} MB")
+        lines: list[str] = []
+        size = 0
+        has_breaks = False
+        try:
+            stream = archive.open(info)
+        except (zipfile.BadZipFile, NotImplementedError, RuntimeError) as e:
+            # Damaged header, unsupported compression or encryption
+            raise ValueError(f"{path.name}: cannot read {DOCUMENT_XML} ({e})")
+        with stream:
+            try:
+                for kind, text in iter_blocks(_LimitedReader(stream, limit, path.name)):
+                    if kind == "page":
+                        has_breaks = True
+                        if lines:
+                            yield "\n".join(lines)
+                            lines, size = [], 0
+                        continue
+                    lines.append(text)
+                    size += len(text) + 1
+                    # With real page breaks to follow, only cap runaway chunks
+                    if size >= (page_chars * 4 if has_breaks else page_chars):
+                        yield "\n".join(lines)
+                        lines, size = [], 0
+            except ET.ParseError as e:
+                raise ValueError(f"{path.name}: malformed document.xml ({e})")
+            except (zipfile.BadZipFile, zlib.error, EOFError) as e:
+                # Corrupt or truncated compressed data, or a CRC mismatch
+                raise ValueError(f"{path.name}: damaged .docx file ({e})")
+        if lines:
+            yield "\n".join(lines)
+
+
+def extract_text_from_docx(docx_path: Path) -> list[str]:
+    if not docx_path.exists():
+        raise FileNotFoundError(docx_path)
+    pages = []
+    with timed("docx_extract"):
+        for i, text in enumerate(iter_pages(docx_path), start=1):
+            logger.info(f"Page {i} extracted text length: {len(text)}")
+            pages.append(text)
+    return pages
@@ -1,15 +1,19 @@
 from pathlib import Path
 import re
-from PyPDF2 import PdfReader
 from loguru import logger
 
+from services.metrics import timed
+
 def extract_text_from_pdf(pdf_path: Path) -> list[str]:
+    from PyPDF2 import PdfReader  # imported on first use to keep app startup fast
+
     if not pdf_path.exists():
         raise FileNotFoundError(pdf_path)
     reader = PdfReader(str(pdf_path))
     pages = []
     for i, page in enumerate(reader.pages, start=1):
-        text = (page.extract_text() or "").strip()
+        with timed("pdf_extract_page"):
+            text = (page.extract_text() or "").strip()
         # DEBUGGING: Track extraction quality
         logger.info(f"Page {i} extracted text length: {len(text)}")
         
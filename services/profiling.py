@@ -0,0 +1,173 @@
+"""
+Opt-in per-request profiling.
+
+The access middleware calls `begin_request` to decide whether this request is
+profiled (admin header or random sampling). Pipeline endpoints are wrapped with
+`@profiled`, which runs cProfile inside the thread that actually executes the
+handler (sync FastAPI endpoints run in a threadpool, so profiling in the
+middleware would only see the event loop). When profiling is off the cost is a
+header lookup, one random() call and a ContextVar read.
+
+Async endpoints are profiled on the event loop thread, so the profile also
+contains whatever other requests ran on the loop while the handler awaited.
+Only one async profile runs at a time (cProfile hooks are per thread, and a
+second one would replace the first); a request selected while one is running
+is served unprofiled. Writing the profile happens off the loop.
+
+Profiles are written under logs/profiles as <job_id>_<request_id>.prof (pstats
+format: open with snakeviz, or convert with flameprof/gprof2dot) plus a .txt
+call tree sorted by cumulative time. The request id comes from the client's
+X-Request-Id header, so only [A-Za-z0-9-] is kept from it (never "_", which
+separates it from the job id). A failed write is logged and never fails the
+request.
+"""
+import os
+import io
+import re
+import random
+import asyncio
+import cProfile
+import pstats
+import inspect
+import functools
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+from uuid import uuid4
+from loguru import logger
+from dotenv import load_dotenv
+
+load_dotenv()
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "logs/profiles"))
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+PROFILE_HEADER = "x-profile"
+_UNSAFE_ID = re.compile(r"[^A-Za-z0-9-]")
+_UNSAFE_JOB_ID = re.compile(r"[^\w-]")
+
+_active: ContextVar[dict | None] = ContextVar("profile_request", default=None)
+# An async profile is running on the event loop (only touched from the loop)
+_async_busy = False
+
+
+def is_admin(token: str | None) -> bool:
+    return bool(PROFILE_ADMIN_TOKEN) and token == PROFILE_ADMIN_TOKEN
+
+
+def _request_id(header: str | None) -> str:
+    return _UNSAFE_ID.sub("", header or "")[:64] or uuid4().hex[:12]
+
+
+def begin_request(headers) -> dict | None:
+    """Mark the current request for profiling if requested by an admin or sampled."""
+    if is_admin(headers.get(PROFILE_HEADER)) or (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE):
+        state = {"request_id": _request_id(headers.get("x-request-id")), "saved": None}
+        _active.set(state)
+        return state
+    return None
+
+
+def _save(profiler: cProfile.Profile, state: dict, job_id: str | None, endpoint: str) -> None:
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    name = f"{_UNSAFE_JOB_ID.sub('', job_id or '') or 'nojob'}_{state['request_id']}"
+    profiler.dump_stats(PROFILE_DIR / f"{name}.prof")
+    buf = io.StringIO()
+    buf.write(f"# endpoint={endpoint} job_id={job_id} request_id={state['request_id']} "
+              f"at={datetime.now(timezone.utc).isoformat()}\n")
+    pstats.Stats(profiler, stream=buf).sort_stats("cumulative").print_stats(60)
+    (PROFILE_DIR / f"{name}.txt").write_text(buf.getvalue(), encoding="utf-8")
+    state["saved"] = name
+    logger.info(f"profile_saved name={name} endpoint={endpoint}")
+    _prune()
+
+
+def _save_quietly(profiler: cProfile.Profile, state: dict, job_id: str | None, endpoint: str) -> None:
+    # Runs in the handler's finally: must never replace its result or exception
+    try:
+        _save(profiler, state, job_id, endpoint)
+    except Exception as e:
+        logger.warning(f"profile_save_failed endpoint={endpoint} request_id={state['request_id']} error={e}")
+
+
+def _prune() -> None:
+    profs = sorted(PROFILE_DIR.glob("*.prof"), key=lambda p: p.stat().st_mtime, reverse=True)
+    for old in profs[PROFILE_MAX_FILES:]:
+        old.unlink(missing_ok=True)
+        old.with_suffix(".txt").unlink(missing_ok=True)
+
+
+def _enable(profiler: cProfile.Profile, endpoint: str) -> bool:
+    try:
+        profiler.enable()
+        return True
+    except ValueError as e:
+        # Python 3.12+: only one profiler may be active per process
+        logger.info(f"profile_skipped endpoint={endpoint} reason={e}")
+        return False
+
+
+def profiled(fn):
+    """Profile the wrapped endpoint when the current request was selected by begin_request."""
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            global _async_busy
+            state = _active.get()
+            if state is None:
+                return await fn(*args, **kwargs)
+            if _async_busy:
+                logger.info(f"profile_skipped endpoint={fn.__name__} reason=async_profile_running")
+                return await fn(*args, **kwargs)
+            profiler = cProfile.Profile()
+            if not _enable(profiler, fn.__name__):
+                return await fn(*args, **kwargs)
+            _async_busy = True
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                profiler.disable()
+                _async_busy = False
+                await asyncio.to_thread(_save_quietly, profiler, state, kwargs.get("job_id"), fn.__name__)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        state = _active.get()
+        if state is None:
+            return fn(*args, **kwargs)
+        profiler = cProfile.Profile()
+        if not _enable(profiler, fn.__name__):
+            return fn(*args, **kwargs)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler.disable()
+            _save_quietly(profiler, state, kwargs.get("job_id"), fn.__name__)
+    return wrapper
+
+
+def list_profiles(limit: int = 50) -> list[dict]:
+    if not PROFILE_DIR.exists():
+        return []
+    profs = sorted(PROFILE_DIR.glob("*.prof"), key=lambda p: p.stat().st_mtime, reverse=True)[:limit]
+    out = []
+    for p in profs:
+        job_id, _, request_id = p.stem.rpartition("_")
+        st = p.stat()
+        out.append({
+            "name": p.stem,
+            "job_id": job_id,
+            "request_id": request_id,
+            "bytes": st.st_size,
+            "created_at": datetime.fromtimestamp(st.st_mtime, timezone.utc).isoformat(),
+        })
+    return out
+
+
+def profile_path(name: str, kind: str) -> Path | None:
+    """Resolve a stored profile by name; kind is 'prof' or 'txt'. Rejects path traversal."""
+    if kind not in ("prof", "txt") or "/" in name or "\\" in name or name.startswith("."):
+        return None
+    path = PROFILE_DIR / f"{name}.{kind}"
+    return path if path.is_file() else None
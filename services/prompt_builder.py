@@ -0,0 +1,120 @@
+"""
+Token-budgeted context for explanation prompts.
+
+Clause texts go into the prompt whole while the prompt fits in
+PROMPT_TOKEN_BUDGET. Longer clauses are cut down to the sentences most relevant
+to the question, scored with the job's own TF-IDF vectorizer (word overlap
+when no index is available). Each kept sentence stays in document order and
+gaps are marked with "...". Reasons repeated across matches are listed once.
+
+Token counts are estimated at ~4 characters per token, which is close enough
+for budgeting. The estimate is reported next to Gemini's actual
+promptTokenCount, so drift shows up in metrics and logs.
+"""
+import os
+import re
+import math
+from dotenv import load_dotenv
+
+load_dotenv()
+# Whole prompt (instruction + question + clauses); 0 disables trimming
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "900"))
+CHARS_PER_TOKEN = 4
+
+_SENTENCE_END = re.compile(r"(?<=[.;:!?])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def split_sentences(text: str) -> list[str]:
+    return [s.strip() for s in _SENTENCE_END.split(text) if s.strip()]
+
+
+def dedupe_reasons(matches: list[dict]) -> list[list[str]]:
+    """Per match, the reasons not already given for an earlier match."""
+    seen = set()
+    out = []
+    for m in matches:
+        fresh = []
+        for reason in m.get("reasons", []):
+            if reason not in seen:
+                seen.add(reason)
+                fresh.append(reason)
+        out.append(fresh)
+    return out
+
+
+def _relevance(query: str, sentences: list[str], vectorizer=None) -> list[float]:
+    if vectorizer is not None:
+        from sklearn.metrics.pairwise import cosine_similarity
+
+        X = vectorizer.transform([query, *sentences])
+        return [float(s) for s in cosine_similarity(X[0], X[1:])[0]]
+    q = set(re.findall(r"[a-z0-9]+", query.lower()))
+    return [len(q & set(re.findall(r"[a-z0-9]+", s.lower()))) / (len(q) or 1) for s in sentences]
+
+
+def trim_to_budget(query: str, text: str, budget: int, vectorizer=None) -> tuple[str, int]:
+    """
+    Keep the most relevant sentences of `text` within `budget` tokens, in their
+    original order. Returns (text, number of sentences dropped). At least the
+    best sentence is kept, even if it alone exceeds the budget.
+    """
+    if estimate_tokens(text) <= budget:
+        return text, 0
+    sentences = split_sentences(text)
+    if len(sentences) <= 1:
+        # One long sentence: cut at a word boundary
+        cut = text[:max(budget, 1) * CHARS_PER_TOKEN].rsplit(" ", 1)[0]
+        return cut + " ...", 0
+    scores = _relevance(query, sentences, vectorizer)
+    ranked = sorted(range(len(sentences)), key=lambda i: (-scores[i], i))
+    keep, used = set(), 0
+    for i in ranked:
+        cost = estimate_tokens(sentences[i]) + 1
+        if keep and used + cost > budget:
+            continue
+        keep.add(i)
+        used += cost
+    parts, prev = [], -1
+    for i in sorted(keep):
+        if i != prev + 1:
+            parts.append("...")
+        parts.append(sentences[i])
+        prev = i
+    if prev != len(sentences) - 1:
+        parts.append("...")
+    return " ".join(parts), len(sentences) - len(keep)
+
+
+def compact_matches(query: str, matches: list[dict], fixed_tokens: int, vectorizer=None,
+                    budget: int = PROMPT_TOKEN_BUDGET) -> tuple[list[dict], int]:
+    """
+    Fit the matches' clause texts into what is left of `budget` after the
+    fixed parts of the prompt (`fixed_tokens`). Returns the matches with
+    trimmed "text" and deduplicated "reasons", and the number of dropped sentences.
+    """
+    reasons = dedupe_reasons(matches)
+    compacted = [{**m, "reasons": r, "reasons_repeated": bool(m.get("reasons")) and not r}
+                 for m, r in zip(matches, reasons)]
+    if budget <= 0 or not matches:
+        return compacted, 0
+    available = max(budget - fixed_tokens, 0)
+    needs = [estimate_tokens(m.get("text", "")) for m in matches]
+    if sum(needs) <= available:
+        return compacted, 0
+
+    # Fair share, shortest clauses first: whatever a short clause doesn't use
+    # goes to the longer ones
+    dropped = 0
+    remaining = available
+    order = sorted(range(len(compacted)), key=lambda i: needs[i])
+    for n, i in enumerate(order):
+        share = remaining // (len(order) - n)
+        text, cut = trim_to_budget(query, compacted[i].get("text", ""), share, vectorizer)
+        compacted[i]["text"] = text
+        dropped += cut
+        remaining = max(remaining - estimate_tokens(text), 0)
+    return compacted, dropped
@@ -0,0 +1,138 @@
+"""
+Read-only, paged access to a job's stored analysis.json.
+
+Parsed analyses are kept in a small per-worker cache keyed by the file's content
+hash, with the clause positions per risk level precomputed, so a page costs a
+slice and a projection rather than a file read and a full serialisation.
+
+Cursors are opaque tokens holding the analysis version and the (risk rank,
+position) of the last row served. A cursor from an older version of the
+analysis is rejected instead of silently skipping or repeating rows.
+"""
+import os
+import json
+import base64
+import bisect
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+from services.http_cache import file_hash
+from services.storage import job_dir
+
+load_dotenv()
+RESULTS_CACHE_JOBS = int(os.getenv("RESULTS_CACHE_JOBS", "16"))
+
+LEVELS = ("RED", "YELLOW", "GREEN")
+ORDERS = ("risk", "document")
+# Output field -> key in analysis.json
+FIELDS = {
+    "clause_id": "id",
+    "page": "page",
+    "text": "text",
+    "risk_level": "risk_level",
+    "risk_score": "risk_score",
+    "reasons": "reasons",
+    "triggered_rules": "triggered_rules",
+    "hash": "hash",
+}
+DEFAULT_FIELDS = ("clause_id", "page", "text", "risk_level", "reasons")
+
+
+class StaleCursor(ValueError):
+    """The cursor was issued for a previous version of the analysis."""
+
+
+class AnalysisResults:
+    def __init__(self, version: str, clauses: list[dict]):
+        self.version = version
+        self.clauses = clauses
+        self.positions = {lvl: [] for lvl in LEVELS}
+        for i, c in enumerate(clauses):
+            self.positions.setdefault(c.get("risk_level", "GREEN"), []).append(i)
+
+    def counts(self) -> dict:
+        return {lvl: len(self.positions.get(lvl, [])) for lvl in LEVELS}
+
+    def rows(self, levels: list[str], order: str, after: tuple[int, int] | None):
+        """Yield (rank, position, clause) for the selected levels, after `after`."""
+        if order == "document":
+            wanted = set(levels)
+            start = after[1] + 1 if after else 0
+            for i in range(start, len(self.clauses)):
+                if self.clauses[i].get("risk_level", "GREEN") in wanted:
+                    yield 0, i, self.clauses[i]
+            return
+        for rank, lvl in enumerate(LEVELS):
+            if lvl not in levels or (after and rank < after[0]):
+                continue
+            positions = self.positions.get(lvl, [])
+            start = bisect.bisect_right(positions, after[1]) if after and rank == after[0] else 0
+            for i in positions[start:]:
+                yield rank, i, self.clauses[i]
+
+
+_lock = threading.Lock()
+_cache: OrderedDict[str, AnalysisResults] = OrderedDict()
+
+
+def load_results(job_id: str) -> AnalysisResults:
+    """Raises FileNotFoundError if the job has not been analyzed."""
+    path = job_dir(job_id) / "analysis.json"
+    version = file_hash(path)
+    with _lock:
+        cached = _cache.get(job_id)
+        if cached is not None and cached.version == version:
+            _cache.move_to_end(job_id)
+            return cached
+    results = AnalysisResults(version, json.loads(path.read_text(encoding="utf-8")).get("clauses", []))
+    with _lock:
+        _cache[job_id] = results
+        _cache.move_to_end(job_id)
+        while len(_cache) > RESULTS_CACHE_JOBS:
+            _cache.popitem(last=False)
+    return results
+
+
+def parse_levels(risk: str | None) -> list[str]:
+    if not risk:
+        return list(LEVELS)
+    levels = [lvl.strip().upper() for lvl in risk.split(",") if lvl.strip()]
+    unknown = [lvl for lvl in levels if lvl not in LEVELS]
+    if unknown or not levels:
+        raise ValueError(f"risk must be a comma-separated subset of {list(LEVELS)}")
+    return levels
+
+
+def parse_fields(fields: str | None) -> list[str]:
+    if not fields:
+        return list(DEFAULT_FIELDS)
+    names = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in names if f not in FIELDS]
+    if unknown or not names:
+        raise ValueError(f"fields must be a comma-separated subset of {sorted(FIELDS)}")
+    return names
+
+
+def project(clause: dict, fields: list[str]) -> dict:
+    return {f: clause.get(FIELDS[f]) for f in fields}
+
+
+def encode_cursor(version: str, order: str, rank: int, position: int) -> str:
+    raw = json.dumps({"v": version, "o": order, "r": rank, "i": position}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, version: str, order: str) -> tuple[int, int]:
+    """Raises ValueError for malformed cursors and StaleCursor for outdated ones."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        cursor_version, cursor_order, rank, position = data["v"], data["o"], int(data["r"]), int(data["i"])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"invalid cursor: {e}") from e
+    if cursor_order != order:
+        raise ValueError("cursor was issued for a different order")
+    if cursor_version != version:
+        raise StaleCursor("the analysis changed since this cursor was issued; start again without a cursor")
+    return rank, position
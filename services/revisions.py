@@ -0,0 +1,123 @@
+"""
+Revisions: a new upload can be linked to an earlier job of the same user
+(revision 2 of the same agreement, say). Parse then compares clause content
+hashes with the earlier clauses.json, and index + analyze only process the
+clauses that are new or edited. Unchanged clauses reuse the earlier job's
+TF-IDF rows and risk results.
+
+The link is stored as <job dir>/revision.json. The comparison goes into
+clauses.json under "revision", so index and analyze read it from there.
+Only the uploader of the earlier job may link to it; every job records its
+uploader in <job dir>/owner.txt.
+"""
+import os
+import json
+from loguru import logger
+from dotenv import load_dotenv
+
+from services.clauses import clause_content_hash
+from services.storage import job_dir, atomic_write_json, atomic_write_text
+
+load_dotenv()
+# Above this share of new/edited clauses the index is rebuilt from scratch
+# (reused rows keep the earlier revision's vocabulary)
+REVISION_INDEX_MAX_CHANGED = float(os.getenv("REVISION_INDEX_MAX_CHANGED", "0.5"))
+
+REVISION_FILE = "revision.json"
+OWNER_FILE = "owner.txt"
+
+
+def record_owner(job_id: str, uid: str) -> None:
+    atomic_write_text(job_dir(job_id) / OWNER_FILE, uid)
+
+
+def job_owner(job_id: str) -> str | None:
+    """uid that uploaded the job, from its job dir; None for jobs stored before owners were recorded."""
+    path = job_dir(job_id) / OWNER_FILE
+    if path.exists():
+        return path.read_text(encoding="utf-8").strip()
+    revision = job_dir(job_id) / REVISION_FILE
+    if revision.exists():
+        return json.loads(revision.read_text(encoding="utf-8")).get("user_id")
+    return None
+
+
+def link_previous(job_id: str, previous_job_id: str, uid: str) -> None:
+    atomic_write_json(job_dir(job_id) / REVISION_FILE, {"previous_job_id": previous_job_id, "user_id": uid})
+
+
+def previous_job(job_id: str) -> str | None:
+    """The earlier job this one revises, if it was linked at upload and still exists."""
+    path = job_dir(job_id) / REVISION_FILE
+    if not path.exists():
+        return None
+    previous = json.loads(path.read_text(encoding="utf-8")).get("previous_job_id")
+    if previous and not job_dir(previous).exists():
+        logger.info(f"revision_previous_missing job_id={job_id} previous_job_id={previous}")
+        return None
+    return previous
+
+
+def read_job_json(job_id: str, name: str) -> dict | None:
+    path = job_dir(job_id) / name
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"revision_unreadable job_id={job_id} file={name} err={e}")
+        return None
+
+
+def diff_clauses(clauses: list[dict], previous_clauses: list[dict], previous_job_id: str) -> dict:
+    """
+    Compare two clause lists by content hash. A clause whose text is found
+    anywhere in the previous revision is unchanged (it may have moved); otherwise
+    it is "edited" if the previous revision had a clause with the same id, or
+    "added". Previous clauses whose text is gone are "removed".
+    """
+    previous_hashes = {clause_content_hash(c) for c in previous_clauses}
+    previous_ids = {c["id"] for c in previous_clauses}
+    current_hashes = {clause_content_hash(c) for c in clauses}
+    edited, added = [], []
+    unchanged = 0
+    for c in clauses:
+        if clause_content_hash(c) in previous_hashes:
+            unchanged += 1
+        elif c["id"] in previous_ids:
+            edited.append(c["id"])
+        else:
+            added.append(c["id"])
+    removed = [c["id"] for c in previous_clauses if clause_content_hash(c) not in current_hashes]
+    return {
+        "previous_job_id": previous_job_id,
+        "unchanged": unchanged,
+        "edited": edited,
+        "added": added,
+        "removed": removed,
+    }
+
+
+def changed_share(comparison: dict, total: int) -> float:
+    """Share of clauses that are not unchanged (works for a revision diff or a template alignment)."""
+    return 1.0 - comparison["unchanged"] / total if total else 0.0
+
+
+def reuse_analysis(clauses: list[dict], previous_analyzed: list[dict]) -> tuple[list[dict | None], list[int]]:
+    """
+    Risk results for clauses whose text was already scored in the previous
+    revision. Returns one entry per clause (None where it must be scored) and
+    the indexes of those clauses.
+    """
+    by_hash = {clause_content_hash(c): c for c in previous_analyzed}
+    results: list[dict | None] = []
+    todo: list[int] = []
+    for i, c in enumerate(clauses):
+        prev = by_hash.get(clause_content_hash(c))
+        if prev is None:
+            results.append(None)
+            todo.append(i)
+        else:
+            # Keep the risk fields, take id/page/hash from the new revision
+            results.append({**prev, **c})
+    return results, todo
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
 import re
+import json
+import hashlib
 from dataclasses import dataclass
 from typing import List, Dict, Tuple
 
@@ -10,6 +12,8 @@ from services.kb_loader import load_kb
 kb = load_kb()
 RULES = { r["id"]: r for r in kb["severity_rules"] }
 THRESHOLDS = kb["thresholds"]
+# Stored risk results are only reused (revisions) while the rules they came from are unchanged
+RULES_VERSION = hashlib.sha256(json.dumps([kb["severity_rules"], THRESHOLDS], sort_keys=True).encode("utf-8")).hexdigest()[:12]
 
 @dataclass
 class RuleResult:
@@ -0,0 +1,232 @@
+"""
+Single-flight coalescing of identical concurrent work.
+
+Calls are keyed by (job_id, operation, *extra). Within a worker, the first
+caller for a key runs the work and concurrent duplicates wait for it and get
+the same result (or exception). If the caller doing the work is cancelled
+(its client disconnected), the waiting callers don't inherit the
+cancellation: one of them takes over and runs the work. Across workers, the running caller holds an
+flock on <LOCK_ROOT>/<job_id>/<operation>[-<hash>].lock and leaves its
+result next to it; a worker that had to wait for the lock returns that result
+instead of redoing the work. Without fcntl (Windows) only in-worker coalescing
+is done.
+
+Results must be JSON-serialisable to be shared across workers; anything else
+is still coalesced within the worker.
+"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from pathlib import Path
+from loguru import logger
+from dotenv import load_dotenv
+
+from services.metrics import inc
+from services.storage import LOCK_ROOT, atomic_write_text
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX
+    fcntl = None
+
+load_dotenv()
+SINGLEFLIGHT_LOCK_DIR = Path(os.getenv("SINGLEFLIGHT_LOCK_DIR", str(LOCK_ROOT)))
+SINGLEFLIGHT_CROSS_WORKER = os.getenv("SINGLEFLIGHT_CROSS_WORKER", "1") != "0"
+# Longest a worker waits on another worker's lock before doing the work itself
+SINGLEFLIGHT_WAIT_SECONDS = float(os.getenv("SINGLEFLIGHT_WAIT_SECONDS", "120"))
+_POLL_SECONDS = 0.05
+_MISSING = object()
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+class _LeaderGone(Exception):
+    """The caller running the work was cancelled; waiting callers retry."""
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    def __init__(self, lock_dir: Path = SINGLEFLIGHT_LOCK_DIR, cross_worker: bool = SINGLEFLIGHT_CROSS_WORKER,
+                 wait_seconds: float = SINGLEFLIGHT_WAIT_SECONDS):
+        self.lock_dir = Path(lock_dir)
+        self.cross_worker = cross_worker and fcntl is not None
+        self.wait_seconds = wait_seconds
+        self._lock = threading.Lock()
+        self._calls: dict[tuple, _Call] = {}
+        self._async_calls: dict[tuple, asyncio.Future] = {}
+
+    # --- in-worker coalescing ---
+
+    def do(self, key: tuple, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) once for all concurrent callers with the same key."""
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+            if leader:
+                break
+            inc("clauseclear_singleflight_total", op=key[1], result="shared")
+            call.done.wait()
+            if call.error is None:
+                return call.result
+            if isinstance(call.error, Exception):
+                raise call.error
+            # The leader was interrupted rather than failing: take over
+            inc("clauseclear_singleflight_total", op=key[1], result="leader_gone")
+        try:
+            call.result = self._run_locked(key, fn, args, kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def do_async(self, key: tuple, fn, *args, **kwargs):
+        """Async counterpart of do(); fn is a coroutine function."""
+        while (fut := self._async_calls.get(key)) is not None:
+            inc("clauseclear_singleflight_total", op=key[1], result="shared")
+            try:
+                # shield: a follower disconnecting must not cancel the leader's work
+                return await asyncio.shield(fut)
+            except _LeaderGone:
+                # The first follower to wake up becomes the new leader
+                inc("clauseclear_singleflight_total", op=key[1], result="leader_gone")
+        fut = self._async_calls[key] = asyncio.get_running_loop().create_future()
+        # Nobody may be waiting; don't log "exception never retrieved"
+        fut.add_done_callback(lambda f: f.cancelled() or f.exception())
+        try:
+            result = await self._run_locked_async(key, fn, args, kwargs)
+            fut.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            fut.set_exception(_LeaderGone())
+            raise
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            del self._async_calls[key]
+
+    # --- cross-worker coalescing ---
+
+    def _paths(self, key: tuple) -> tuple[Path, Path]:
+        job_id, op, *extra = key
+        name = op
+        if extra:
+            name += "-" + hashlib.sha1(json.dumps(extra, ensure_ascii=False).encode("utf-8")).hexdigest()[:12]
+        base = self.lock_dir / str(job_id)
+        return base / f"{name}.lock", base / f"{name}.result.json"
+
+    def _try_lock(self, fh) -> bool:
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def _run_locked(self, key: tuple, fn, args, kwargs):
+        if not self.cross_worker:
+            inc("clauseclear_singleflight_total", op=key[1], result="leader")
+            return fn(*args, **kwargs)
+        lock_path, result_path = self._paths(key)
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        started = time.time()
+        with open(lock_path, "a+") as fh:
+            waited = not self._try_lock(fh)
+            if waited:
+                deadline = time.monotonic() + self.wait_seconds
+                while not self._try_lock(fh):
+                    if time.monotonic() > deadline:
+                        return self._lock_timeout(key, fn, args, kwargs)
+                    time.sleep(_POLL_SECONDS)
+            try:
+                return self._lead(key, result_path, started, waited, lambda: fn(*args, **kwargs))
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    async def _run_locked_async(self, key: tuple, fn, args, kwargs):
+        if not self.cross_worker:
+            inc("clauseclear_singleflight_total", op=key[1], result="leader")
+            return await fn(*args, **kwargs)
+        lock_path, result_path = self._paths(key)
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        started = time.time()
+        with open(lock_path, "a+") as fh:
+            waited = not self._try_lock(fh)
+            if waited:
+                deadline = time.monotonic() + self.wait_seconds
+                while not self._try_lock(fh):
+                    if time.monotonic() > deadline:
+                        return await self._lock_timeout_async(key, fn, args, kwargs)
+                    await asyncio.sleep(_POLL_SECONDS)
+            try:
+                if waited:
+                    shared = self._read_result(result_path, started)
+                    if shared is not _MISSING:
+                        inc("clauseclear_singleflight_total", op=key[1], result="shared_worker")
+                        return shared
+                inc("clauseclear_singleflight_total", op=key[1], result="leader")
+                result = await fn(*args, **kwargs)
+                self._write_result(result_path, result)
+                return result
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def _lead(self, key: tuple, result_path: Path, started: float, waited: bool, work):
+        if waited:
+            shared = self._read_result(result_path, started)
+            if shared is not _MISSING:
+                inc("clauseclear_singleflight_total", op=key[1], result="shared_worker")
+                return shared
+        inc("clauseclear_singleflight_total", op=key[1], result="leader")
+        result = work()
+        self._write_result(result_path, result)
+        return result
+
+    def _lock_timeout(self, key: tuple, fn, args, kwargs):
+        logger.warning(f"singleflight_lock_timeout key={key!r} waited_s={self.wait_seconds}")
+        inc("clauseclear_singleflight_total", op=key[1], result="lock_timeout")
+        return fn(*args, **kwargs)
+
+    async def _lock_timeout_async(self, key: tuple, fn, args, kwargs):
+        logger.warning(f"singleflight_lock_timeout key={key!r} waited_s={self.wait_seconds}")
+        inc("clauseclear_singleflight_total", op=key[1], result="lock_timeout")
+        return await fn(*args, **kwargs)
+
+    @staticmethod
+    def _read_result(path: Path, since: float):
+        """The result another worker left while we waited, if it finished after we started waiting."""
+        try:
+            if path.stat().st_mtime < since:
+                return _MISSING
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return _MISSING
+
+    @staticmethod
+    def _write_result(path: Path, result) -> None:
+        try:
+            body = json.dumps(result, ensure_ascii=False)
+        except (TypeError, ValueError):
+            path.unlink(missing_ok=True)
+            return
+        atomic_write_text(path, body)
+
+
+flights = SingleFlight()
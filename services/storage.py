@@ -0,0 +1,140 @@
+"""
+Storage layer shared by all workers.
+
+Roots are absolute: STORAGE_ROOT (uploads, cache, spool, locks) and EMB_ROOT
+(TF-IDF artifacts) come from the environment; relative values are resolved
+against the project directory, not the process cwd.
+
+Artifacts are written with `atomic_write_*`: temp file in the same directory,
+fsync, os.replace, fsync of the directory. A reader therefore sees either the
+old file or the new one, never a partial write.
+
+`job_lock(job_id)` is a per-job advisory lock (flock) for multi-file updates:
+writers take it exclusive, readers that need several files to agree (the
+vectorizer and matrix of an index) take it shared. It is re-entrant within a
+thread, so a writer holding the lock can call readers.
+"""
+import os
+import json
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from dotenv import load_dotenv
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX
+    fcntl = None
+
+load_dotenv()
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
+def _root(env: str, default: str) -> Path:
+    path = Path(os.getenv(env, default)).expanduser()
+    return path if path.is_absolute() else (PROJECT_ROOT / path).resolve()
+
+
+STORAGE_ROOT = _root("STORAGE_ROOT", "storage")
+UPLOAD_ROOT = _root("UPLOAD_ROOT", str(STORAGE_ROOT / "uploads"))
+EMB_ROOT = _root("EMB_ROOT", "embeddings")
+LOCK_ROOT = STORAGE_ROOT / "locks"
+
+_held = threading.local()
+
+
+def storage_path(*parts: str) -> Path:
+    """Path under STORAGE_ROOT, e.g. storage_path("cache", "llm_cache.sqlite")."""
+    return STORAGE_ROOT.joinpath(*parts)
+
+
+def job_dir(job_id: str) -> Path:
+    return UPLOAD_ROOT / job_id
+
+
+def ensure_roots() -> None:
+    for root in (UPLOAD_ROOT, EMB_ROOT, LOCK_ROOT):
+        root.mkdir(parents=True, exist_ok=True)
+
+
+# --- atomic writes ---
+
+def _fsync_dir(path: Path) -> None:
+    # Makes the rename itself durable; not supported on every platform
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def atomic_open(path: Path, mode: str = "wb", encoding: str | None = None):
+    """Yield a file object; on clean exit it replaces `path` atomically, on error it is discarded."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, encoding=encoding) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+    _fsync_dir(path.parent)
+
+
+def atomic_write_bytes(path: Path, data: bytes) -> None:
+    with atomic_open(path, "wb") as f:
+        f.write(data)
+
+
+def atomic_write_text(path: Path, text: str, encoding: str = "utf-8") -> None:
+    with atomic_open(path, "w", encoding=encoding) as f:
+        f.write(text)
+
+
+def atomic_write_json(path: Path, obj, indent: int | None = 2) -> None:
+    atomic_write_text(path, json.dumps(obj, ensure_ascii=False, indent=indent))
+
+
+def atomic_joblib_dump(obj, path: Path) -> None:
+    import joblib
+    with atomic_open(path, "wb") as f:
+        joblib.dump(obj, f)
+
+
+# --- per-job advisory locks ---
+
+@contextmanager
+def job_lock(job_id: str, shared: bool = False):
+    """Hold the job's flock (exclusive unless shared=True). No-op without fcntl."""
+    held = getattr(_held, "jobs", None)
+    if held is None:
+        held = _held.jobs = {}
+    if job_id in held:
+        # Re-entrant: the thread already holds this job's lock
+        yield
+        return
+    if fcntl is None:
+        yield
+        return
+    lock_path = LOCK_ROOT / job_id / "job.lock"
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "a+") as fh:
+        fcntl.flock(fh, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        held[job_id] = True
+        try:
+            yield
+        finally:
+            del held[job_id]
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
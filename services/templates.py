@@ -0,0 +1,218 @@
+"""
+Template registry: known agreement templates (standard rental / loan forms)
+fingerprinted at the clause level.
+
+A template is registered once from a blank or reference copy. Its clauses,
+their analysis and a TF-IDF index are stored under <STORAGE_ROOT>/templates/<id>/
+(the index under EMB_ROOT as "template-<id>"). An inverted index from clause
+content hash to template ids is kept in memory.
+
+At parse time an upload is matched against the registry by counting how many
+of its clause hashes each template shares. For the best template above
+TEMPLATE_MIN_MATCH, the upload's clauses are aligned to the template's in one
+pass:
+- "unchanged": identical to a template clause; index rows and risk results
+  are reused.
+- "filled": sits where a template clause is, keeps most of its words and adds
+  only a few (the blanks were filled in). It is scored normally.
+- "deviation": changed wording or an extra clause. It is scored and reported.
+Template clauses with no counterpart are reported as "missing".
+"""
+import os
+import re
+import json
+import hashlib
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from loguru import logger
+from dotenv import load_dotenv
+
+from services.clauses import clauses_from_pages, clause_content_hash
+from services.severity import analyze_clauses, RULES_VERSION
+from services.storage import storage_path, atomic_write_json
+from services.tfidf_index import build_index
+
+load_dotenv()
+# Share of a template's clauses an upload must contain verbatim to be matched to it
+TEMPLATE_MIN_MATCH = float(os.getenv("TEMPLATE_MIN_MATCH", "0.5"))
+# A clause in a template clause's place counts as filled in when it keeps most of
+# the template's words and adds only a few (names, amounts); otherwise it deviates
+TEMPLATE_FILLED_SIMILARITY = float(os.getenv("TEMPLATE_FILLED_SIMILARITY", "0.6"))
+TEMPLATE_FILL_MAX_NEW_WORDS = int(os.getenv("TEMPLATE_FILL_MAX_NEW_WORDS", "8"))
+# How far ahead (in template clauses) a filled-in clause is looked for
+_LOOKAHEAD = 3
+
+TEMPLATES_ROOT = storage_path("templates")
+META_FILE = "template.json"
+
+
+def index_id(template_id: str) -> str:
+    return f"template-{template_id}"
+
+
+def template_dir(template_id: str) -> Path:
+    return TEMPLATES_ROOT / template_id
+
+
+def _slug(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")[:40] or "template"
+
+
+def _words(text: str) -> set[str]:
+    return set(re.findall(r"[a-z]+", text.lower()))
+
+
+def _is_filled(text: str, template_text: str) -> bool:
+    words, template_words = _words(text), _words(template_text)
+    if not (words or template_words):
+        return True
+    similarity = len(words & template_words) / len(words | template_words)
+    return similarity >= TEMPLATE_FILLED_SIMILARITY and len(words - template_words) <= TEMPLATE_FILL_MAX_NEW_WORDS
+
+
+class TemplateRegistry:
+    def __init__(self, root: Path = TEMPLATES_ROOT):
+        self.root = Path(root)
+        self._lock = threading.Lock()
+        self._loaded_mtime: int | None = None
+        self._templates: dict[str, dict] = {}
+        self._by_hash: dict[str, set[str]] = {}
+
+    def register(self, name: str, pages: list[str], source_filename: str | None = None) -> dict:
+        """Split, score and index a reference copy and add it to the registry."""
+        clauses = clauses_from_pages(pages)
+        if not clauses:
+            raise ValueError("no clauses found in template")
+        digest = hashlib.sha256("".join(c["hash"] for c in clauses).encode("utf-8")).hexdigest()[:8]
+        template_id = f"{_slug(name)}-{digest}"
+        tdir = template_dir(template_id)
+        tdir.mkdir(parents=True, exist_ok=True)
+        build_index(index_id(template_id), clauses)
+        atomic_write_json(tdir / "clauses.json", {"template_id": template_id, "clauses": clauses})
+        atomic_write_json(tdir / "analysis.json", {"template_id": template_id, "rules_version": RULES_VERSION,
+                                                   "clauses": analyze_clauses(clauses)})
+        meta = {"template_id": template_id, "name": name, "source_filename": source_filename,
+                "pages": len(pages), "clauses_count": len(clauses),
+                "created_at": datetime.now(timezone.utc).isoformat()}
+        # Written last: a template without template.json is ignored
+        atomic_write_json(tdir / META_FILE, meta)
+        os.utime(self.root)
+        logger.info(f"template_registered template_id={template_id} clauses={len(clauses)}")
+        self._refresh(force=True)
+        return meta
+
+    def list_templates(self) -> list[dict]:
+        self._refresh()
+        return [t["meta"] for t in self._templates.values()]
+
+    def _refresh(self, force: bool = False) -> None:
+        """(Re)load the registry when a template was added, possibly by another worker."""
+        try:
+            mtime = self.root.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if not force and mtime == self._loaded_mtime:
+            return
+        with self._lock:
+            templates, by_hash = {}, {}
+            for meta_path in self.root.glob(f"*/{META_FILE}"):
+                try:
+                    meta = json.loads(meta_path.read_text(encoding="utf-8"))
+                    clauses = json.loads((meta_path.parent / "clauses.json").read_text(encoding="utf-8"))["clauses"]
+                except (OSError, ValueError, KeyError) as e:
+                    logger.warning(f"template_unreadable path={meta_path.parent} err={e}")
+                    continue
+                tid = meta["template_id"]
+                templates[tid] = {"meta": meta, "clauses": clauses}
+                for c in clauses:
+                    by_hash.setdefault(clause_content_hash(c), set()).add(tid)
+            self._templates, self._by_hash, self._loaded_mtime = templates, by_hash, mtime
+
+    def match(self, clauses: list[dict]) -> dict | None:
+        """Best matching template for these clauses with the alignment, or None."""
+        self._refresh()
+        if not self._templates:
+            return None
+        votes: dict[str, int] = {}
+        for h in {clause_content_hash(c) for c in clauses}:
+            for tid in self._by_hash.get(h, ()):
+                votes[tid] = votes.get(tid, 0) + 1
+        best, share = None, 0.0
+        for tid, n in votes.items():
+            s = n / len(self._templates[tid]["clauses"])
+            if s > share:
+                best, share = tid, s
+        if best is None or share < TEMPLATE_MIN_MATCH:
+            return None
+        template = self._templates[best]
+        return {"template_id": best, "name": template["meta"]["name"], "match_share": round(share, 3),
+                **align(clauses, template["clauses"])}
+
+    def analysis(self, template_id: str) -> list[dict] | None:
+        """The template's analyzed clauses, rescored first if the severity rules changed."""
+        self._refresh()
+        path = template_dir(template_id) / "analysis.json"
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if data.get("rules_version") != RULES_VERSION:
+            clauses = self._templates.get(template_id, {}).get("clauses")
+            if clauses is None:
+                return None
+            data = {"template_id": template_id, "rules_version": RULES_VERSION, "clauses": analyze_clauses(clauses)}
+            atomic_write_json(path, data)
+        return data["clauses"]
+
+    def clauses(self, template_id: str) -> list[dict] | None:
+        self._refresh()
+        template = self._templates.get(template_id)
+        return template["clauses"] if template else None
+
+
+def align(clauses: list[dict], template_clauses: list[dict]) -> dict:
+    """
+    Align an upload's clauses to a template's in a single forward pass.
+    Identical clauses are anchors (looked up by hash, kept in template order);
+    between anchors, a clause is "filled" if it looks like one of the next few
+    unmatched template clauses with the blanks filled in, otherwise a "deviation".
+    """
+    positions: dict[str, list[int]] = {}
+    for j, t in enumerate(template_clauses):
+        positions.setdefault(clause_content_hash(t), []).append(j)
+
+    unchanged, filled, deviations = 0, [], []
+    used = [False] * len(template_clauses)
+    cursor = 0  # template position after the last aligned clause
+    for c in clauses:
+        candidates = [p for p in positions.get(clause_content_hash(c), ()) if not used[p]]
+        if candidates:
+            # Prefer the next occurrence in template order; an earlier one means the clause was moved
+            j = next((p for p in candidates if p >= cursor), candidates[0])
+            used[j] = True
+            cursor = max(cursor, j + 1)
+            unchanged += 1
+            continue
+        k, seen = cursor, 0
+        while k < len(template_clauses) and seen < _LOOKAHEAD:
+            if not used[k]:
+                if _is_filled(c["text"], template_clauses[k]["text"]):
+                    break
+                seen += 1
+            k += 1
+        else:
+            k = None
+        if k is not None:
+            used[k] = True
+            cursor = k + 1
+            filled.append({"id": c["id"], "template_clause_id": template_clauses[k]["id"]})
+        else:
+            deviations.append({"id": c["id"], "page": c["page"], "text": c["text"]})
+
+    missing = [{"template_clause_id": t["id"], "text": t["text"]}
+               for j, t in enumerate(template_clauses) if not used[j]]
+    return {"unchanged": unchanged, "filled": filled, "deviations": deviations, "missing": missing}
+
+
+registry = TemplateRegistry()
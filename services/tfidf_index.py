@@ -1,12 +1,24 @@
 from __future__ import annotations
-from pathlib import Path
-import json
-import joblib
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import importlib
+import threading
+from collections import OrderedDict
+
+from services.metrics import timed
+from services.clauses import clause_content_hash
+from services.storage import EMB_ROOT, atomic_joblib_dump, atomic_write_json, job_lock
 
-EMB_ROOT = Path("embeddings")
 EMB_ROOT.mkdir(parents=True, exist_ok=True)
+_VECTORIZER_CACHE_SIZE = 32
+_vectorizers: OrderedDict[str, tuple[int, object]] = OrderedDict()
+_vectorizers_lock = threading.Lock()
+
+# scikit-learn, scipy and joblib take most of the app's import time, so they are
+# imported on first use (or by the startup warm-up, see warm_up())
+
+def warm_up() -> None:
+    """Import the libraries behind indexing and search ahead of the first request."""
+    for name in ("joblib", "numpy", "scipy.sparse", "sklearn.feature_extraction.text", "sklearn.metrics.pairwise"):
+        importlib.import_module(name)
 
 def _paths(job_id: str):
     base = EMB_ROOT / f"{job_id}"
@@ -16,34 +28,85 @@ def _paths(job_id: str):
     return vec_path, mat_path, meta_path
 
 def build_index(job_id: str, clauses: list[dict]) -> dict:
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
     texts = [c["text"] for c in clauses]
     vectorizer = TfidfVectorizer(
         lowercase=True,
         ngram_range=(1,2),      # unigrams + bigrams for better recall
         max_features=20000,     # small, deploy-friendly
     )
-    X = vectorizer.fit_transform(texts)      # sparse (N x V)
+    with timed("index_build"):
+        X = vectorizer.fit_transform(texts)      # sparse (N x V)
 
-    vec_path, mat_path, meta_path = _paths(job_id)
-    joblib.dump(vectorizer, vec_path)
-    joblib.dump(X, mat_path)
-    meta = [{"id": c["id"], "page": c["page"]} for c in clauses]
-    meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2))
+        vec_path, mat_path, meta_path = _paths(job_id)
+        # Each file is replaced atomically; the job lock keeps the three in step for readers
+        with job_lock(job_id):
+            atomic_joblib_dump(vectorizer, vec_path)
+            atomic_joblib_dump(X, mat_path)
+            meta = [{"id": c["id"], "page": c["page"]} for c in clauses]
+            atomic_write_json(meta_path, meta)
 
     return {"rows": X.shape[0], "cols": X.shape[1]}
 
-def search(job_id: str, query: str, clauses: list[dict], top_k: int = 5) -> list[dict]:
+def update_index(job_id: str, clauses: list[dict], base_id: str, base_clauses: list[dict]) -> dict | None:
+    """
+    Build this job's index from an earlier one (a previous revision or a
+    template, indexed under `base_id`): rows of unchanged clauses are copied
+    from the base matrix and only new/edited clauses are transformed, with
+    the base vectorizer (so weights and vocabulary stay
+    those of the base). Returns None if the base index is missing or out of
+    step with its clauses; the caller then does a full build.
+    """
+    import numpy as np
+    import scipy.sparse as sp
+
+    try:
+        base_vectorizer, base_X = _load(base_id)
+    except FileNotFoundError:
+        return None
+    if base_X.shape[0] != len(base_clauses):
+        return None
+
+    base_rows = {clause_content_hash(c): i for i, c in enumerate(base_clauses)}
+    order, fresh = [], []
+    for c in clauses:
+        row = base_rows.get(clause_content_hash(c))
+        if row is None:
+            order.append(base_X.shape[0] + len(fresh))
+            fresh.append(c["text"])
+        else:
+            order.append(row)
+
+    with timed("index_build"):
+        parts = [base_X]
+        if fresh:
+            parts.append(base_vectorizer.transform(fresh))
+        X = sp.vstack(parts, format="csr")[np.asarray(order, dtype=np.int64)] if clauses else base_X[:0]
+
+        vec_path, mat_path, meta_path = _paths(job_id)
+        with job_lock(job_id):
+            atomic_joblib_dump(base_vectorizer, vec_path)
+            atomic_joblib_dump(X, mat_path)
+            meta = [{"id": c["id"], "page": c["page"]} for c in clauses]
+            atomic_write_json(meta_path, meta)
+
+    return {"rows": X.shape[0], "cols": X.shape[1], "reused_rows": len(clauses) - len(fresh),
+            "base": base_id}
+
+def _load(job_id: str):
+    import joblib
+
     vec_path, mat_path, meta_path = _paths(job_id)
     if not (vec_path.exists() and mat_path.exists() and meta_path.exists()):
         raise FileNotFoundError("index not built")
 
-    vectorizer = joblib.load(vec_path)
-    X = joblib.load(mat_path)  # sparse matrix
-    meta = json.loads(Path(meta_path).read_text())
-
-    qv = vectorizer.transform([query])  # (1 x V)
-    scores = cosine_similarity(qv, X).ravel()  # (N,)
+    with timed("index_load"), job_lock(job_id, shared=True):
+        vectorizer = joblib.load(vec_path)
+        X = joblib.load(mat_path)  # sparse matrix
+    return vectorizer, X
 
+def _top(scores, clauses: list[dict], top_k: int) -> list[dict]:
     top_k = max(1, int(top_k))
     idxs = scores.argsort()[::-1][:top_k]
 
@@ -56,4 +119,42 @@ def search(job_id: str, query: str, clauses: list[dict], top_k: int = 5) -> list
             "text": c["text"],
             "score": float(scores[i]),
         })
-    return out
\ No newline at end of file
+    return out
+
+def search(job_id: str, query: str, clauses: list[dict], top_k: int = 5) -> list[dict]:
+    return search_many(job_id, [query], clauses, top_k)[0]
+
+def search_many(job_id: str, queries: list[str], clauses: list[dict], top_k: int = 5) -> list[list[dict]]:
+    """Top-k matches for each query, loading the index once and scoring all queries in one pass."""
+    from sklearn.metrics.pairwise import cosine_similarity
+
+    vectorizer, X = _load(job_id)
+
+    with timed("search"):
+        qv = vectorizer.transform(queries)  # (Q x V)
+        scores = cosine_similarity(qv, X)  # (Q x N)
+
+    return [_top(row, clauses, top_k) for row in scores]
+
+def load_vectorizer(job_id: str):
+    """The job's fitted vectorizer (cached per file version), or None if it has no index."""
+    vec_path = _paths(job_id)[0]
+    try:
+        mtime = vec_path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    with _vectorizers_lock:
+        cached = _vectorizers.get(job_id)
+        if cached is not None and cached[0] == mtime:
+            _vectorizers.move_to_end(job_id)
+            return cached[1]
+    import joblib
+
+    with timed("index_load"), job_lock(job_id, shared=True):
+        vectorizer = joblib.load(vec_path)
+    with _vectorizers_lock:
+        _vectorizers[job_id] = (mtime, vectorizer)
+        _vectorizers.move_to_end(job_id)
+        while len(_vectorizers) > _VECTORIZER_CACHE_SIZE:
+            _vectorizers.popitem(last=False)
+    return vectorizer
@@ -0,0 +1,129 @@
+"""
+Deferred startup work and readiness.
+
+Importing the app no longer loads scikit-learn, the Mongo driver or the
+Gemini HTTP clients; each is created on first use. Startup only starts a
+background thread that warms them up (Mongo ping + ensure_indexes, the
+TF-IDF libraries), so the process accepts connections at once and the first
+requests usually find everything loaded.
+
+GET /ready reports the warm-up: 200 once every required step succeeded, 503
+with the per-step state before that. A failed step (Mongo unreachable) is
+retried every WARMUP_RETRY_SECONDS until it succeeds. MongoDB is optional
+(history and chat logs only), so it only gates readiness when MONGO_URI is
+configured; otherwise a failed Mongo step is listed under "degraded" and
+/ready still returns 200. GET /health stays a plain
+liveness check that never depends on the warm-up.
+"""
+import os
+import threading
+from datetime import datetime, timezone
+from time import perf_counter
+from loguru import logger
+from dotenv import load_dotenv
+
+from services import db as _db
+from services import tfidf_index
+from services.metrics import observe_stage, set_gauge
+
+load_dotenv()
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "10"))
+
+_PROCESS_START = perf_counter()
+
+
+def _mongo() -> bool:
+    return _db.init_db()
+
+
+def _tfidf() -> bool:
+    tfidf_index.warm_up()
+    return True
+
+
+# name -> step; a step returns True when done (False or an exception: retry later)
+STEPS = {
+    "mongo": _mongo,
+    "tfidf": _tfidf,
+}
+# Steps whose failure doesn't make the app unready
+OPTIONAL_STEPS = set() if os.getenv("MONGO_URI") else {"mongo"}
+
+
+class Warmup:
+    def __init__(self, steps: dict = STEPS, retry_seconds: float = WARMUP_RETRY_SECONDS,
+                 optional: set = OPTIONAL_STEPS):
+        self.steps = steps
+        self.optional = optional
+        self.retry_seconds = retry_seconds
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.state = {name: {"status": "pending"} for name in steps}
+        for name in steps:
+            set_gauge("clauseclear_ready", 0, component=name)
+        self.ready_after_seconds: float | None = None
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run_step(self, name: str) -> bool:
+        start = perf_counter()
+        try:
+            ok = bool(self.steps[name]())
+            error = None if ok else "did not complete (see app log)"
+        except Exception as e:
+            ok, error = False, str(e)
+        elapsed = perf_counter() - start
+        observe_stage(f"warmup_{name}", elapsed)
+        set_gauge("clauseclear_ready", 1 if ok else 0, component=name)
+        entry = {"status": "ok" if ok else "failed", "seconds": round(elapsed, 3),
+                 "at": datetime.now(timezone.utc).isoformat()}
+        if error:
+            entry["error"] = error
+            logger.warning(f"warmup_step_failed step={name} err={error}")
+        with self._lock:
+            self.state[name] = entry
+        return ok
+
+    def _run(self) -> None:
+        pending = list(self.steps)
+        while pending and not self._stop.is_set():
+            pending = [name for name in pending if not self._run_step(name)]
+            if self.ready_after_seconds is None and self.ready():
+                self.ready_after_seconds = round(perf_counter() - _PROCESS_START, 3)
+                logger.info(f"warmup_ready ready_after_seconds={self.ready_after_seconds} degraded={pending}")
+            if pending:
+                # Optional steps keep retrying, so the app picks MongoDB up when it appears
+                self._stop.wait(self.retry_seconds)
+        if not pending:
+            logger.info("warmup_done")
+
+    def _ready(self, steps: dict) -> bool:
+        return all(s["status"] == "ok" for name, s in steps.items() if name not in self.optional)
+
+    def ready(self) -> bool:
+        with self._lock:
+            return self._ready(self.state)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            steps = {name: dict(s) for name, s in self.state.items()}
+        for name in self.optional:
+            steps[name]["optional"] = True
+        return {"ready": self._ready(steps),
+                "degraded": sorted(name for name in self.optional if steps[name]["status"] != "ok"),
+                "ready_after_seconds": self.ready_after_seconds, "steps": steps}
+
+
+warmup = Warmup()
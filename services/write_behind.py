@@ -0,0 +1,209 @@
+"""
+Write-behind buffer for MongoDB inserts that don't need to block a response
+(qa_messages, analytics). Documents are queued in memory and flushed with
+insert_many by a background thread when a batch fills up or the flush interval
+passes. If MongoDB is unreachable, or the in-memory queue is full, documents are
+spilled to JSONL files on disk and replayed on the next successful flush.
+
+Spilled documents keep the `_id` insert_many gave them, so a batch that was
+partly written before the failure doesn't duplicate rows on replay: those
+come back as duplicate-key errors, which count as written. Only the documents
+MongoDB reports as failed are spilled.
+"""
+import os
+import threading
+from collections import deque
+from pathlib import Path
+from time import monotonic
+from loguru import logger
+from dotenv import load_dotenv
+
+from services.db import get_db
+from services.metrics import timed
+from services.storage import storage_path
+
+load_dotenv()
+MAX_BATCH = int(os.getenv("WRITE_BEHIND_MAX_BATCH", "50"))
+FLUSH_SECONDS = float(os.getenv("WRITE_BEHIND_FLUSH_SECONDS", "2.0"))
+MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "5000"))
+SPOOL_DIR = Path(os.getenv("WRITE_BEHIND_SPOOL_DIR", str(storage_path("spool"))))
+DUPLICATE_KEY = 11000
+
+
+class WriteBehindBuffer:
+    def __init__(self, max_batch: int = MAX_BATCH, flush_seconds: float = FLUSH_SECONDS,
+                 max_pending: int = MAX_PENDING, spool_dir: Path = SPOOL_DIR):
+        self.max_batch = max(1, max_batch)
+        self.flush_seconds = flush_seconds
+        self.max_pending = max(1, max_pending)
+        self.spool_dir = Path(spool_dir)
+        self._pending: deque[tuple[str, dict]] = deque()
+        self._lock = threading.Lock()
+        # Guards the spool files; never held together with _lock
+        self._spool_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.stats = {"enqueued": 0, "flushed": 0, "spilled": 0, "replayed": 0}
+
+    # --- public API ---
+
+    def enqueue(self, collection: str, doc: dict) -> None:
+        """Queue a document for insertion; never blocks on MongoDB."""
+        overflow = None
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                overflow = (collection, doc)
+            else:
+                self._pending.append((collection, doc))
+                self.stats["enqueued"] += 1
+                if len(self._pending) >= self.max_batch:
+                    self._wake.set()
+        if overflow is not None:
+            # Memory bound reached: go straight to disk instead of growing the queue
+            self._spill([overflow])
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        logger.info(f"write_behind_started max_batch={self.max_batch} flush_s={self.flush_seconds} max_pending={self.max_pending}")
+
+    def stop(self) -> None:
+        """Stop the background thread and flush everything that is still queued."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_seconds + 5)
+            self._thread = None
+        self.flush()
+        logger.info(f"write_behind_stopped stats={self.stats}")
+
+    def flush(self) -> int:
+        """Flush queued documents (and any spooled ones) to MongoDB. Returns docs written."""
+        with self._flush_lock:
+            batch = self._drain()
+            db = get_db()
+            if db is None:
+                if batch:
+                    self._spill(batch)
+                return 0
+            written = self._replay_spool(db)
+            if batch:
+                written += self._insert(db, batch)
+            return written
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    # --- internals ---
+
+    def _run(self) -> None:
+        last = monotonic()
+        while not self._stop.is_set():
+            self._wake.wait(timeout=self.flush_seconds)
+            self._wake.clear()
+            if self.pending() >= self.max_batch or monotonic() - last >= self.flush_seconds:
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.error(f"write_behind_flush_error {e}")
+                last = monotonic()
+
+    def _drain(self) -> list[tuple[str, dict]]:
+        with self._lock:
+            batch = list(self._pending)
+            self._pending.clear()
+        return batch
+
+    def _insert_chunk(self, db, collection: str, chunk: list[dict]) -> list[dict]:
+        """insert_many one chunk. Returns the documents that were not written."""
+        from pymongo.errors import BulkWriteError
+
+        try:
+            with timed("mongo_write"):
+                db[collection].insert_many(chunk, ordered=False)
+            return []
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            # Already there from an earlier, partly failed attempt
+            failed = sorted({err["index"] for err in errors if err.get("code") != DUPLICATE_KEY})
+            if failed:
+                logger.error(f"write_behind_insert_failed collection={collection} docs={len(failed)}/{len(chunk)} "
+                             f"err={errors[0].get('errmsg')}")
+            return [chunk[i] for i in failed]
+        except Exception as e:
+            logger.error(f"write_behind_insert_failed collection={collection} docs={len(chunk)} err={e}")
+            return chunk
+
+    def _insert(self, db, batch: list[tuple[str, dict]]) -> int:
+        by_collection: dict[str, list[dict]] = {}
+        for collection, doc in batch:
+            by_collection.setdefault(collection, []).append(doc)
+        written = 0
+        for collection, docs in by_collection.items():
+            for i in range(0, len(docs), self.max_batch):
+                chunk = docs[i:i + self.max_batch]
+                failed = self._insert_chunk(db, collection, chunk)
+                written += len(chunk) - len(failed)
+                if failed:
+                    self._spill([(collection, d) for d in failed])
+        self.stats["flushed"] += written
+        return written
+
+    def _spill(self, batch: list[tuple[str, dict]]) -> None:
+        from bson import json_util
+
+        # Extended JSON keeps ObjectId _ids and datetimes intact for the replay
+        lines: dict[str, list[str]] = {}
+        for collection, doc in batch:
+            lines.setdefault(collection, []).append(json_util.dumps(doc, ensure_ascii=False) + "\n")
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        with self._spool_lock:
+            for collection, rows in lines.items():
+                with (self.spool_dir / f"{collection}.jsonl").open("a", encoding="utf-8") as f:
+                    f.writelines(rows)
+            self.stats["spilled"] += len(batch)
+        logger.warning(f"write_behind_spilled docs={len(batch)} dir={self.spool_dir}")
+
+    def _replay_spool(self, db) -> int:
+        from bson import json_util
+
+        if not self.spool_dir.exists():
+            return 0
+        written = 0
+        for spool in sorted(self.spool_dir.glob("*.jsonl")):
+            collection = spool.stem
+            # Claim the file first so concurrent spills start a fresh one
+            claimed = spool.with_suffix(".replaying")
+            with self._spool_lock:
+                if claimed.exists():
+                    # Left over from a crash mid-replay; fold it back in
+                    with spool.open("a", encoding="utf-8") as f:
+                        f.write(claimed.read_text(encoding="utf-8"))
+                spool.replace(claimed)
+            docs = [json_util.loads(line) for line in claimed.read_text(encoding="utf-8").splitlines() if line.strip()]
+            failed: list[dict] = []
+            for i in range(0, len(docs), self.max_batch):
+                chunk = docs[i:i + self.max_batch]
+                left = self._insert_chunk(db, collection, chunk)
+                written += len(chunk) - len(left)
+                failed += left
+                if left and len(left) == len(chunk):
+                    # Nothing went in (MongoDB gone again): keep the rest for next time
+                    failed += docs[i + self.max_batch:]
+                    break
+            if failed:
+                self._spill([(collection, d) for d in failed])
+            claimed.unlink()
+        if written:
+            self.stats["replayed"] += written
+            logger.info(f"write_behind_replayed docs={written}")
+        return written
+
+
+write_buffer = WriteBehindBuffer()
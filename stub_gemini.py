@@ -0,0 +1,110 @@
+"""
+Local stand-in for the Gemini API, for exercising the LLM endpoints without a key.
+
+Serves generateContent and streamGenerateContent (?alt=sse) with a canned answer,
+and GET models/{model} for the circuit-breaker probe. JSON-mode requests (the
+analyze-time batch explanations) get a {clause id: answer} object back.
+Run it, then point the app at it:
+
+    python stub_gemini.py --port 5099 --delay 0.1
+    GEMINI_BASE_URL=http://127.0.0.1:5099/v1beta GEMINI_API_KEY=stub uvicorn app:app --port 5055
+"""
+import argparse
+import re
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = ("Your agreement asks for a security deposit of two months' rent. "
+          "You get it back when you move out, minus any damages. This is normal, so it is mostly safe.")
+
+
+def make_handler(answer: str, delay: float, token_delay: float, fail_status: int):
+    class StubGeminiHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            print(f"stub_gemini {self.command} {self.path} {fmt % args}")
+
+        def _usage(self, completion_tokens: int) -> dict:
+            return {"promptTokenCount": 200, "candidatesTokenCount": completion_tokens,
+                    "totalTokenCount": 200 + completion_tokens}
+
+        def do_GET(self):
+            # models/{model} metadata; used by the app's circuit-breaker probe
+            status = fail_status or 200
+            body = json.dumps({"name": self.path.rsplit("/", 1)[-1]} if status == 200
+                              else {"error": {"message": "stub failure"}}).encode()
+            self.send_response(status)
+            self.send_header("content-type", "application/json")
+            self.send_header("content-length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            length = int(self.headers.get("content-length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            time.sleep(delay)
+            if fail_status:
+                body = json.dumps({"error": {"message": "stub failure"}}).encode()
+                self.send_response(fail_status)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            if ":streamGenerateContent" in self.path:
+                self._stream()
+                return
+            text = answer
+            if (request.get("generationConfig") or {}).get("responseMimeType") == "application/json":
+                prompt = request["contents"][0]["parts"][0]["text"]
+                text = json.dumps({cid: answer for cid in re.findall(r"^ID: (\S+)$", prompt, flags=re.M)})
+            body = json.dumps({
+                "candidates": [{"content": {"parts": [{"text": text}]}}],
+                "usageMetadata": self._usage(len(text.split())),
+            }).encode()
+            self.send_response(200)
+            self.send_header("content-type", "application/json")
+            self.send_header("content-length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _stream(self):
+            self.send_response(200)
+            self.send_header("content-type", "text/event-stream")
+            self.send_header("transfer-encoding", "chunked")
+            self.end_headers()
+            words = answer.split(" ")
+            for i, word in enumerate(words, start=1):
+                event = {"candidates": [{"content": {"parts": [{"text": word + " "}]}}],
+                         "usageMetadata": self._usage(i)}
+                chunk = f"data: {json.dumps(event)}\r\n\r\n".encode()
+                try:
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    return  # client stopped reading (e.g. length cap reached)
+                time.sleep(token_delay)
+            self.wfile.write(b"0\r\n\r\n")
+
+    return StubGeminiHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Gemini API stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--answer", default=ANSWER)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds before responding")
+    parser.add_argument("--token-delay", type=float, default=0.05, help="seconds between streamed chunks")
+    parser.add_argument("--fail-status", type=int, default=0, help="respond with this HTTP error instead")
+    args = parser.parse_args()
+    handler = make_handler(args.answer, args.delay, args.token_delay, args.fail_status)
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    print(f"stub_gemini listening on http://{args.host}:{args.port}/v1beta")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
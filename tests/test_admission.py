@@ -0,0 +1,35 @@
+"""
+services/admission.py: the per-user limit follows the client address, so a
+client can't get around it by changing the uid it sends.
+
+    python -m pytest -q tests
+"""
+import asyncio
+
+import pytest
+from starlette.requests import Request
+
+from services.admission import Gate, Rejected, request_user
+
+
+def _request(host: str, query: bytes = b"", headers: list | None = None) -> Request:
+    return Request({"type": "http", "method": "POST", "path": "/parse", "query_string": query,
+                    "headers": headers or [], "client": (host, 50000)})
+
+
+def test_user_is_the_client_address_not_the_uid():
+    first = _request("10.0.0.7", b"uid=alice")
+    second = _request("10.0.0.7", b"uid=mallory", [(b"x-user-id", b"bob")])
+    assert request_user(first) == request_user(second) == "ip:10.0.0.7"
+    assert request_user(_request("10.0.0.8", b"uid=alice")) != request_user(first)
+
+
+def test_changing_uid_does_not_dodge_the_per_user_limit():
+    async def main():
+        gate = Gate("parse", limit=4, per_user=1, queue_size=0, max_wait=0.1)
+        await gate.acquire(request_user(_request("10.0.0.7", b"uid=a")))
+        with pytest.raises(Rejected):
+            await gate.acquire(request_user(_request("10.0.0.7", b"uid=b")))
+        await gate.acquire(request_user(_request("10.0.0.8", b"uid=a")))
+        return gate.active
+    assert asyncio.run(main()) == 2
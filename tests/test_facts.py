@@ -0,0 +1,55 @@
+"""
+services/facts.py: fact extraction from clause text and the facts filter
+parser.
+
+    python -m pytest -q tests
+"""
+import pytest
+
+from services.facts import extract_facts, parse_filters
+
+
+def _facts(*texts: str) -> dict:
+    return extract_facts([{"id": f"c{i}", "text": t} for i, t in enumerate(texts)])["facts"]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Late payment of rent attracts a penalty of 5% per month on the amount due.", 5.0),
+    ("Interest at 18 per cent per annum shall be charged on delayed payments.", 18.0),
+    ("Any amount overdue for more than 15 days will carry interest of 2.5% per month.", 2.5),
+    # The percentage is about something else
+    ("The rent increases 5% yearly. No interest is payable on the deposit.", None),
+    ("The rent increases by 5% every year and no interest is payable on the security deposit.", None),
+    ("Rent shall be revised by 10% after 11 months; late payment will be dealt with as per law.", None),
+    ("In case of delay in handing over possession the landlord shall refund the deposit. "
+     "The rent shall escalate 5% every year.", None),
+])
+def test_late_fee_needs_the_percentage_near_late_wording(text, expected):
+    assert _facts(text)["late_fee_percent"] == expected
+
+
+def test_late_fee_from_its_own_sentence():
+    text = "The rent shall increase by 5% every year. A late fee of 2% applies after the 5th of the month."
+    assert _facts(text)["late_fee_percent"] == 2.0
+
+
+def test_facts_and_sources():
+    result = extract_facts([
+        {"id": "a", "text": "The monthly rent is Rs. 15,000 payable before the 5th."},
+        {"id": "b", "text": "The tenant shall pay a security deposit of Rs. 45,000."},
+        {"id": "c", "text": "There is a lock-in period of one year and either party may terminate "
+                            "with 2 months' notice."},
+    ])
+    assert result["facts"] == {"rent_amount": 15000.0, "deposit_months": 3.0, "lock_in_months": 12,
+                               "notice_days": 60, "late_fee_percent": None}
+    assert result["sources"] == {"rent_amount": "a", "deposit_months": "b", "lock_in_months": "c",
+                                 "notice_days": "c"}
+
+
+def test_parse_filters():
+    assert parse_filters([("rent_amount", "gte:10000"), ("rent_amount", "lte:20000"), ("uid", "x")]) == {
+        "facts.rent_amount": {"$gte": 10000.0, "$lte": 20000.0}}
+    with pytest.raises(ValueError):
+        parse_filters([("deposit_months", "more:3")])
+    with pytest.raises(ValueError):
+        parse_filters([("deposit_months", "gt:three")])
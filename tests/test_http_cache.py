@@ -0,0 +1,49 @@
+"""
+services/http_cache.py: a 304 carries the same (content-coding specific) ETag
+as the 200 the client is revalidating.
+
+    python -m pytest -q tests
+"""
+import pytest
+from starlette.requests import Request
+
+from services import http_cache
+from services.http_cache import cached_json_response, make_etag
+
+BIG = b'{"clauses": "' + b"x" * 4096 + b'"}'
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(http_cache, "_bodies", type(http_cache._bodies)())
+    monkeypatch.setattr(http_cache, "_body_bytes", 0)
+
+
+def _get(etag: str, body: bytes, headers: dict):
+    request = Request({"type": "http", "method": "GET", "path": "/analysis", "query_string": b"",
+                       "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()]})
+    return cached_json_response(request, etag, lambda: body, "test")
+
+
+@pytest.mark.parametrize("body, coding", [(BIG, "gzip"), (b"{}", None)])
+def test_304_repeats_the_etag_of_the_200(body, coding):
+    etag = make_etag("v1")
+    first = _get(etag, body, {"Accept-Encoding": "gzip"})
+    assert first.status_code == 200
+    assert first.headers.get("content-encoding") == coding
+    tag = first.headers["etag"]
+    again = _get(etag, body, {"Accept-Encoding": "gzip", "If-None-Match": tag})
+    assert again.status_code == 304
+    assert again.headers["etag"] == tag
+
+
+def test_304_etag_when_body_was_evicted():
+    etag = make_etag("v2")
+    tag = _get(etag, BIG, {"Accept-Encoding": "gzip"}).headers["etag"]
+    http_cache._bodies.clear()
+    assert _get(etag, BIG, {"Accept-Encoding": "gzip", "If-None-Match": tag}).headers["etag"] == tag
+
+
+def test_changed_version_is_a_200():
+    tag = _get(make_etag("v1"), BIG, {}).headers["etag"]
+    assert _get(make_etag("v2"), BIG, {"If-None-Match": tag}).status_code == 200
@@ -0,0 +1,173 @@
+"""
+The Gemini client in services/llm_explainer.py against stub_gemini.py:
+streamed token/done events, the answer length cap, and the fallback to the
+rule-based answer when Gemini errors, times out or misbehaves.
+
+    python -m pytest -q tests
+"""
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import stub_gemini
+from services import llm_explainer as llm
+from services.circuit_breaker import CircuitBreaker
+
+BASE = "Rule-based answer."
+MATCHES = [{"text": "The tenant shall pay a security deposit of two months' rent.", "risk_level": "YELLOW",
+            "risk_score": 0.5, "reasons": ["deposit"]}]
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    """Start stub_gemini on a free port; call with handler options, get the base URL back."""
+    servers = []
+
+    def start(answer: str = stub_gemini.ANSWER, delay: float = 0.0, fail_status: int = 0) -> str:
+        handler = stub_gemini.make_handler(answer, delay, 0.0, fail_status)
+        handler.log_message = lambda *args: None
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        # The client hangs up on purpose in the timeout tests
+        server.handle_error = lambda request, client_address: None
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        url = f"http://127.0.0.1:{server.server_port}/v1beta"
+        monkeypatch.setattr(llm, "GEMINI_BASE_URL", url)
+        return url
+
+    monkeypatch.setenv("GEMINI_API_KEY", "stub")
+    monkeypatch.setattr(llm, "get_cache", lambda: None)
+    monkeypatch.setattr(llm, "breaker", CircuitBreaker("gemini-test", min_calls=100))
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _run(coro):
+    async def main():
+        try:
+            return await coro
+        finally:
+            # The pooled client belongs to this test's event loop
+            await llm.close_llm_client()
+    return asyncio.run(main())
+
+
+def _stream(job_id: str | None = None) -> list[tuple]:
+    async def collect():
+        return [event async for event in llm.stream_with_llm_async("deposit?", MATCHES, BASE, job_id)]
+    return _run(collect())
+
+
+def test_stream_yields_tokens_then_one_done(stub):
+    stub()
+    events = _stream()
+    kinds = [e[0] for e in events]
+    assert kinds[-1] == "done" and kinds.count("done") == 1
+    assert set(kinds[:-1]) == {"token"} and len(kinds) > 2
+    tokens = "".join(e[1] for e in events[:-1])
+    _, answer, usage = events[-1]
+    assert answer == tokens.strip() == stub_gemini.ANSWER
+    assert usage["completion_tokens"] == len(stub_gemini.ANSWER.split())
+
+
+def test_stream_is_capped(stub, monkeypatch):
+    monkeypatch.setattr(llm, "MAX_ANSWER_CHARS", 80)
+    stub()
+    events = _stream()
+    tokens = "".join(e[1] for e in events if e[0] == "token")
+    answer = events[-1][1]
+    assert len(tokens) == 80
+    assert answer == stub_gemini.ANSWER[:80].rsplit(".", 1)[0] + "."
+
+
+@pytest.mark.parametrize("status", [500, 503, 429])
+def test_stream_falls_back_on_http_error(stub, status):
+    stub(fail_status=status)
+    assert [event[:2] for event in _stream()] == [("done", BASE)]
+
+
+def test_stream_falls_back_on_timeout(stub, monkeypatch):
+    monkeypatch.setattr(llm, "GEMINI_READ_TIMEOUT", 0.2)
+    stub(delay=1.0)
+    assert [event[:2] for event in _stream()] == [("done", BASE)]
+    assert llm.breaker.counts["timeout"] == 1
+
+
+def test_stream_ends_with_done_on_unexpected_error(stub, monkeypatch):
+    def broken(chunk):
+        raise RuntimeError("boom")
+    monkeypatch.setattr(llm, "_extract_text_raw", broken)
+    stub()
+    assert [event[:2] for event in _stream()] == [("done", BASE)]
+
+
+def test_explain_returns_capped_answer(stub, monkeypatch):
+    monkeypatch.setattr(llm, "MAX_ANSWER_CHARS", 80)
+    stub()
+    answer, usage = _run(llm.explain_with_llm_usage_async("deposit?", MATCHES, BASE))
+    assert answer == stub_gemini.ANSWER[:80].rsplit(".", 1)[0] + "."
+    assert usage["total_tokens"] > 0
+
+
+def test_explain_falls_back_on_server_error(stub):
+    stub(fail_status=500)
+    assert _run(llm.explain_with_llm_usage_async("deposit?", MATCHES, BASE)) == (BASE, llm._empty_usage())
+
+
+def test_explain_falls_back_on_timeout(stub, monkeypatch):
+    monkeypatch.setattr(llm, "GEMINI_READ_TIMEOUT", 0.2)
+    stub(delay=1.0)
+    assert _run(llm.explain_with_llm_usage_async("deposit?", MATCHES, BASE)) == (BASE, llm._empty_usage())
+
+
+def test_explain_falls_back_when_over_budget(stub):
+    stub(delay=0.5)
+    answer, _ = _run(llm.explain_with_llm_usage_async("deposit?", MATCHES, BASE, budget_ms=50))
+    assert answer == BASE
+
+
+@pytest.mark.parametrize("call", ["stream", "explain"])
+def test_broken_vectorizer_does_not_strand_half_open_trial(stub, monkeypatch, call):
+    def corrupt(job_id):
+        raise EOFError("truncated joblib file")
+    monkeypatch.setattr(llm, "load_vectorizer", corrupt)
+    llm.breaker._set_state("half_open")
+    stub()
+    if call == "stream":
+        answer = _stream(job_id="job-1")[-1][1]
+    else:
+        answer, _ = _run(llm.explain_with_llm_usage_async("deposit?", MATCHES, BASE, job_id="job-1"))
+    assert answer == stub_gemini.ANSWER
+    # The trial was recorded, so the breaker closed again
+    assert llm.breaker.state == "closed" and not llm.breaker._trial_in_flight
+
+
+def test_call_cut_off_by_budget_is_kept_and_finishes(stub):
+    stub(delay=0.3)
+
+    async def main():
+        try:
+            answer, _ = await llm.explain_with_llm_usage_async("deposit?", MATCHES, BASE, budget_ms=50)
+            assert answer == BASE
+            (task,) = llm._background
+            assert (await task)[0] == stub_gemini.ANSWER
+            return len(llm._background)
+        finally:
+            await llm.close_llm_client()
+    assert asyncio.run(main()) == 0
+
+
+def test_close_cancels_calls_still_running(stub):
+    stub(delay=5.0)
+
+    async def main():
+        await llm.explain_with_llm_usage_async("deposit?", MATCHES, BASE, budget_ms=50)
+        (task,) = llm._background
+        await llm.close_llm_client()
+        return task
+    task = asyncio.run(main())
+    assert task.cancelled() and not llm._background
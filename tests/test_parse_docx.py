@@ -0,0 +1,129 @@
+"""
+services/parse_docx.py: streaming extraction from generated .docx files,
+and damaged or oversized files turning into ValueError (a 400 from parse)
+instead of escaping as zlib/zipfile errors.
+
+    python -m pytest -q tests
+"""
+import io
+import struct
+import zipfile
+
+import pytest
+
+from services import parse_docx
+from services.parse_docx import extract_text_from_docx, iter_pages, DOCUMENT_XML
+
+W = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+PAGE_BREAK = '<w:p><w:r><w:br w:type="page"/></w:r></w:p>'
+
+
+def p(text: str) -> str:
+    return f'<w:p><w:r><w:t xml:space="preserve">{text}</w:t></w:r></w:p>'
+
+
+def table(*rows: tuple[str, ...]) -> str:
+    cells = "".join("<w:tr>" + "".join(f"<w:tc>{p(c)}</w:tc>" for c in row) + "</w:tr>" for row in rows)
+    return f"<w:tbl><w:tblPr/>{cells}</w:tbl>"
+
+
+def write_docx(path, body: str, compression: int = zipfile.ZIP_DEFLATED):
+    xml = (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:document {W}><w:body>{body}'
+           f'<w:sectPr/></w:body></w:document>')
+    with zipfile.ZipFile(path, "w", compression) as z:
+        z.writestr("[Content_Types].xml", "<Types/>")
+        z.writestr(DOCUMENT_XML, xml)
+    return path
+
+
+def _member_data_offset(raw: bytes, name: str) -> int:
+    info = zipfile.ZipFile(io.BytesIO(raw)).getinfo(name)
+    name_len, extra_len = struct.unpack("<HH", raw[info.header_offset + 26:info.header_offset + 30])
+    return info.header_offset + 30 + name_len + extra_len
+
+
+@pytest.fixture
+def agreement(tmp_path):
+    body = "".join(p(f"{i}. The Tenant shall pay the monthly rent of Rs. 15,000 before the fifth day.")
+                   for i in range(1, 4))
+    body += table(("Item", "Amount"), ("Security deposit", "Rs. 45,000"))
+    body += PAGE_BREAK + p("4. Either party may terminate with one month's notice.")
+    return write_docx(tmp_path / "agreement.docx", body)
+
+
+def test_extracts_pages_paragraphs_and_table_rows(agreement):
+    pages = extract_text_from_docx(agreement)
+    assert len(pages) == 2
+    first = pages[0].splitlines()
+    assert first[0].startswith("1. The Tenant shall pay")
+    assert first[-2:] == ["Item | Amount", "Security deposit | Rs. 45,000"]
+    assert pages[1] == "4. Either party may terminate with one month's notice."
+
+
+def test_long_document_without_breaks_is_chunked(tmp_path):
+    path = write_docx(tmp_path / "long.docx", p("x" * 100) * 100)
+    pages = list(iter_pages(path, page_chars=1000))
+    assert len(pages) == 10
+    assert all(len(page) <= 1100 for page in pages)
+
+
+def test_not_a_zip(tmp_path):
+    path = tmp_path / "fake.docx"
+    path.write_bytes(b"%PDF-1.4 definitely not a zip")
+    with pytest.raises(ValueError, match="not a valid .docx"):
+        extract_text_from_docx(path)
+
+
+def test_corrupted_deflate_stream(agreement):
+    raw = bytearray(agreement.read_bytes())
+    start = _member_data_offset(bytes(raw), DOCUMENT_XML)
+    for i in range(start + 20, start + 60):
+        raw[i] ^= 0xFF
+    agreement.write_bytes(bytes(raw))
+    with pytest.raises(ValueError, match="agreement.docx"):
+        extract_text_from_docx(agreement)
+
+
+def test_crc_mismatch(tmp_path):
+    path = write_docx(tmp_path / "stored.docx", p("The rent is Rs. 10,000 per month."), zipfile.ZIP_STORED)
+    raw = bytearray(path.read_bytes())
+    start = _member_data_offset(bytes(raw), DOCUMENT_XML)
+    i = raw.index(b"10,000", start)
+    raw[i] = ord("9")  # still well-formed XML, only the checksum is off
+    path.write_bytes(bytes(raw))
+    with pytest.raises(ValueError, match="damaged"):
+        extract_text_from_docx(path)
+
+
+def test_truncated_file(agreement):
+    raw = agreement.read_bytes()
+    agreement.write_bytes(raw[:len(raw) // 2])
+    with pytest.raises(ValueError):
+        extract_text_from_docx(agreement)
+
+
+def test_declared_size_over_limit(agreement, monkeypatch):
+    monkeypatch.setattr(parse_docx, "DOCX_MAX_XML_MB", 0)
+    with pytest.raises(ValueError, match="exceeds 0 MB"):
+        extract_text_from_docx(agreement)
+
+
+def test_understated_size_is_not_trusted(tmp_path):
+    # A member that inflates far past the size its headers declare
+    path = write_docx(tmp_path / "bomb.docx", p("a" * 400_000))
+    raw = bytearray(path.read_bytes())
+    info = zipfile.ZipFile(io.BytesIO(bytes(raw))).getinfo(DOCUMENT_XML)
+    # Uncompressed size in the local header and in the (last) central directory entry
+    struct.pack_into("<I", raw, info.header_offset + 22, 1000)
+    struct.pack_into("<I", raw, raw.rindex(b"PK\x01\x02") + 24, 1000)
+    path.write_bytes(bytes(raw))
+    assert zipfile.ZipFile(path).getinfo(DOCUMENT_XML).file_size == 1000
+    with pytest.raises(ValueError):
+        extract_text_from_docx(path)
+
+
+def test_reader_counts_decompressed_bytes():
+    reader = parse_docx._LimitedReader(io.BytesIO(b"x" * 10_000), 4096, "big.docx")
+    assert len(reader.read(4096)) == 4096
+    with pytest.raises(ValueError, match="big.docx"):
+        reader.read(4096)
@@ -0,0 +1,51 @@
+"""
+services/profiling.py: the client-supplied request id can't break the saved
+file name, and a failed profile write never fails the request.
+
+    python -m pytest -q tests
+"""
+import pytest
+
+from services import profiling
+
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", tmp_path)
+    yield tmp_path
+    profiling._active.set(None)
+
+
+@profiling.profiled
+def handler(job_id: str):
+    return {"job_id": job_id}
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("a/b", "ab"),
+    ("../../etc/passwd", "etcpasswd"),
+    ("req_1-ok", "req1-ok"),
+])
+def test_request_id_is_sanitized(header, expected):
+    assert profiling._request_id(header) == expected
+
+
+def test_empty_request_id_gets_a_fresh_one():
+    assert len(profiling._request_id("///")) == 12
+
+
+def test_profile_is_saved_and_listed(profile_dir, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_ADMIN_TOKEN", "admin")
+    state = profiling.begin_request({profiling.PROFILE_HEADER: "admin", "x-request-id": "a/b_c"})
+    assert handler(job_id="job_1") == {"job_id": "job_1"}
+    assert state["saved"] == "job_1_abc"
+    listed = profiling.list_profiles()[0]
+    assert (listed["name"], listed["job_id"], listed["request_id"]) == ("job_1_abc", "job_1", "abc")
+
+
+def test_failed_save_does_not_fail_the_request(profile_dir, monkeypatch):
+    def broken(*args):
+        raise OSError("disk full")
+    monkeypatch.setattr(profiling, "_save", broken)
+    profiling._active.set({"request_id": "r1", "saved": None})
+    assert handler(job_id="j1") == {"job_id": "j1"}
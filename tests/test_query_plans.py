@@ -0,0 +1,114 @@
+"""
+Query plan checks in services/db.py: explain output from classic and SBE
+(MongoDB 7+) planners, and the index-prefix fallback used with mongomock.
+
+    python -m pytest -q tests
+"""
+import pytest
+
+from services import db as dbmod
+
+mongomock = pytest.importorskip("mongomock")
+
+IXSCAN = {"stage": "IXSCAN", "indexName": "user_id_created_at_id", "keyPattern": {"user_id": 1}}
+
+
+class _Cursor:
+    def __init__(self, winning_plan: dict):
+        self.winning_plan = winning_plan
+
+    def sort(self, sort):
+        return self
+
+    def explain(self):
+        return {"queryPlanner": {"winningPlan": self.winning_plan}}
+
+
+class _Collection:
+    def __init__(self, winning_plan: dict):
+        self.winning_plan = winning_plan
+
+    def find(self, filt):
+        return _Cursor(self.winning_plan)
+
+
+def _explain(winning_plan: dict) -> dict:
+    database = {"uploads": _Collection(winning_plan)}
+    return dbmod.explain_query(database, "uploads", {"user_id": "u"}, [("created_at", -1)])
+
+
+def test_classic_plan_with_index():
+    report = _explain({"stage": "FETCH", "inputStage": IXSCAN})
+    assert report["method"] == "explain"
+    assert report["stages"] == ["FETCH", "IXSCAN"]
+    assert report["index"] == "user_id_created_at_id"
+    assert report["uses_index"] and not report["in_memory_sort"]
+
+
+def test_sbe_plan_is_unwrapped():
+    report = _explain({"queryPlan": {"stage": "FETCH", "inputStage": IXSCAN}, "slotBasedPlan": {"stages": "..."}})
+    assert report["stages"] == ["FETCH", "IXSCAN"]
+    assert report["uses_index"]
+
+
+def test_collection_scan_and_sort():
+    report = _explain({"queryPlan": {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}})
+    assert not report["uses_index"]
+    assert report["in_memory_sort"]
+
+
+def test_index_in_second_branch_is_found():
+    report = _explain({"stage": "FETCH", "inputStage": {"stage": "OR", "inputStages": [
+        {"stage": "IXSCAN", "indexName": "a"}, {"stage": "IXSCAN", "indexName": "b"}]}})
+    assert report["stages"] == ["FETCH", "OR", "IXSCAN", "IXSCAN"]
+    assert report["uses_index"]
+
+
+@pytest.mark.parametrize("winning_plan", [
+    {},
+    {"slotBasedPlan": {"stages": "..."}},
+    {"stage": "FETCH", "inputStage": {"indexName": "x"}},
+    {"stage": "SOMETHING_NEW"},
+])
+def test_unreadable_plan_is_not_a_pass(winning_plan):
+    assert not _explain(winning_plan)["uses_index"]
+
+
+@pytest.fixture
+def database():
+    return mongomock.MongoClient().clauseclear_test
+
+
+def test_hot_queries_are_indexed(database):
+    dbmod.ensure_indexes(database)
+    reports = dbmod.check_query_plans(database)
+    assert len(reports) == len(dbmod.HOT_QUERIES)
+    for report in reports:
+        assert report["method"] == "index_prefix"
+        assert report["uses_index"], report
+        assert not report["in_memory_sort"], report
+
+
+def test_fallback_flags_unindexed_query(database):
+    report = dbmod.explain_query(database, "uploads", {"filename": "x"}, [("created_at", -1)])
+    assert report == {"collection": "uploads", "method": "index_prefix", "stages": [], "index": None,
+                      "uses_index": False, "in_memory_sort": True}
+
+
+def test_legacy_index_is_dropped(database):
+    database.uploads.create_index([("user_id", 1), ("created_at", -1)], name="user_id_created_at")
+    database.uploads.create_index([("user_id", 1), ("facts.rent_amount", 1)], name="user_id_facts_rent_amount")
+    dbmod.ensure_indexes(database)
+    indexes = database.uploads.index_information()
+    assert "user_id_created_at" not in indexes and "user_id_facts_rent_amount" not in indexes
+    assert "user_id_created_at_id" in indexes and "user_id_created_at_id_facts_rent_amount" in indexes
+
+
+def test_fallback_wants_equality_sort_range_order(database):
+    dbmod.ensure_indexes(database)
+    filt = {"user_id": "u", "facts.deposit_months": {"$gt": 3}}
+    sort = [("created_at", -1), ("_id", -1)]
+    assert dbmod.explain_query(database, "uploads", filt, sort)["index"] == "user_id_created_at_id_facts_deposit_months"
+    database.uploads.drop_index("user_id_created_at_id_facts_deposit_months")
+    database.uploads.create_index([("user_id", 1), ("facts.deposit_months", 1)], name="range_before_sort")
+    assert not dbmod.explain_query(database, "uploads", filt, sort)["uses_index"]
@@ -0,0 +1,102 @@
+"""
+services/singleflight.py: coalescing, shared errors, and followers taking
+over when the leader is cancelled.
+
+    python -m pytest -q tests
+"""
+import asyncio
+import threading
+
+import pytest
+
+from services.singleflight import SingleFlight
+
+
+@pytest.fixture(params=[False, True], ids=["in_worker", "cross_worker"])
+def flights(request, tmp_path):
+    return SingleFlight(lock_dir=tmp_path, cross_worker=request.param, wait_seconds=5)
+
+
+def test_concurrent_calls_share_one_run(flights):
+    runs = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def work(n):
+        runs.append(n)
+        started.set()
+        release.wait(5)
+        return {"n": n}
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flights.do(("job", "op"), work, 1)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flights.do(("job", "op"), work, 2)))
+                 for _ in range(3)]
+    for t in followers:
+        t.start()
+    release.set()
+    for t in [leader, *followers]:
+        t.join(5)
+    assert runs == [1]
+    assert results == [{"n": 1}] * 4
+
+
+def test_async_error_is_shared(flights):
+    runs = []
+
+    async def work():
+        runs.append(1)
+        await asyncio.sleep(0.05)
+        raise ValueError("bad input")
+
+    async def main():
+        return await asyncio.gather(*(flights.do_async(("job", "op"), work) for _ in range(3)),
+                                    return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert runs == [1]
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_follower_takes_over_from_cancelled_leader(flights):
+    runs = []
+
+    async def work(n):
+        runs.append(n)
+        await asyncio.sleep(0.1)
+        return n
+
+    async def main():
+        leader = asyncio.create_task(flights.do_async(("job", "op"), work, "leader"))
+        await asyncio.sleep(0.01)
+        followers = [asyncio.create_task(flights.do_async(("job", "op"), work, f"f{i}")) for i in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*followers)
+
+    results = asyncio.run(main())
+    # One follower re-ran the work; the others shared its result
+    assert len(runs) == 2 and runs[0] == "leader"
+    assert results == [runs[1]] * 3
+
+
+def test_cancelled_follower_leaves_leader_running(flights):
+    async def work():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        leader = asyncio.create_task(flights.do_async(("job", "op"), work))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(flights.do_async(("job", "op"), work))
+        await asyncio.sleep(0.01)
+        follower.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+        return await leader
+
+    assert asyncio.run(main()) == "done"
@@ -0,0 +1,63 @@
+"""
+services/warmup.py: readiness is gated by the required steps only; an
+optional step (MongoDB when MONGO_URI isn't configured) shows up as degraded.
+
+    python -m pytest -q tests
+"""
+import time
+
+from services.warmup import Warmup
+
+
+def _wait(warmup: Warmup, cond, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not cond(warmup.snapshot()) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_optional_step_failure_is_degraded_not_unready():
+    calls = {"mongo": 0}
+
+    def mongo():
+        calls["mongo"] += 1
+        return calls["mongo"] > 3
+
+    warmup = Warmup({"mongo": mongo, "tfidf": lambda: True}, retry_seconds=0.01, optional={"mongo"})
+    warmup.start()
+    try:
+        _wait(warmup, lambda s: s["ready"])
+        snapshot = warmup.snapshot()
+        assert snapshot["ready"] and warmup.ready()
+        assert snapshot["ready_after_seconds"] is not None
+        assert snapshot["steps"]["mongo"]["optional"]
+        # Retried in the background until it comes up
+        _wait(warmup, lambda s: not s["degraded"])
+        assert warmup.snapshot()["steps"]["mongo"]["status"] == "ok"
+    finally:
+        warmup.stop()
+
+
+def test_required_step_failure_is_unready():
+    def mongo():
+        raise ConnectionError("no server")
+
+    warmup = Warmup({"mongo": mongo, "tfidf": lambda: True}, retry_seconds=0.01, optional=set())
+    warmup.start()
+    try:
+        _wait(warmup, lambda s: s["steps"]["tfidf"]["status"] == "ok" and s["steps"]["mongo"]["status"] == "failed")
+        snapshot = warmup.snapshot()
+        assert not snapshot["ready"] and not warmup.ready()
+        assert snapshot["degraded"] == []
+        assert snapshot["steps"]["mongo"]["error"] == "no server"
+    finally:
+        warmup.stop()
+
+
+def test_required_steps_gate_readiness_even_with_optional_ok():
+    warmup = Warmup({"mongo": lambda: True, "tfidf": lambda: False}, retry_seconds=0.01, optional={"mongo"})
+    warmup.start()
+    try:
+        _wait(warmup, lambda s: s["steps"]["tfidf"]["status"] == "failed")
+        assert not warmup.ready()
+    finally:
+        warmup.stop()
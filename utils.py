@@ -1,6 +1,8 @@
 from pathlib import Path
 import re
 
+from services.storage import ensure_roots
+
 def safe_filename(filename: str) -> str:
     """Sanitizes a filename to contain only alphanumeric, dashes, and dots."""
     filename = re.sub(r'[^\w\s.-]', '', filename)
@@ -9,6 +11,5 @@ def safe_filename(filename: str) -> str:
 
 def ensure_dirs():
     """Ensures that necessary directories exist."""
-    Path("storage/uploads").mkdir(parents=True, exist_ok=True)
-    Path("embeddings").mkdir(parents=True, exist_ok=True)
+    ensure_roots()
     Path("logs").mkdir(parents=True, exist_ok=True)
\ No newline at end of file